@@ -0,0 +1,42 @@
+import argparse
+import sys
+
+from . import db
+from .migrations import current_version, head, pending
+
+# Schema management, separate from serving:
+#
+#   python -m app migrate   apply pending migrations
+#   python -m app status    print the schema version; exits 1 if migrations are pending
+
+def migrate_command(database: db.Database) -> int:
+    applied = database.migrate_sync()
+    for version, name, _ in applied:
+        print(f"Applied {version}: {name}")
+    print(f"Schema is at version {head()}")
+    return 0
+
+def status_command(database: db.Database) -> int:
+    with database.engine.connect() as connection:
+        version = current_version(connection)
+        missing = pending(connection)
+    print(f"Schema version {version} of {head()}")
+    for version, name, _ in missing:
+        print(f"Pending {version}: {name}")
+    return 1 if missing else 0
+
+COMMANDS = {"migrate": migrate_command, "status": status_command}
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m app")
+    parser.add_argument("command", choices=sorted(COMMANDS))
+    args = parser.parse_args(argv)
+
+    database = db.configure()
+    try:
+        return COMMANDS[args.command](database)
+    finally:
+        database.engine.dispose()
+
+if __name__ == "__main__":
+    sys.exit(main())
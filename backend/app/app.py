@@ -1,23 +1,71 @@
+from contextlib import asynccontextmanager
+from typing import Optional
 from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
-from strawberry.fastapi import GraphQLRouter
-from .schema import schema
+from .schema import build_schema, schema
+from .context import get_context
+from . import cache, config, db, exports, extensions, imports, metrics, quiz
+from .cache import response_cache
+from .config import Settings
+from .extensions import PersistedQueryRouter
+from .grading import score_writer
 
 origins = ["https://bloomlms.netlify.app"]
 
-app = FastAPI(title="Bloom API")
+def create_app(settings: Optional[Settings] = None) -> FastAPI:
+    # Building the app doesn't touch the database; the lifespan connects on
+    # startup, so importing this module is cheap and side-effect free.
+    # The response, persisted query and document caches and the metrics
+    # registry are process-wide: the most recently created app sizes them.
+    settings = settings or config.settings
+    cache.configure(settings)
+    extensions.configure(settings)
+    metrics.configure(settings)
 
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=origins,
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        database = db.configure(settings)
+        if settings.db_auto_migrate or database.in_memory:
+            await database.migrate()
+        else:
+            await database.check_schema()
+        yield
+        # Commit any scores still waiting for their batch
+        await score_writer.drain()
+        await database.dispose()
 
-graphql_app = GraphQLRouter(schema)
-app.include_router(graphql_app, prefix="/graphql")
+    app = FastAPI(title="Bloom API", lifespan=lifespan)
+    app.state.settings = settings
 
-@app.get("/")
-def root():
-    return {"message": "Bloom backend is running!"}
\ No newline at end of file
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=origins,
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+
+    app_schema = schema if settings is config.settings else build_schema(settings)
+    graphql_app = PersistedQueryRouter(app_schema, context_getter=get_context)
+    app.include_router(graphql_app, prefix="/graphql")
+    app.include_router(imports.router)
+    app.include_router(exports.router)
+    app.include_router(quiz.router)
+
+    @app.get("/")
+    def root():
+        return {"message": "Bloom backend is running!"}
+
+    @app.get("/cache/stats")
+    def cache_stats():
+        return response_cache.stats()
+
+    if settings.metrics_enabled:
+        @app.get("/metrics")
+        def metrics_endpoint():
+            return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+    return app
+
+app = create_app()
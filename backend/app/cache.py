@@ -0,0 +1,142 @@
+import time
+from collections import OrderedDict, defaultdict
+from typing import Any, Dict, Hashable, Iterable, Optional, Protocol, Tuple
+
+from .config import Settings, settings
+
+# Shared, bounded cache for everything kept across requests: loader rows,
+# quiz snapshots, answer keys and gradebooks, each under its own namespace.
+# Entries are keyed by (namespace, entity id) and dropped by the mutations
+# that touch that entity; the TTL bounds staleness from writes made by other
+# worker processes. Every invalidation bumps the namespace's version, and a
+# load reads the version before it queries and stores with it, so a load
+# that raced with a mutation doesn't store what it read before the write.
+
+MISSING = object()
+
+class CacheBackend(Protocol):
+    def get(self, key: Hashable) -> Any: ...
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None: ...
+    def delete(self, key: Hashable) -> None: ...
+    def delete_where(self, namespace: str) -> None: ...
+    def clear(self) -> None: ...
+    def __len__(self) -> int: ...
+
+class MemoryBackend:
+    def __init__(self, max_entries: int = 10000, ttl: float = 300.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        # key -> (expiry, value)
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+
+    def get(self, key: Hashable) -> Any:
+        entry = self._entries.get(key)
+        if entry is None:
+            return MISSING
+        if time.monotonic() >= entry[0]:
+            del self._entries[key]
+            return MISSING
+        self._entries.move_to_end(key)
+        return entry[1]
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        self._entries[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def delete(self, key: Hashable) -> None:
+        self._entries.pop(key, None)
+
+    def delete_where(self, namespace: str) -> None:
+        for key in [key for key in self._entries if key[0] == namespace]:
+            del self._entries[key]
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+class ResponseCache:
+    def __init__(self, backend: Optional[CacheBackend] = None, enabled: bool = True):
+        self.backend = backend if backend is not None else MemoryBackend()
+        self.enabled = enabled
+        self.hits: Dict[str, int] = defaultdict(int)
+        self.misses: Dict[str, int] = defaultdict(int)
+        self._versions: Dict[str, int] = defaultdict(int)
+
+    def version(self, namespace: str) -> int:
+        return self._versions[namespace]
+
+    def get(self, namespace: str, key: Hashable) -> Any:
+        # MISSING if the key isn't cached
+        if not self.enabled:
+            return MISSING
+        value = self.backend.get((namespace, key))
+        if value is MISSING:
+            self.misses[namespace] += 1
+        else:
+            self.hits[namespace] += 1
+        return value
+
+    def peek(self, namespace: str, key: Hashable) -> Any:
+        # Like get, without counting a hit or miss
+        if not self.enabled:
+            return MISSING
+        return self.backend.get((namespace, key))
+
+    def get_many(self, namespace: str, keys: Iterable[Hashable]) -> Dict[Hashable, Any]:
+        found = {}
+        for key in keys:
+            value = self.get(namespace, key)
+            if value is not MISSING:
+                found[key] = value
+        return found
+
+    def set(self, namespace: str, key: Hashable, value: Any, version: int, ttl: Optional[float] = None) -> None:
+        self.set_many(namespace, {key: value}, version, ttl)
+
+    def set_many(
+        self, namespace: str, values: Dict[Hashable, Any], version: int, ttl: Optional[float] = None
+    ) -> None:
+        # ttl overrides the backend's default for these entries
+        if not self.enabled or version != self._versions[namespace]:
+            return
+        for key, value in values.items():
+            self.backend.set((namespace, key), value, ttl)
+
+    def invalidate(self, namespace: str, *keys: Hashable) -> None:
+        self._versions[namespace] += 1
+        for key in keys:
+            self.backend.delete((namespace, key))
+
+    def invalidate_namespace(self, namespace: str) -> None:
+        self._versions[namespace] += 1
+        self.backend.delete_where(namespace)
+
+    def clear(self) -> None:
+        for namespace in list(self._versions):
+            self._versions[namespace] += 1
+        self.backend.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        namespaces = sorted(set(self.hits) | set(self.misses))
+        return {
+            "entries": len(self.backend),
+            "namespaces": {
+                namespace: {"hits": self.hits[namespace], "misses": self.misses[namespace]}
+                for namespace in namespaces
+            },
+        }
+
+def _backend(settings: Settings) -> MemoryBackend:
+    return MemoryBackend(settings.response_cache_size, settings.response_cache_ttl)
+
+response_cache = ResponseCache(_backend(settings), enabled=settings.response_cache_enabled)
+
+def configure(settings: Settings) -> None:
+    # Replaces the backend, so anything cached under other settings is dropped
+    response_cache.clear()
+    response_cache.backend = _backend(settings)
+    response_cache.enabled = settings.response_cache_enabled
@@ -0,0 +1,129 @@
+import os
+from dataclasses import dataclass
+from dotenv import load_dotenv
+
+# Values come from the process environment, falling back to backend/.env
+load_dotenv()
+
+def _env_str(name: str, default: str) -> str:
+    return os.getenv(name, default)
+
+def _env_int(name: str, default: int) -> int:
+    value = os.getenv(name)
+    return int(value) if value not in (None, "") else default
+
+def _env_float(name: str, default: float) -> float:
+    value = os.getenv(name)
+    return float(value) if value not in (None, "") else default
+
+def _env_bool(name: str, default: bool) -> bool:
+    value = os.getenv(name)
+    if value in (None, ""):
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+@dataclass(frozen=True)
+class Settings:
+    # Use "sqlite://" (or "sqlite:///:memory:") for a throwaway in-memory database
+    database_url: str = "sqlite:////var/data/bloom.db"
+    db_echo: bool = False
+    # Run resolvers on an AsyncSession (aiosqlite/asyncpg) instead of a blocking Session
+    db_async: bool = False
+    # Apply pending migrations on startup. Off by default: run
+    # `python -m app migrate` once per deploy, so several workers never
+    # migrate at the same time. In-memory databases are always migrated.
+    db_auto_migrate: bool = False
+
+    # Query resolvers read from a separate pool: DATABASE_READ_URL (a
+    # replica), or a query_only pool on the same SQLite file when it's empty.
+    # After a mutation the client reads from the primary for
+    # db_sticky_seconds, so it sees its own writes despite replica lag.
+    database_read_url: str = ""
+    db_read_routing: bool = True
+    db_sticky_seconds: float = 5.0
+
+    # Connection pool
+    db_pool_size: int = 5
+    db_max_overflow: int = 10
+    db_pool_timeout: float = 30.0
+    db_pool_recycle: int = 3600
+
+    # SQLite pragmas applied to every new connection
+    sqlite_journal_mode: str = "WAL"
+    sqlite_synchronous: str = "NORMAL"
+    sqlite_busy_timeout_ms: int = 5000
+    sqlite_cache_size_kib: int = 20000
+    sqlite_mmap_size: int = 256 * 1024 * 1024
+    # Enforces the ON DELETE CASCADE foreign keys that class and lesson deletes rely on
+    sqlite_foreign_keys: bool = True
+
+    # In-process cache for loader rows, quiz snapshots, answer keys and gradebooks
+    response_cache_enabled: bool = True
+    response_cache_size: int = 10000
+    response_cache_ttl: float = 300.0
+
+    # GraphQL documents: persisted query hashes, parsed/validated documents
+    # and the Cache-Control max-age for GET queries (0 sends no header)
+    persisted_query_cache_size: int = 1000
+    document_cache_size: int = 1000
+    graphql_get_max_age: int = 0
+    # Cache-Control max-age for GET /lessons/{id}/quiz
+    quiz_max_age: int = 60
+
+    # Query cost limits; unpaginated lists are assumed to hold default_list_size items
+    graphql_max_depth: int = 10
+    graphql_max_cost: int = 5000
+    graphql_default_list_size: int = 20
+    # Operations allowed in one batched request (0 turns batching off)
+    graphql_max_batch: int = 10
+
+    # Instrumentation: /metrics and per-field timing; debug adds each
+    # operation's timings to its response extensions. Statements slower than
+    # slow_query_ms (0 turns it off) are logged, a sample_rate share of them.
+    # Operation names are client input, so only persisted queries get their
+    # own series, up to metrics_max_operations names; the rest are "other".
+    metrics_enabled: bool = True
+    metrics_max_operations: int = 200
+    debug: bool = False
+    slow_query_ms: float = 0.0
+    slow_query_sample_rate: float = 1.0
+
+    @classmethod
+    def from_env(cls) -> "Settings":
+        return cls(
+            database_url=_env_str("DATABASE_URL", cls.database_url),
+            db_echo=_env_bool("DB_ECHO", cls.db_echo),
+            db_async=_env_bool("DB_ASYNC", cls.db_async),
+            db_auto_migrate=_env_bool("DB_AUTO_MIGRATE", cls.db_auto_migrate),
+            database_read_url=_env_str("DATABASE_READ_URL", cls.database_read_url),
+            db_read_routing=_env_bool("DB_READ_ROUTING", cls.db_read_routing),
+            db_sticky_seconds=_env_float("DB_STICKY_SECONDS", cls.db_sticky_seconds),
+            db_pool_size=_env_int("DB_POOL_SIZE", cls.db_pool_size),
+            db_max_overflow=_env_int("DB_MAX_OVERFLOW", cls.db_max_overflow),
+            db_pool_timeout=_env_float("DB_POOL_TIMEOUT", cls.db_pool_timeout),
+            db_pool_recycle=_env_int("DB_POOL_RECYCLE", cls.db_pool_recycle),
+            sqlite_journal_mode=_env_str("SQLITE_JOURNAL_MODE", cls.sqlite_journal_mode),
+            sqlite_synchronous=_env_str("SQLITE_SYNCHRONOUS", cls.sqlite_synchronous),
+            sqlite_busy_timeout_ms=_env_int("SQLITE_BUSY_TIMEOUT_MS", cls.sqlite_busy_timeout_ms),
+            sqlite_cache_size_kib=_env_int("SQLITE_CACHE_SIZE_KIB", cls.sqlite_cache_size_kib),
+            sqlite_mmap_size=_env_int("SQLITE_MMAP_SIZE", cls.sqlite_mmap_size),
+            sqlite_foreign_keys=_env_bool("SQLITE_FOREIGN_KEYS", cls.sqlite_foreign_keys),
+            response_cache_enabled=_env_bool("RESPONSE_CACHE_ENABLED", cls.response_cache_enabled),
+            response_cache_size=_env_int("RESPONSE_CACHE_SIZE", cls.response_cache_size),
+            response_cache_ttl=_env_float("RESPONSE_CACHE_TTL", cls.response_cache_ttl),
+            persisted_query_cache_size=_env_int("PERSISTED_QUERY_CACHE_SIZE", cls.persisted_query_cache_size),
+            document_cache_size=_env_int("DOCUMENT_CACHE_SIZE", cls.document_cache_size),
+            graphql_get_max_age=_env_int("GRAPHQL_GET_MAX_AGE", cls.graphql_get_max_age),
+            quiz_max_age=_env_int("QUIZ_MAX_AGE", cls.quiz_max_age),
+            graphql_max_depth=_env_int("GRAPHQL_MAX_DEPTH", cls.graphql_max_depth),
+            graphql_max_cost=_env_int("GRAPHQL_MAX_COST", cls.graphql_max_cost),
+            graphql_default_list_size=_env_int("GRAPHQL_DEFAULT_LIST_SIZE", cls.graphql_default_list_size),
+            graphql_max_batch=_env_int("GRAPHQL_MAX_BATCH", cls.graphql_max_batch),
+            metrics_enabled=_env_bool("METRICS_ENABLED", cls.metrics_enabled),
+            metrics_max_operations=_env_int("METRICS_MAX_OPERATIONS", cls.metrics_max_operations),
+            debug=_env_bool("DEBUG", cls.debug),
+            slow_query_ms=_env_float("SLOW_QUERY_MS", cls.slow_query_ms),
+            slow_query_sample_rate=_env_float("SLOW_QUERY_SAMPLE_RATE", cls.slow_query_sample_rate),
+        )
+
+settings = Settings.from_env()
@@ -0,0 +1,65 @@
+import asyncio
+import time
+from typing import List, Optional, Tuple
+
+from starlette.requests import HTTPConnection
+from strawberry.fastapi import BaseContext
+
+from .db import RoutingSession, open_routing_session
+from .loaders import Loaders
+
+# Set on mutation responses; until it expires the client's reads go to the
+# primary, so they include its own writes
+STICKY_COOKIE = "bloom_primary_until"
+
+# The signed-in user's id as the frontend reports it. Like the userId
+# arguments it isn't verified; it decides which fields a viewer is shown.
+VIEWER_HEADER = "x-bloom-user"
+
+# Orders the operations of a batched request (see extensions.PersistedQueryRouter)
+class OperationSequencer:
+    def __init__(self):
+        self._last_mutation: Optional[asyncio.Future] = None
+        self._since_mutation: List[asyncio.Future] = []
+
+    def enter(self, is_mutation: bool) -> Tuple[List[asyncio.Future], asyncio.Future]:
+        # Returns what to wait for and the future to resolve when done
+        done = asyncio.get_running_loop().create_future()
+        waits = [self._last_mutation] if self._last_mutation is not None else []
+        if is_mutation:
+            waits = self._since_mutation or waits
+            self._last_mutation = done
+            self._since_mutation = []
+        else:
+            self._since_mutation.append(done)
+        return waits, done
+
+class Context(BaseContext):
+    def __init__(self, db: RoutingSession, viewer_id: Optional[int] = None):
+        super().__init__()
+        self.db = db
+        self.viewer_id = viewer_id
+        self.loaders = Loaders(db)
+        self.sequencer = OperationSequencer()
+
+    def reset_loaders(self) -> None:
+        self.loaders = Loaders(self.db)
+
+def _sticky(connection: HTTPConnection) -> bool:
+    try:
+        return float(connection.cookies.get(STICKY_COOKIE, 0)) > time.time()
+    except ValueError:
+        return False
+
+def _viewer(connection: HTTPConnection) -> Optional[int]:
+    try:
+        return int(connection.headers[VIEWER_HEADER])
+    except (KeyError, ValueError):
+        return None
+
+# One session and one set of loaders per request, closed once the response is sent
+async def get_context(connection: HTTPConnection):
+    async with open_routing_session() as db:
+        if _sticky(connection):
+            db.use_primary()
+        yield Context(db, _viewer(connection))
@@ -0,0 +1,656 @@
+import re
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import and_, case, column, func, insert, literal_column, or_, table, tuple_, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import selectinload
+from sqlmodel import Session, select, delete
+from .models import *
+
+# Plain session functions behind the GraphQL resolvers. They only use the
+# synchronous Session API so they can run directly or through
+# AsyncSession.run_sync (see db.RequestSession).
+
+# (lesson_id, user_id, score)
+ScoreRow = Tuple[str, int, float]
+
+# Class codes and lesson ids are random; attempts before giving up on a fresh one
+CODE_ATTEMPTS = 10
+MAX_ENROLLMENT_BATCH = 1000
+
+# Start Queries
+def get_user_by_google_sub(session: Session, google_sub: str) -> Optional[User]:
+    return session.exec(select(User).where(User.google_sub == google_sub)).first()
+
+# Keyset pages: rows after the cursor key, one extra row to detect a next page
+def page_users(
+    session: Session,
+    limit: int,
+    after: Optional[int] = None,
+    role: Optional[str] = None,
+    name_prefix: Optional[str] = None,
+) -> List[User]:
+    statement = select(User)
+    if after is not None:
+        statement = statement.where(User.id > after)
+    if role is not None:
+        statement = statement.where(User.role == role)
+    if name_prefix:
+        statement = statement.where(User.name.startswith(name_prefix, autoescape=True))
+    return session.exec(statement.order_by(User.id).limit(limit)).all()
+
+def page_classes(
+    session: Session,
+    limit: int,
+    after: Optional[int] = None,
+    teacher_id: Optional[int] = None,
+    name_prefix: Optional[str] = None,
+) -> List[Class]:
+    statement = select(Class)
+    if after is not None:
+        statement = statement.where(Class.id > after)
+    if teacher_id is not None:
+        statement = statement.where(Class.teacher_id == teacher_id)
+    if name_prefix:
+        statement = statement.where(Class.name.startswith(name_prefix, autoescape=True))
+    return session.exec(statement.order_by(Class.id).limit(limit)).all()
+
+def get_class_by_code(session: Session, code: str) -> Optional[Class]:
+    return session.exec(select(Class).where(Class.code == code)).first()
+
+def is_enrolled(session: Session, class_id: int, student_id: int) -> bool:
+    # A primary key lookup rather than loading the roster
+    return session.exec(
+        select(EnrollmentLink.student_id).where(
+            EnrollmentLink.class_id == class_id,
+            EnrollmentLink.student_id == student_id,
+        )
+    ).first() is not None
+
+def score_bucket(score):
+    # Ten buckets of ten points; a CASE rather than FLOOR/LEAST so it runs on SQLite and Postgres
+    return case(
+        *[(score < upper, bucket) for bucket, upper in enumerate(range(10, 100, 10))],
+        else_=9,
+    )
+
+def gradebook_lessons(session: Session, class_id: int):
+    # (lesson_id, bucket, count, total); lessons without scores come back with a zero count
+    return session.exec(
+        select(
+            Lesson.id,
+            score_bucket(LessonScore.score),
+            func.count(LessonScore.id),
+            func.coalesce(func.sum(LessonScore.score), 0.0),
+        )
+        .select_from(Lesson)
+        .outerjoin(LessonScore, LessonScore.lesson_id == Lesson.id)
+        .where(Lesson.class_id == class_id)
+        .group_by(Lesson.id, score_bucket(LessonScore.score))
+    ).all()
+
+def gradebook_students(session: Session, class_id: int):
+    # (user_id, count, total) for every enrolled student
+    class_lessons = select(Lesson.id).where(Lesson.class_id == class_id)
+    return session.exec(
+        select(
+            EnrollmentLink.student_id,
+            func.count(LessonScore.id),
+            func.coalesce(func.sum(LessonScore.score), 0.0),
+        )
+        .select_from(EnrollmentLink)
+        .outerjoin(
+            LessonScore,
+            (LessonScore.user_id == EnrollmentLink.student_id)
+            & LessonScore.lesson_id.in_(class_lessons),
+        )
+        .where(EnrollmentLink.class_id == class_id)
+        .group_by(EnrollmentLink.student_id)
+    ).all()
+
+def lesson_classes(session: Session, lesson_ids: List[str]) -> Dict[str, int]:
+    return dict(session.exec(
+        select(Lesson.id, Lesson.class_id).where(Lesson.id.in_(lesson_ids))
+    ).all())
+
+def get_answer_key(session: Session, lesson_id: str) -> Dict[int, str]:
+    rows = session.exec(
+        select(AnswerChoice.question_id, AnswerChoice.text)
+        .join(LessonQuestion, LessonQuestion.question_id == AnswerChoice.question_id)
+        .where(LessonQuestion.lesson_id == lesson_id, AnswerChoice.is_correct)
+    ).all()
+    return dict(rows)
+
+def question_lessons(session: Session, question_ids: List[int]) -> List[str]:
+    return list(session.exec(
+        select(LessonQuestion.lesson_id).where(LessonQuestion.question_id.in_(question_ids)).distinct()
+    ).all())
+
+# Question bank search. On SQLite it runs on the FTS5 index (see
+# models.QUESTION_SEARCH_DDL) ranked by bm25, elsewhere as LIKE filters
+# ordered by id. Every word has to match, as a prefix so results follow
+# typing; quoting each word keeps FTS5 syntax in the input from applying.
+# The teacher is part of the MATCH, so the index only returns their
+# questions, and its column has no weight in the rank. Pages are keyset
+# pages on (rank, id).
+SEARCH_WORD = re.compile(r"\w+")
+question_search = table("questionsearch", column("rowid"))
+
+def search_questions(
+    session: Session,
+    teacher_id: int,
+    text: str,
+    limit: int,
+    after: Optional[Tuple[float, int]] = None,
+) -> List[Tuple[float, Question]]:
+    words = SEARCH_WORD.findall(text)
+    if not words:
+        return []
+
+    if session.get_bind().dialect.name == "sqlite":
+        index = literal_column("questionsearch")
+        ranked = (
+            select(question_search.c.rowid.label("id"), func.bm25(index, 1.0, 1.0, 0.0).label("rank"))
+            .where(index.op("MATCH")(
+                f'teacher : "{teacher_id}" AND {{title answers}} : ('
+                + " ".join(f'"{word}"*' for word in words) + ")"
+            ))
+            .subquery()
+        )
+        rank = ranked.c.rank
+        statement = select(rank, Question).join(ranked, ranked.c.id == Question.id)
+    else:
+        rank = literal_column("0.0")
+        statement = select(rank, Question)
+        for word in words:
+            pattern = f"%{word}%"
+            statement = statement.where(or_(
+                Question.title.ilike(pattern),
+                Question.id.in_(select(AnswerChoice.question_id).where(AnswerChoice.text.ilike(pattern))),
+            ))
+
+    statement = statement.where(Question.teacher_id == teacher_id)
+    if after is not None:
+        after_rank, after_id = after
+        statement = statement.where(or_(rank > after_rank, and_(rank == after_rank, Question.id > after_id)))
+    return [tuple(row) for row in session.exec(statement.order_by(rank, Question.id).limit(limit)).all()]
+
+def get_lesson_with_questions(session: Session, lesson_id: str) -> Optional[Lesson]:
+    return session.exec(
+        select(Lesson)
+        .where(Lesson.id == lesson_id)
+        .options(selectinload(Lesson.questions))
+    ).first()
+
+# Start Mutations
+def create_or_update_user(
+    session: Session,
+    google_sub: str,
+    name: str,
+    email: str,
+    role: str,
+    picture: Optional[str] = None,
+) -> User:
+    user = session.exec(select(User).where(User.google_sub == google_sub)).first()
+
+    if user:
+        user.name = name
+        user.email = email
+        user.picture = picture
+    else:
+        user = User(
+            google_sub=google_sub,
+            name=name,
+            email=email,
+            picture=picture,
+            role=role,
+        )
+        session.add(user)
+
+    session.commit()
+    session.refresh(user)
+    return user
+
+def _commit_with_fresh_code(session: Session, instance, attribute: str) -> None:
+    # Taken codes are skipped with an index lookup; one taken by a concurrent
+    # insert since the lookup fails the commit on the unique constraint and
+    # is retried with another code
+    column = getattr(type(instance), attribute)
+    for _ in range(CODE_ATTEMPTS):
+        code = generate_class_code()
+        if session.exec(select(column).where(column == code)).first() is not None:
+            continue
+        setattr(instance, attribute, code)
+        session.add(instance)
+        try:
+            session.commit()
+            return
+        except IntegrityError:
+            session.rollback()
+            if session.exec(select(column).where(column == code)).first() is None:
+                raise
+    raise ValueError("Could not allocate a unique code, try again.")
+
+def create_class(session: Session, name: str, teacher_id: int) -> Class:
+    teacher = session.get(User, teacher_id)
+    if not teacher:
+        raise ValueError("Teacher not found.")
+    if teacher.role != "teacher":
+        raise ValueError("Only teachers can create classes.")
+
+    new_class = Class(name=name, teacher_id=teacher.id)
+    _commit_with_fresh_code(session, new_class, "code")
+    session.refresh(new_class)
+    return new_class
+
+def _insert_enrollments(session: Session, class_id: int, student_ids: List[int]) -> int:
+    # INSERT ... ON CONFLICT DO NOTHING: enrollments made concurrently are
+    # skipped. Returns how many rows were inserted.
+    dialect = sqlite if session.get_bind().dialect.name == "sqlite" else postgresql
+    return session.exec(
+        dialect.insert(EnrollmentLink)
+        .values([{"class_id": class_id, "student_id": student_id} for student_id in student_ids])
+        .on_conflict_do_nothing()
+    ).rowcount
+
+def join_class(session: Session, user_id: int, class_code: str) -> Tuple[Class, bool]:
+    # Returns the class and whether the student was newly enrolled
+    user = session.get(User, user_id)
+    if not user:
+        raise ValueError("User not found.")
+    if user.role != "student":
+        raise ValueError("Only students can join classes.")
+
+    cls = session.exec(select(Class).where(Class.code == class_code)).first()
+    if not cls:
+        raise ValueError("Class not found.")
+
+    # Add student to class if not already joined
+    joined = False
+    if not is_enrolled(session, cls.id, user.id):
+        joined = _insert_enrollments(session, cls.id, [user.id]) > 0
+        session.commit()
+
+    return cls, joined
+
+@dataclass
+class EnrollmentResult:
+    enrolled: List[User] = field(default_factory=list)
+    already_enrolled: List[User] = field(default_factory=list)
+    # Requested ids and emails that don't belong to a student
+    not_found: List[str] = field(default_factory=list)
+
+def enroll_students(
+    session: Session, class_id: int, user_ids: List[int], emails: List[str]
+) -> EnrollmentResult:
+    # One query resolves the students, one finds those already enrolled and
+    # one multi-row INSERT enrolls the rest, whatever the number of students
+    if len(user_ids) + len(emails) > MAX_ENROLLMENT_BATCH:
+        raise ValueError(f"At most {MAX_ENROLLMENT_BATCH} students can be enrolled at once.")
+    if not session.get(Class, class_id):
+        raise ValueError("Class not found.")
+
+    user_ids = list(dict.fromkeys(user_ids))
+    emails = list(dict.fromkeys(email.strip() for email in emails if email.strip()))
+    conditions = []
+    if user_ids:
+        conditions.append(User.id.in_(user_ids))
+    if emails:
+        conditions.append(User.email.in_(emails))
+    result = EnrollmentResult()
+    if not conditions:
+        return result
+
+    students = session.exec(
+        select(User).where(User.role == "student", or_(*conditions)).order_by(User.id)
+    ).all()
+    found_ids = {student.id for student in students}
+    found_emails = {student.email for student in students}
+    result.not_found = [str(user_id) for user_id in user_ids if user_id not in found_ids]
+    result.not_found += [email for email in emails if email not in found_emails]
+
+    enrolled_ids = set(session.exec(
+        select(EnrollmentLink.student_id).where(
+            EnrollmentLink.class_id == class_id,
+            EnrollmentLink.student_id.in_(found_ids),
+        )
+    ).all()) if found_ids else set()
+    for student in students:
+        if student.id in enrolled_ids:
+            result.already_enrolled.append(student)
+        else:
+            result.enrolled.append(student)
+
+    if result.enrolled:
+        _insert_enrollments(session, class_id, [student.id for student in result.enrolled])
+        session.commit()
+    return result
+
+def create_lesson(session: Session, class_id: int, title: str) -> Lesson:
+    class_obj = session.get(Class, class_id)
+    if not class_obj:
+        raise ValueError("Class not found.")
+
+    new_lesson = Lesson(title=title, class_id=class_obj.id)
+    _commit_with_fresh_code(session, new_lesson, "id")
+    session.refresh(new_lesson)
+    return new_lesson
+
+def delete_lesson(session: Session, class_id: int, lesson_id: str) -> Optional[List[ScoreRow]]:
+    # Returns the scores removed with the lesson, or None if nothing was deleted.
+    # Scores are deleted with RETURNING for the gradebook; questions go with
+    # the lesson through ON DELETE CASCADE, so nothing is loaded into the session.
+    removed = session.exec(
+        delete(LessonScore)
+        .where(LessonScore.lesson_id.in_(
+            select(Lesson.id).where(Lesson.id == lesson_id, Lesson.class_id == class_id)
+        ))
+        .returning(LessonScore.lesson_id, LessonScore.user_id, LessonScore.score)
+    ).all()
+    result = session.exec(delete(Lesson).where(Lesson.id == lesson_id, Lesson.class_id == class_id))
+    if result.rowcount == 0:
+        session.rollback()
+        return None
+    session.commit()
+    return [tuple(row) for row in removed]
+
+def leave_class(session: Session, class_id: int, student_id: int) -> Optional[List[ScoreRow]]:
+    # Returns the student's removed scores, or None if they weren't enrolled
+    result = session.exec(
+        delete(EnrollmentLink).where(
+            EnrollmentLink.class_id == class_id,
+            EnrollmentLink.student_id == student_id,
+        )
+    )
+    if result.rowcount == 0:
+        session.rollback()
+        if not session.get(Class, class_id):
+            raise ValueError("Class not found")
+        if not session.get(User, student_id):
+            raise ValueError("Student not found")
+        return None
+
+    removed = session.exec(
+        delete(LessonScore)
+        .where(
+            LessonScore.user_id == student_id,
+            LessonScore.lesson_id.in_(select(Lesson.id).where(Lesson.class_id == class_id)),
+        )
+        .returning(LessonScore.lesson_id, LessonScore.user_id, LessonScore.score)
+    ).all()
+    session.commit()
+    return [tuple(row) for row in removed]
+
+def delete_class(session: Session, class_id: int) -> bool:
+    # Lessons, questions, scores and enrollments go with it through ON DELETE CASCADE
+    result = session.exec(delete(Class).where(Class.id == class_id))
+    if result.rowcount == 0:
+        raise ValueError("Class not found")
+    session.commit()
+    return True
+
+def _lesson_teacher(session: Session, lesson_id: str) -> int:
+    teacher_id = session.exec(
+        select(Class.teacher_id).join(Lesson, Lesson.class_id == Class.id).where(Lesson.id == lesson_id)
+    ).first()
+    if teacher_id is None:
+        raise ValueError(f"Lesson with ID {lesson_id} not found")
+    return teacher_id
+
+def _choices(question_id: Optional[int], correct_answer: str, wrong_answers: List[str]) -> List[dict]:
+    # The correct answer comes first; a wrong answer given twice is stored once
+    wrong_answers = [answer for answer in dict.fromkeys(wrong_answers) if answer != correct_answer]
+    return [
+        {"question_id": question_id, "position": position, "text": text, "is_correct": position == 0}
+        for position, text in enumerate([correct_answer, *wrong_answers])
+    ]
+
+def _link_questions(session: Session, lesson_id: str, question_ids: List[int]) -> None:
+    # Appended after the lesson's questions; questions already in it are skipped
+    start = session.exec(
+        select(func.coalesce(func.max(LessonQuestion.position) + 1, 0))
+        .where(LessonQuestion.lesson_id == lesson_id)
+    ).one()
+    dialect = sqlite if session.get_bind().dialect.name == "sqlite" else postgresql
+    session.exec(
+        dialect.insert(LessonQuestion)
+        .values([
+            {"lesson_id": lesson_id, "question_id": question_id, "position": start + offset}
+            for offset, question_id in enumerate(question_ids)
+        ])
+        .on_conflict_do_nothing()
+    )
+
+def add_question_to_lesson(
+    session: Session,
+    lesson_id: str,
+    title: str,
+    correct_answer: str,
+    wrong_answers: List[str],
+) -> Question:
+    question = Question(
+        title=title,
+        teacher_id=_lesson_teacher(session, lesson_id),
+        choices=[AnswerChoice(**choice) for choice in _choices(None, correct_answer, wrong_answers)],
+    )
+    session.add(question)
+    session.flush()
+    _link_questions(session, lesson_id, [question.id])
+    session.commit()
+    return question
+
+def add_questions_to_lesson(session: Session, lesson_id: str, question_ids: List[int]) -> List[Question]:
+    # Reuses questions from the bank of the lesson's teacher
+    teacher_id = _lesson_teacher(session, lesson_id)
+    question_ids = list(dict.fromkeys(question_ids))
+    questions = {
+        question.id: question
+        for question in session.exec(
+            select(Question).where(Question.id.in_(question_ids), Question.teacher_id == teacher_id)
+        ).all()
+    }
+    missing = [str(question_id) for question_id in question_ids if question_id not in questions]
+    if missing:
+        raise ValueError(f"Questions not in the teacher's bank: {', '.join(missing)}")
+    if question_ids:
+        _link_questions(session, lesson_id, question_ids)
+        session.commit()
+    return [questions[question_id] for question_id in question_ids]
+
+def remove_question_from_lesson(session: Session, lesson_id: str, question_id: int) -> bool:
+    # The question stays in the bank
+    result = session.exec(
+        delete(LessonQuestion).where(
+            LessonQuestion.lesson_id == lesson_id,
+            LessonQuestion.question_id == question_id,
+        )
+    )
+    session.commit()
+    return result.rowcount > 0
+
+def upsert_scores(
+    session: Session, scores: List[ScoreRow]
+) -> Tuple[List[Tuple[str, int, Optional[float], float]], List[Tuple[str, int]]]:
+    # One INSERT ... ON CONFLICT for the whole batch, keyed on the unique
+    # (lesson_id, user_id) index. Returns (lesson_id, user_id, old, new) so
+    # callers can apply the change incrementally.
+    # A lesson or user deleted since the submission was accepted would fail
+    # the foreign key check for the whole batch, so those scores are left out
+    # and their (lesson_id, user_id) keys returned second
+    lesson_ids = set(session.exec(
+        select(Lesson.id).where(Lesson.id.in_({lesson_id for lesson_id, _, _ in scores}))
+    ).all())
+    user_ids = set(session.exec(
+        select(User.id).where(User.id.in_({user_id for _, user_id, _ in scores}))
+    ).all())
+    dropped = [(lesson_id, user_id) for lesson_id, user_id, _ in scores
+               if lesson_id not in lesson_ids or user_id not in user_ids]
+    scores = [row for row in scores if row[0] in lesson_ids and row[1] in user_ids]
+    if not scores:
+        return [], dropped
+
+    keys = [(lesson_id, user_id) for lesson_id, user_id, _ in scores]
+    previous = {
+        (lesson_id, user_id): score
+        for lesson_id, user_id, score in session.exec(
+            select(LessonScore.lesson_id, LessonScore.user_id, LessonScore.score)
+            .where(tuple_(LessonScore.lesson_id, LessonScore.user_id).in_(keys))
+        ).all()
+    }
+
+    dialect = sqlite if session.get_bind().dialect.name == "sqlite" else postgresql
+    now = utcnow()
+    statement = dialect.insert(LessonScore).values([
+        {"lesson_id": lesson_id, "user_id": user_id, "score": score, "updated_at": now}
+        for lesson_id, user_id, score in scores
+    ])
+    statement = statement.on_conflict_do_update(
+        index_elements=["lesson_id", "user_id"],
+        set_={"score": statement.excluded.score, "updated_at": statement.excluded.updated_at},
+    )
+    session.exec(statement)
+    session.commit()
+    changes = [
+        (lesson_id, user_id, previous.get((lesson_id, user_id)), score)
+        for lesson_id, user_id, score in scores
+    ]
+    return changes, dropped
+
+def delete_question(session: Session, question_id: int) -> Optional[List[str]]:
+    # Deletes the question from the bank and every lesson; returns those
+    # lessons' ids, or None if there was no such question
+    lesson_ids = question_lessons(session, [question_id])
+    result = session.exec(delete(Question).where(Question.id == question_id))
+    if result.rowcount == 0:
+        session.rollback()
+        return None
+    session.commit()
+    return lesson_ids
+
+def update_question(
+    session: Session,
+    question_id: int,
+    title: str,
+    correct_answer: str,
+    wrong_answers: List[str],
+) -> Optional[Tuple[Question, List[str]]]:
+    # Returns the question and the lessons using it
+    question = session.get(Question, question_id)
+    if not question:
+        return None
+
+    question.title = title
+    question.choices = [AnswerChoice(**choice) for choice in _choices(question_id, correct_answer, wrong_answers)]
+    session.add(question)
+    session.commit()
+    return question, question_lessons(session, [question_id])
+
+@dataclass
+class QuestionRowResult:
+    index: int
+    id: Optional[int] = None
+    error: Optional[str] = None
+
+@dataclass
+class QuestionUpsertResult:
+    inserted: int = 0
+    updated: int = 0
+    rows: List[QuestionRowResult] = field(default_factory=list)
+    # Lessons whose questions changed: this one and any sharing an updated question
+    lesson_ids: List[str] = field(default_factory=list)
+
+def validate_question_row(row: dict) -> Optional[str]:
+    if row.get("parse_error"):
+        return row["parse_error"]
+    question_id = row.get("id")
+    if question_id is not None and not isinstance(question_id, int):
+        return "id must be an integer"
+    title = row.get("title")
+    if not isinstance(title, str) or not title.strip():
+        return "title is required"
+    correct_answer = row.get("correct_answer")
+    if not isinstance(correct_answer, str) or not correct_answer.strip():
+        return "correct_answer is required"
+    wrong_answers = row.get("wrong_answers")
+    if not isinstance(wrong_answers, list) or not wrong_answers:
+        return "wrong_answers must be a non-empty list"
+    if not all(isinstance(answer, str) and answer.strip() for answer in wrong_answers):
+        return "wrong_answers must not contain empty answers"
+    if correct_answer.strip() in (answer.strip() for answer in wrong_answers):
+        return "correct_answer must not also be a wrong answer"
+    return None
+
+def upsert_questions(session: Session, lesson_id: str, rows: List[dict]) -> QuestionUpsertResult:
+    # Rows with an id update that question, rows without one add a new one to
+    # the teacher's bank and the lesson. Invalid rows are reported and
+    # skipped; the rest are written in one transaction with one executemany
+    # per statement.
+    teacher_id = _lesson_teacher(session, lesson_id)
+
+    requested = Counter(row["id"] for row in rows if isinstance(row.get("id"), int))
+    requested_ids = set(requested)
+    owned_ids = set()
+    if requested_ids:
+        owned_ids = set(session.exec(
+            select(LessonQuestion.question_id)
+            .where(LessonQuestion.question_id.in_(requested_ids))
+            .where(LessonQuestion.lesson_id == lesson_id)
+        ).all())
+
+    result = QuestionUpsertResult()
+    inserts, updates = [], []
+    for index, row in enumerate(rows):
+        outcome = QuestionRowResult(index=index, id=row.get("id"))
+        result.rows.append(outcome)
+
+        outcome.error = validate_question_row(row)
+        if outcome.error is None and outcome.id is not None and outcome.id not in owned_ids:
+            outcome.error = f"Question {outcome.id} not found in lesson {lesson_id}"
+        # Neither of two rows for one question can be applied without losing the other
+        if outcome.error is None and outcome.id is not None and requested[outcome.id] > 1:
+            outcome.error = f"Question {outcome.id} appears more than once"
+        if outcome.error is not None:
+            continue
+
+        values = {
+            "title": row["title"].strip(),
+            "correct_answer": row["correct_answer"].strip(),
+            "wrong_answers": [answer.strip() for answer in row["wrong_answers"]],
+        }
+        (inserts if outcome.id is None else updates).append((outcome, values))
+
+    if inserts:
+        # Batched into multi-row INSERT ... RETURNING statements. Ids are assigned
+        # in VALUES order, so sorting them lines them up with the input rows
+        # (sort_by_parameter_order would fall back to one INSERT per row on SQLite).
+        new_ids = sorted(session.scalars(
+            insert(Question).returning(Question.id),
+            [{"title": values["title"], "teacher_id": teacher_id} for _, values in inserts],
+        ).all())
+        for (outcome, _), new_id in zip(inserts, new_ids):
+            outcome.id = new_id
+        _link_questions(session, lesson_id, new_ids)
+
+    result.lesson_ids = [lesson_id]
+    if updates:
+        updated_ids = [outcome.id for outcome, _ in updates]
+        session.execute(
+            update(Question), [{"id": outcome.id, "title": values["title"]} for outcome, values in updates]
+        )
+        session.exec(delete(AnswerChoice).where(AnswerChoice.question_id.in_(updated_ids)))
+        result.lesson_ids = list(dict.fromkeys([lesson_id, *question_lessons(session, updated_ids)]))
+
+    choices = [
+        choice
+        for outcome, values in inserts + updates
+        for choice in _choices(outcome.id, values["correct_answer"], values["wrong_answers"])
+    ]
+    if choices:
+        session.execute(insert(AnswerChoice), choices)
+    session.commit()
+
+    result.inserted = len(inserts)
+    result.updated = len(updates)
+    return result
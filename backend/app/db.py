@@ -1,8 +1,310 @@
-from sqlmodel import SQLModel, create_engine
+import asyncio
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, List, Optional, Union
+from sqlalchemy import event
+from sqlalchemy.engine import Connection, Engine, URL, make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+from sqlalchemy.pool import QueuePool, StaticPool
+from sqlalchemy.sql import Select
+from starlette.concurrency import run_in_threadpool
+from sqlmodel import Session, create_engine
+from sqlmodel.ext.asyncio.session import AsyncSession
+from .config import Settings, settings
+from .metrics import instrument_engine
+from .migrations import Migration, migrate, pending
 
-DATABASE_URL = "sqlite:////var/data/bloom.db"
+# Async drivers used when DB_ASYNC is on
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "sqlite+pysqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+    "postgresql+psycopg2": "postgresql+asyncpg",
+}
 
-engine = create_engine(DATABASE_URL, echo=True)
+def is_memory_sqlite(url: URL) -> bool:
+    return url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:")
 
-def init_db():
-    SQLModel.metadata.create_all(engine)
\ No newline at end of file
+def _sqlite_pragmas(settings: Settings, in_memory: bool, read_only: bool = False):
+    pragmas = [
+        f"PRAGMA synchronous={settings.sqlite_synchronous}",
+        f"PRAGMA busy_timeout={settings.sqlite_busy_timeout_ms}",
+        # Negative cache_size is in KiB rather than pages
+        f"PRAGMA cache_size=-{settings.sqlite_cache_size_kib}",
+        f"PRAGMA foreign_keys={'ON' if settings.sqlite_foreign_keys else 'OFF'}",
+    ]
+    # WAL and mmap only make sense for a database file
+    if not in_memory:
+        pragmas.insert(0, f"PRAGMA journal_mode={settings.sqlite_journal_mode}")
+        pragmas.append(f"PRAGMA mmap_size={settings.sqlite_mmap_size}")
+    if read_only:
+        pragmas.append("PRAGMA query_only=ON")
+
+    def on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for pragma in pragmas:
+            cursor.execute(pragma)
+        cursor.close()
+
+    return on_connect
+
+def _engine_options(settings: Settings, url: URL, is_async: bool, read_only: bool = False) -> dict:
+    options = {"echo": settings.db_echo}
+
+    if read_only and url.get_backend_name() == "postgresql":
+        # A replica refuses writes anyway; this also covers a read pool on the primary
+        if is_async:
+            options["connect_args"] = {"server_settings": {"default_transaction_read_only": "on"}}
+        else:
+            options["connect_args"] = {"options": "-c default_transaction_read_only=on"}
+
+    if url.get_backend_name() == "sqlite":
+        # Connections are handed between the event loop and worker threads
+        options["connect_args"] = {"check_same_thread": False}
+        if is_memory_sqlite(url):
+            # Every pooled connection would otherwise get its own empty database
+            options["poolclass"] = StaticPool
+        elif not is_async:
+            options["poolclass"] = QueuePool
+
+    if options.get("poolclass") is not StaticPool:
+        options.update(
+            pool_size=settings.db_pool_size,
+            max_overflow=settings.db_max_overflow,
+            pool_timeout=settings.db_pool_timeout,
+            pool_recycle=settings.db_pool_recycle,
+        )
+    return options
+
+def create_db_engine(settings: Settings, url: Optional[str] = None, read_only: bool = False) -> Engine:
+    url = make_url(url or settings.database_url)
+    engine = create_engine(url, **_engine_options(settings, url, is_async=False, read_only=read_only))
+    if url.get_backend_name() == "sqlite":
+        event.listen(engine, "connect", _sqlite_pragmas(settings, is_memory_sqlite(url), read_only))
+    if settings.metrics_enabled:
+        instrument_engine(engine)
+    return engine
+
+def create_async_db_engine(settings: Settings, url: Optional[str] = None, read_only: bool = False) -> AsyncEngine:
+    url = make_url(url or settings.database_url)
+    url = url.set(drivername=ASYNC_DRIVERS.get(url.drivername, url.drivername))
+    engine = create_async_engine(url, **_engine_options(settings, url, is_async=True, read_only=read_only))
+    if url.get_backend_name() == "sqlite":
+        event.listen(engine.sync_engine, "connect", _sqlite_pragmas(settings, is_memory_sqlite(url), read_only))
+    if settings.metrics_enabled:
+        instrument_engine(engine.sync_engine)
+    return engine
+
+def read_url(settings: Settings) -> Optional[str]:
+    # Where Query resolvers read from: the configured replica, else a
+    # query_only pool on the same SQLite file (WAL readers don't block the
+    # writer). None sends reads to the primary.
+    if not settings.db_read_routing:
+        return None
+    if settings.database_read_url:
+        return settings.database_read_url
+    url = make_url(settings.database_url)
+    if url.get_backend_name() == "sqlite" and not is_memory_sqlite(url):
+        return settings.database_url
+    return None
+
+def _migrate_atomically(connection: Connection) -> List[Migration]:
+    # The SQLite driver only opens a transaction before DML, so DDL would
+    # commit as it runs and a failed migration would leave its first steps
+    # behind under the old version stamp
+    if connection.dialect.name == "sqlite":
+        connection.exec_driver_sql("BEGIN")
+    return migrate(connection)
+
+class SchemaOutOfDate(RuntimeError):
+    pass
+
+class Database:
+    # Engines are created here, but nothing connects until the first query
+    def __init__(self, settings: Settings):
+        self.settings = settings
+        self.url = make_url(settings.database_url)
+        self.engine = create_db_engine(settings)
+        self.async_engine: Optional[AsyncEngine] = (
+            create_async_db_engine(settings) if settings.db_async else None
+        )
+
+        self.read_engine: Optional[Engine] = None
+        self.async_read_engine: Optional[AsyncEngine] = None
+        replica = read_url(settings)
+        if replica is not None:
+            if settings.db_async:
+                self.async_read_engine = create_async_db_engine(settings, replica, read_only=True)
+            else:
+                self.read_engine = create_db_engine(settings, replica, read_only=True)
+
+    @property
+    def in_memory(self) -> bool:
+        return is_memory_sqlite(self.url)
+
+    @property
+    def replica_lags(self) -> bool:
+        # A read pool on the primary's own file sees every commit at once
+        return bool(self.settings.database_read_url) and (
+            self.read_engine is not None or self.async_read_engine is not None
+        )
+
+    async def migrate(self) -> List[Migration]:
+        # An in-memory database is private to its engine, so whichever engine
+        # serves requests gets the tables
+        if self.async_engine is not None:
+            async with self.async_engine.begin() as connection:
+                return await connection.run_sync(_migrate_atomically)
+        return await run_in_threadpool(self.migrate_sync)
+
+    def migrate_sync(self) -> List[Migration]:
+        with self.engine.begin() as connection:
+            return _migrate_atomically(connection)
+
+    async def check_schema(self) -> None:
+        if self.async_engine is not None:
+            async with self.async_engine.connect() as connection:
+                missing = await connection.run_sync(pending)
+        else:
+            with self.engine.connect() as connection:
+                missing = pending(connection)
+        if missing:
+            raise SchemaOutOfDate(
+                f"Database schema is missing migrations {[version for version, _, _ in missing]}; "
+                "run `python -m app migrate`"
+            )
+
+    async def dispose(self) -> None:
+        for engine in (self.async_engine, self.async_read_engine):
+            if engine is not None:
+                await engine.dispose()
+        for engine in (self.engine, self.read_engine):
+            if engine is not None:
+                engine.dispose()
+
+_database: Optional[Database] = None
+
+def configure(settings: Settings = settings) -> Database:
+    global _database
+    _database = Database(settings)
+    return _database
+
+def get_database() -> Database:
+    # Configured from the environment the first time it's needed, unless
+    # create_app (or a script) configured it first
+    if _database is None:
+        return configure()
+    return _database
+
+def init_db() -> List[Migration]:
+    return get_database().migrate_sync()
+
+class RequestSession:
+    def __init__(self, session: Union[Session, AsyncSession]):
+        self.session = session
+        # AsyncSession can't be shared by concurrent tasks, and DataLoaders
+        # dispatch their batches as separate tasks
+        self._lock = asyncio.Lock()
+
+    async def run(self, fn, *args, **kwargs):
+        # fn takes a synchronous Session; on the async path it runs through
+        # run_sync so I/O awaits the driver instead of blocking the event loop.
+        # Each call is its own unit of work: ending the transaction afterwards
+        # hands the connection back to the pool, so a request never holds one
+        # while it awaits other resolvers.
+        async with self._lock:
+            if isinstance(self.session, AsyncSession):
+                try:
+                    result = await self.session.run_sync(fn, *args, **kwargs)
+                except BaseException:
+                    await self.session.rollback()
+                    raise
+                await self.session.commit()
+                return result
+
+            try:
+                result = fn(self.session, *args, **kwargs)
+            except BaseException:
+                self.session.rollback()
+                raise
+            self.session.commit()
+            return result
+
+class RoutingSession:
+    # A request's sessions: work goes to the read pool until the request
+    # writes, or is made sticky, and to the primary from then on
+    def __init__(
+        self,
+        primary: RequestSession,
+        replica: Optional[RequestSession] = None,
+        replica_lags: bool = False,
+    ):
+        self.primary = primary
+        self.replica = replica
+        self.use_replica = replica is not None
+        self.replica_lags = replica_lags
+
+    def use_primary(self) -> None:
+        self.use_replica = False
+
+    @property
+    def current(self) -> RequestSession:
+        return self.replica if self.use_replica else self.primary
+
+    async def run(self, fn, *args, **kwargs):
+        return await self.current.run(fn, *args, **kwargs)
+
+    async def run_shared(self, fn, *args, **kwargs):
+        # For results kept in caches shared between requests. Rows from a
+        # lagging replica could predate a write another client was already
+        # told about, and the cache would serve them to everyone until its
+        # TTL, so those reads go to the primary.
+        session = self.primary if self.replica_lags else self.current
+        return await session.run(fn, *args, **kwargs)
+
+@asynccontextmanager
+async def open_session(read: bool = False):
+    # Objects stay readable after commit; on the async path an expired
+    # attribute can't be lazily refreshed outside run(). With read=True the
+    # session uses the read pool when there is one.
+    database = get_database()
+    if database.async_engine is not None:
+        engine = (read and database.async_read_engine) or database.async_engine
+        async with AsyncSession(engine, expire_on_commit=False) as session:
+            yield RequestSession(session)
+    else:
+        engine = (read and database.read_engine) or database.engine
+        with Session(engine, expire_on_commit=False) as session:
+            yield RequestSession(session)
+
+@asynccontextmanager
+async def open_routing_session():
+    # Sessions don't connect until first used, so an unused replica costs nothing
+    database = get_database()
+    async with open_session() as primary:
+        if database.read_engine is None and database.async_read_engine is None:
+            yield RoutingSession(primary)
+            return
+        async with open_session(read=True) as replica:
+            yield RoutingSession(primary, replica, database.replica_lags)
+
+async def stream_rows(statement: Select, batch_size: int) -> AsyncIterator[List]:
+    # Reads a large result through a server-side cursor (where the driver has
+    # one) in batches of batch_size rows, so memory stays flat however many
+    # rows match. The session, on the read pool, is held for the whole stream.
+    statement = statement.execution_options(stream_results=True, yield_per=batch_size)
+    database = get_database()
+    if database.async_engine is not None:
+        async with AsyncSession(database.async_read_engine or database.async_engine) as session:
+            result = await session.stream(statement)
+            async for partition in result.partitions():
+                yield partition
+        return
+
+    with Session(database.read_engine or database.engine) as session:
+        result = await run_in_threadpool(session.execute, statement)
+        partitions = result.partitions()
+        while True:
+            partition = await run_in_threadpool(next, partitions, None)
+            if partition is None:
+                break
+            yield partition
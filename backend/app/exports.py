@@ -0,0 +1,160 @@
+import csv
+import io
+import json
+from datetime import datetime, timezone
+from typing import AsyncIterator, List, Optional
+
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+from sqlmodel import Session, select
+
+from .db import open_session, stream_rows
+from .models import Class, EnrollmentLink, Lesson, LessonScore, User
+
+# Roster and score exports for reporting. Rows are streamed from the database
+# in batches and written out as they arrive, so an export of millions of
+# scores never sits in memory.
+#
+# Score exports are ordered by id and can be resumed: since_id returns the
+# scores inserted after that row, and since returns the scores inserted or
+# changed after that time (an updated score keeps its id but gets a new
+# updated_at).
+
+EXPORT_BATCH_SIZE = 1000
+
+FORMATS = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+}
+
+ROSTER_COLUMNS = ["class_id", "class_name", "student_id", "student_name", "student_email"]
+SCORE_COLUMNS = [
+    "id", "class_id", "class_name", "lesson_id", "lesson_title",
+    "student_id", "student_name", "student_email", "score", "updated_at",
+]
+
+router = APIRouter()
+
+def _format(request: Request, format: Optional[str]) -> str:
+    if format is None:
+        accept = request.headers.get("accept", "")
+        format = "ndjson" if "application/x-ndjson" in accept else "csv"
+    if format not in FORMATS:
+        raise HTTPException(status_code=400, detail="Use format=csv or format=ndjson")
+    return format
+
+def _value(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+async def _encode(statement, columns: List[str], format: str) -> AsyncIterator[str]:
+    if format == "csv":
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(columns)
+        yield buffer.getvalue()
+
+    async for rows in stream_rows(statement, EXPORT_BATCH_SIZE):
+        if format == "csv":
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            writer.writerows([[_value(value) for value in row] for row in rows])
+            yield buffer.getvalue()
+        else:
+            yield "".join(
+                json.dumps(dict(zip(columns, map(_value, row)))) + "\n"
+                for row in rows
+            )
+
+def _response(statement, columns: List[str], format: str, filename: str) -> StreamingResponse:
+    return StreamingResponse(
+        _encode(statement, columns, format),
+        media_type=FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}.{format}"'},
+    )
+
+def _roster_statement(*where):
+    return (
+        select(Class.id, Class.name, User.id, User.name, User.email)
+        .select_from(EnrollmentLink)
+        .join(Class, Class.id == EnrollmentLink.class_id)
+        .join(User, User.id == EnrollmentLink.student_id)
+        .where(*where)
+        .order_by(EnrollmentLink.class_id, EnrollmentLink.student_id)
+    )
+
+def _scores_statement(since: Optional[datetime], since_id: Optional[int], *where):
+    statement = (
+        select(
+            LessonScore.id, Class.id, Class.name, Lesson.id, Lesson.title,
+            User.id, User.name, User.email, LessonScore.score, LessonScore.updated_at,
+        )
+        .select_from(LessonScore)
+        .join(Lesson, Lesson.id == LessonScore.lesson_id)
+        .join(Class, Class.id == Lesson.class_id)
+        .join(User, User.id == LessonScore.user_id)
+        .where(*where)
+        .order_by(LessonScore.id)
+    )
+    if since is not None:
+        # Stored timestamps are naive UTC
+        if since.tzinfo is not None:
+            since = since.astimezone(timezone.utc).replace(tzinfo=None)
+        statement = statement.where(LessonScore.updated_at > since)
+    if since_id is not None:
+        statement = statement.where(LessonScore.id > since_id)
+    return statement
+
+async def _require(model, id: int, label: str) -> None:
+    async with open_session(read=True) as db:
+        if await db.run(Session.get, model, id) is None:
+            raise HTTPException(status_code=404, detail=f"{label} {id} not found")
+
+@router.get("/classes/{class_id}/export/roster")
+async def export_class_roster(request: Request, class_id: int, format: Optional[str] = None):
+    format = _format(request, format)
+    await _require(Class, class_id, "Class")
+    return _response(
+        _roster_statement(EnrollmentLink.class_id == class_id),
+        ROSTER_COLUMNS, format, f"class-{class_id}-roster",
+    )
+
+@router.get("/classes/{class_id}/export/scores")
+async def export_class_scores(
+    request: Request,
+    class_id: int,
+    format: Optional[str] = None,
+    since: Optional[datetime] = None,
+    since_id: Optional[int] = Query(None, ge=0),
+):
+    format = _format(request, format)
+    await _require(Class, class_id, "Class")
+    return _response(
+        _scores_statement(since, since_id, Lesson.class_id == class_id),
+        SCORE_COLUMNS, format, f"class-{class_id}-scores",
+    )
+
+@router.get("/teachers/{teacher_id}/export/roster")
+async def export_teacher_roster(request: Request, teacher_id: int, format: Optional[str] = None):
+    format = _format(request, format)
+    await _require(User, teacher_id, "Teacher")
+    return _response(
+        _roster_statement(Class.teacher_id == teacher_id),
+        ROSTER_COLUMNS, format, f"teacher-{teacher_id}-roster",
+    )
+
+@router.get("/teachers/{teacher_id}/export/scores")
+async def export_teacher_scores(
+    request: Request,
+    teacher_id: int,
+    format: Optional[str] = None,
+    since: Optional[datetime] = None,
+    since_id: Optional[int] = Query(None, ge=0),
+):
+    format = _format(request, format)
+    await _require(User, teacher_id, "Teacher")
+    return _response(
+        _scores_statement(since, since_id, Class.teacher_id == teacher_id),
+        SCORE_COLUMNS, format, f"teacher-{teacher_id}-scores",
+    )
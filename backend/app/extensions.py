@@ -0,0 +1,386 @@
+import asyncio
+import hashlib
+import time
+from functools import lru_cache
+from inspect import isawaitable
+from typing import Any, Callable, Dict, Iterator, Optional, Tuple
+
+from graphql import (
+    FieldNode,
+    FragmentSpreadNode,
+    GraphQLError,
+    GraphQLObjectType,
+    OperationDefinitionNode,
+    OperationType,
+    get_named_type,
+    get_nullable_type,
+    is_list_type,
+    parse,
+)
+from graphql.execution.values import get_argument_values
+from strawberry.extensions import SchemaExtension
+from strawberry.extensions.tracing.utils import should_skip_tracing
+from strawberry.fastapi import GraphQLRouter
+from strawberry.schema.schema import validate_document
+
+from . import metrics
+from .cache import MISSING, MemoryBackend
+from .config import Settings, settings
+from .context import STICKY_COOKIE, VIEWER_HEADER
+from .pagination import page_size
+
+# Schema extensions. They're registered as classes, so Strawberry creates
+# one instance per operation; anything shared between requests lives at
+# module level. Extensions read the settings of the class they're registered
+# as: with_settings binds them to an app's settings (see
+# schema.build_schema), and configure sizes the module-level caches.
+
+# Automatic persisted queries (the Apollo protocol): a client sends
+# extensions.persistedQuery.sha256Hash, with the query text only the first
+# time or after a PersistedQueryNotFound error. Hash-only requests can be
+# sent as GET, which HTTP caches can store.
+PERSISTED_QUERY_NOT_FOUND = "PersistedQueryNotFound"
+
+persisted_queries = MemoryBackend(settings.persisted_query_cache_size, ttl=float("inf"))
+
+def query_hash(query: str) -> str:
+    return hashlib.sha256(query.encode("utf-8")).hexdigest()
+
+def with_settings(extension: type, settings: Settings) -> type:
+    return type(extension.__name__, (extension,), {"settings": settings})
+
+class PersistedQueries(SchemaExtension):
+    settings: Settings = settings
+
+    def on_operation(self) -> Iterator[None]:
+        context = self.execution_context
+        persisted = (context.operation_extensions or {}).get("persistedQuery")
+        if isinstance(persisted, dict):
+            sha256_hash = persisted.get("sha256Hash")
+            if persisted.get("version", 1) != 1 or not isinstance(sha256_hash, str):
+                raise GraphQLError(
+                    "Unsupported persisted query",
+                    extensions={"code": "PERSISTED_QUERY_NOT_SUPPORTED"},
+                )
+
+            if context.query:
+                if query_hash(context.query) != sha256_hash:
+                    raise GraphQLError(
+                        "Provided sha256Hash does not match query",
+                        extensions={"code": "PERSISTED_QUERY_HASH_MISMATCH"},
+                    )
+                persisted_queries.set(sha256_hash, context.query)
+            else:
+                query = persisted_queries.get(sha256_hash)
+                if query is MISSING:
+                    raise GraphQLError(
+                        PERSISTED_QUERY_NOT_FOUND,
+                        extensions={"code": "PERSISTED_QUERY_NOT_FOUND"},
+                    )
+                context.query = query
+        yield
+
+        # Successful GET queries may be stored by HTTP caches for a short while
+        request = getattr(context.context, "request", None)
+        response = getattr(context.context, "response", None)
+        if (
+            self.settings.graphql_get_max_age > 0
+            and request is not None and request.method == "GET"
+            and response is not None and not context.pre_execution_errors
+        ):
+            response.headers["Cache-Control"] = f"public, max-age={self.settings.graphql_get_max_age}"
+            # Answer keys are only shown to their teacher
+            response.headers.add_vary_header(VIEWER_HEADER)
+
+# Parsed documents and validation results for repeated query text. Both are
+# pure functions of the query and the schema, so the known query set is
+# parsed and validated once per process.
+@lru_cache(maxsize=settings.document_cache_size)
+def _parse(query: str, options: tuple):
+    return parse(query, **dict(options))
+
+@lru_cache(maxsize=settings.document_cache_size)
+def _validate(schema, query: str, options: tuple, rules: tuple):
+    return tuple(validate_document(schema, _parse(query, options), rules))
+
+class DocumentCache(SchemaExtension):
+    def on_parse(self) -> Iterator[None]:
+        context = self.execution_context
+        try:
+            context.graphql_document = _parse(context.query, tuple(sorted(context.parse_options.items())))
+        except GraphQLError:
+            # Leave the document unset so Strawberry reports the syntax error
+            pass
+        yield
+
+    def on_validate(self) -> Iterator[None]:
+        context = self.execution_context
+        # Setting the errors, even to an empty list, tells Strawberry validation already ran
+        context.pre_execution_errors = list(_validate(
+            context.schema._schema,
+            context.query,
+            tuple(sorted(context.parse_options.items())),
+            tuple(context.validation_rules),
+        ))
+        yield
+
+def configure(settings: Settings) -> None:
+    # The caches above are shared by every app in the process
+    global _parse, _validate
+    persisted_queries.max_entries = settings.persisted_query_cache_size
+    _parse = lru_cache(maxsize=settings.document_cache_size)(_parse.__wrapped__)
+    _validate = lru_cache(maxsize=settings.document_cache_size)(_validate.__wrapped__)
+
+def _find_operation(document, operation_name: Optional[str]) -> Optional[OperationDefinitionNode]:
+    return next(
+        (
+            definition for definition in document.definitions
+            if isinstance(definition, OperationDefinitionNode)
+            and (operation_name is None or definition.name and definition.name.value == operation_name)
+        ),
+        None,
+    )
+
+def _operation(context) -> Optional[OperationDefinitionNode]:
+    return _find_operation(context.graphql_document, context.operation_name)
+
+# Batched requests (a JSON array of operations, up to graphql_max_batch)
+# share one context, so one database session and one set of loaders.
+# Strawberry starts every operation of a batch at once: queries run
+# concurrently, while a mutation waits for the operations before it and the
+# ones after it wait for the mutation, so the batch behaves as if its
+# operations were sent in order. Loaders are replaced after a mutation so
+# later operations don't see what was loaded before it.
+def _is_mutation(request_data) -> bool:
+    query = request_data.query
+    if query is None:
+        persisted = (request_data.extensions or {}).get("persistedQuery")
+        sha256_hash = persisted.get("sha256Hash") if isinstance(persisted, dict) else None
+        query = persisted_queries.get(sha256_hash) if isinstance(sha256_hash, str) else MISSING
+        if query is MISSING:
+            # Fails without running anything, so it needn't wait its turn
+            return False
+    try:
+        operation = _find_operation(_parse(query, ()), request_data.operation_name)
+    except GraphQLError:
+        return False
+    return operation is not None and operation.operation == OperationType.MUTATION
+
+class PersistedQueryRouter(GraphQLRouter):
+    # A hash-only GET has no query parameter, which would otherwise render GraphiQL
+    def should_render_graphql_ide(self, request) -> bool:
+        return "extensions" not in request.query_params and super().should_render_graphql_ide(request)
+
+    async def execute_single(self, request, request_adapter, sub_response, context, root_value, request_data):
+        # Runs synchronously up to the first await, so operations enter the
+        # sequencer in the order of the batch
+        is_mutation = _is_mutation(request_data)
+        waits, done = context.sequencer.enter(is_mutation)
+        try:
+            if waits:
+                await asyncio.wait(waits)
+            return await super().execute_single(
+                request, request_adapter, sub_response, context, root_value, request_data
+            )
+        finally:
+            if is_mutation:
+                context.reset_loaders()
+            done.set_result(None)
+
+# Static cost analysis. Every object or list field costs 1 (scalars are
+# free) unless listed in FIELD_COSTS, and a list multiplies the cost of its
+# selection by its expected length: `first` where the field is paginated,
+# otherwise graphql_default_list_size. Operations deeper or more
+# expensive than the configured budget are rejected before any resolver runs.
+FIELD_COSTS: Dict[str, int] = {
+    # Builds class aggregates with GROUP BY queries on a cache miss
+    "Query.gradebook": 10,
+}
+
+class QueryCost(SchemaExtension):
+    settings: Settings = settings
+
+    def __init__(self, *, execution_context=None):
+        self.cost: Optional[int] = None
+        self.depth: Optional[int] = None
+
+    def on_execute(self) -> Iterator[None]:
+        context = self.execution_context
+        operation = _operation(context)
+        fragments = {
+            definition.name.value: definition
+            for definition in context.graphql_document.definitions
+            if not isinstance(definition, OperationDefinitionNode)
+        }
+        schema = context.schema._schema
+        self.cost, self.depth = _selection_cost(
+            schema, schema.get_root_type(operation.operation), operation.selection_set,
+            fragments, context.variables or {}, self.settings.graphql_default_list_size,
+        )
+
+        if self.depth > self.settings.graphql_max_depth:
+            raise GraphQLError(
+                f"Query depth {self.depth} exceeds the maximum of {self.settings.graphql_max_depth}",
+                extensions={"code": "QUERY_TOO_DEEP"},
+            )
+        if self.cost > self.settings.graphql_max_cost:
+            raise GraphQLError(
+                f"Query cost {self.cost} exceeds the maximum of {self.settings.graphql_max_cost}",
+                extensions={"code": "QUERY_TOO_EXPENSIVE"},
+            )
+        yield
+
+    def get_results(self) -> Dict[str, object]:
+        if self.cost is None:
+            return {}
+        return {
+            "cost": {
+                "requested": self.cost,
+                "maximum": self.settings.graphql_max_cost,
+                "depth": self.depth,
+                "maximumDepth": self.settings.graphql_max_depth,
+            }
+        }
+
+def _selection_cost(schema, parent_type, selection_set, fragments, variables, list_size: int) -> Tuple[int, int]:
+    cost = depth = 0
+    for selection in selection_set.selections:
+        if isinstance(selection, FieldNode):
+            field_cost, field_depth = _field_cost(
+                schema, parent_type, selection, fragments, variables, list_size
+            )
+        else:
+            fragment = (
+                fragments[selection.name.value]
+                if isinstance(selection, FragmentSpreadNode) else selection
+            )
+            fragment_type = parent_type
+            if fragment.type_condition is not None:
+                fragment_type = schema.get_type(fragment.type_condition.name.value)
+            field_cost, field_depth = _selection_cost(
+                schema, fragment_type, fragment.selection_set, fragments, variables, list_size
+            )
+        cost += field_cost
+        depth = max(depth, field_depth)
+    return cost, depth
+
+def _field_cost(
+    schema, parent_type: GraphQLObjectType, node: FieldNode, fragments, variables, list_size: int
+) -> Tuple[int, int]:
+    name = node.name.value
+    if name.startswith("__") or node.selection_set is None:
+        # Introspection and scalar fields
+        return 0, 0
+
+    field = parent_type.fields[name]
+    field_type = get_nullable_type(field.type)
+    arguments = get_argument_values(field, node, variables)
+
+    multiplier = 1
+    if "first" in field.args:
+        multiplier = page_size(arguments.get("first"))
+    elif is_list_type(field_type) and not parent_type.name.endswith("Connection"):
+        # A connection's edges and nodes are already counted by its `first`
+        multiplier = list_size
+
+    child_cost, child_depth = _selection_cost(
+        schema, get_named_type(field_type), node.selection_set, fragments, variables, list_size
+    )
+    own_cost = FIELD_COSTS.get(f"{parent_type.name}.{name}", 1)
+    return (own_cost + child_cost) * multiplier, child_depth + 1
+
+# Per-operation timings, SQL statement counts and rows loaded (see
+# metrics.py). Fields with their own resolver are timed; plain attributes
+# aren't worth the overhead. In debug mode the numbers are returned in the
+# response's extensions.metrics.
+_untimed_fields: Dict[Tuple[str, str], bool] = {}
+
+class Instrumentation(SchemaExtension):
+    settings: Settings = settings
+
+    def __init__(self, *, execution_context=None):
+        self.metrics: Optional[metrics.RequestMetrics] = None
+        self.operation_type = "unknown"
+
+    def on_operation(self) -> Iterator[None]:
+        context = self.execution_context
+        self.metrics = metrics.RequestMetrics(context.operation_name or "anonymous")
+        token = metrics.current.set(self.metrics)
+        try:
+            yield
+        finally:
+            metrics.current.reset(token)
+            result = context.result
+            failed = bool(context.pre_execution_errors) or bool(result is not None and result.errors)
+            metrics.record_operation(self.metrics, self.operation_type, failed)
+
+    def on_execute(self) -> Iterator[None]:
+        # The operation is only known once the document is parsed
+        persisted = (self.execution_context.operation_extensions or {}).get("persistedQuery")
+        self.metrics.persisted = (
+            isinstance(persisted, dict)
+            and persisted_queries.get(persisted.get("sha256Hash")) is not MISSING
+        )
+        operation = _operation(self.execution_context)
+        if operation is not None:
+            self.operation_type = operation.operation.value
+            if operation.name is not None:
+                self.metrics.operation = operation.name.value
+        yield
+
+    def resolve(self, _next: Callable, root: Any, info, *args, **kwargs) -> Any:
+        key = (info.parent_type.name, info.field_name)
+        skip = _untimed_fields.get(key)
+        if skip is None:
+            skip = _untimed_fields[key] = should_skip_tracing(_next, info)
+        if skip or self.metrics is None:
+            return _next(root, info, *args, **kwargs)
+
+        name = "%s.%s" % key
+        started = time.perf_counter()
+        result = _next(root, info, *args, **kwargs)
+        if isawaitable(result):
+            return self._timed(result, name, started)
+        self.metrics.add_field(name, time.perf_counter() - started)
+        return result
+
+    async def _timed(self, result, name: str, started: float) -> Any:
+        try:
+            return await result
+        finally:
+            self.metrics.add_field(name, time.perf_counter() - started)
+
+    def get_results(self) -> Dict[str, object]:
+        if not self.settings.debug or self.metrics is None:
+            return {}
+        return {"metrics": self.metrics.summary()}
+
+# Read/write routing (see db.RoutingSession). A mutation runs entirely on the
+# primary, and the sticky cookie keeps the client's reads there for a while.
+class ReadRouting(SchemaExtension):
+    settings: Settings = settings
+
+    def on_execute(self) -> Iterator[None]:
+        context = self.execution_context
+        operation = _operation(context)
+        is_mutation = operation is not None and operation.operation == OperationType.MUTATION
+        db = context.context.db
+        if is_mutation:
+            db.use_primary()
+        yield
+
+        request = getattr(context.context, "request", None)
+        response = getattr(context.context, "response", None)
+        if is_mutation and db.replica is not None and response is not None:
+            secure = request is not None and (
+                request.url.scheme == "https" or request.headers.get("x-forwarded-proto") == "https"
+            )
+            response.set_cookie(
+                STICKY_COOKIE,
+                str(time.time() + self.settings.db_sticky_seconds),
+                max_age=max(1, round(self.settings.db_sticky_seconds)),
+                httponly=True,
+                secure=secure,
+                # The frontend is on another site, which needs SameSite=None
+                samesite="none" if secure else "lax",
+            )
@@ -0,0 +1,159 @@
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+from . import crud
+from .cache import MISSING, ResponseCache, response_cache
+from .db import RoutingSession
+from .grading import score_writer
+
+# Per-class gradebook aggregates. A class is computed with two GROUP BY
+# queries on first use, then kept current from score deltas: the score
+# writer reports (old, new) pairs and leave_class / delete_lesson report the
+# scores they removed. Anything else that reshapes a class invalidates it.
+
+BUCKETS = 10
+
+@dataclass
+class Stats:
+    count: int = 0
+    total: float = 0.0
+
+    @property
+    def average(self) -> Optional[float]:
+        return self.total / self.count if self.count else None
+
+    def add(self, score: float) -> None:
+        self.count += 1
+        self.total += score
+
+    def remove(self, score: float) -> None:
+        self.count -= 1
+        self.total -= score
+
+@dataclass
+class LessonStats(Stats):
+    buckets: List[int] = field(default_factory=lambda: [0] * BUCKETS)
+
+    def add(self, score: float) -> None:
+        super().add(score)
+        self.buckets[bucket_for(score)] += 1
+
+    def remove(self, score: float) -> None:
+        super().remove(score)
+        self.buckets[bucket_for(score)] -= 1
+
+@dataclass
+class Gradebook:
+    class_id: int
+    lessons: Dict[str, LessonStats]
+    students: Dict[int, Stats]
+
+    @property
+    def distribution(self) -> List[int]:
+        return [sum(lesson.buckets[bucket] for lesson in self.lessons.values()) for bucket in range(BUCKETS)]
+
+def bucket_for(score: float) -> int:
+    # Same bucketing as crud.score_bucket
+    return min(max(int(score // 10), 0), BUCKETS - 1)
+
+def _build(session, class_id: int) -> Gradebook:
+    lessons: Dict[str, LessonStats] = {}
+    for lesson_id, bucket, count, total in crud.gradebook_lessons(session, class_id):
+        stats = lessons.setdefault(lesson_id, LessonStats())
+        if count:
+            stats.count += count
+            stats.total += total
+            stats.buckets[bucket] += count
+
+    students = {
+        user_id: Stats(count=count, total=total)
+        for user_id, count, total in crud.gradebook_students(session, class_id)
+    }
+    return Gradebook(class_id=class_id, lessons=lessons, students=students)
+
+GRADEBOOK = "gradebook"
+
+class GradebookCache:
+    # Gradebooks live in the response cache and are updated in place there
+    def __init__(self, cache: ResponseCache = response_cache, ttl: float = 300.0):
+        self.cache = cache
+        self.ttl = ttl
+        # Which class a cached lesson belongs to, for routing score changes
+        self._lesson_classes: Dict[str, int] = {}
+
+    async def get(self, db: RoutingSession, class_id: int) -> Gradebook:
+        gradebook = self.cache.get(GRADEBOOK, class_id)
+        if gradebook is not MISSING:
+            return gradebook
+
+        version = self.cache.version(GRADEBOOK)
+        gradebook = await db.run_shared(_build, class_id)
+        self.cache.set(GRADEBOOK, class_id, gradebook, version, self.ttl)
+        for lesson_id in gradebook.lessons:
+            self._lesson_classes[lesson_id] = class_id
+        return gradebook
+
+    def invalidate(self, class_id: int) -> None:
+        self.cache.invalidate(GRADEBOOK, class_id)
+
+    def clear(self) -> None:
+        self.cache.invalidate_namespace(GRADEBOOK)
+        self._lesson_classes.clear()
+
+    def _cached(self, class_id: int) -> Optional[Gradebook]:
+        gradebook = self.cache.peek(GRADEBOOK, class_id)
+        return None if gradebook is MISSING else gradebook
+
+    def _cached_for_lesson(self, lesson_id: str) -> Optional[Gradebook]:
+        class_id = self._lesson_classes.get(lesson_id)
+        if class_id is None:
+            return None
+        gradebook = self._cached(class_id)
+        if gradebook is None:
+            # Evicted or invalidated; it's rebuilt with its lessons on next use
+            del self._lesson_classes[lesson_id]
+        return gradebook
+
+    # Incremental updates. Each bumps the namespace version, so a gradebook
+    # built from rows read before the change isn't stored.
+    def apply_score_changes(self, changes: List[Tuple[str, int, Optional[float], float]]) -> None:
+        self.cache.invalidate(GRADEBOOK)
+        for lesson_id, user_id, old, new in changes:
+            gradebook = self._cached_for_lesson(lesson_id)
+            if gradebook is None:
+                continue
+            lesson = gradebook.lessons[lesson_id]
+            if old is not None:
+                lesson.remove(old)
+            lesson.add(new)
+
+            # Only enrolled students have a row, as in gradebook_students
+            student = gradebook.students.get(user_id)
+            if student is not None:
+                if old is not None:
+                    student.remove(old)
+                student.add(new)
+
+    def remove_student(self, class_id: int, user_id: int, removed: List[crud.ScoreRow]) -> None:
+        self.cache.invalidate(GRADEBOOK)
+        gradebook = self._cached(class_id)
+        if gradebook is None:
+            return
+        for lesson_id, _, score in removed:
+            if lesson_id in gradebook.lessons:
+                gradebook.lessons[lesson_id].remove(score)
+        gradebook.students.pop(user_id, None)
+
+    def remove_lesson(self, class_id: int, lesson_id: str, removed: List[crud.ScoreRow]) -> None:
+        self.cache.invalidate(GRADEBOOK)
+        self._lesson_classes.pop(lesson_id, None)
+        gradebook = self._cached(class_id)
+        if gradebook is None:
+            return
+        for _, user_id, score in removed:
+            if user_id in gradebook.students:
+                gradebook.students[user_id].remove(score)
+        gradebook.lessons.pop(lesson_id, None)
+
+gradebooks = GradebookCache()
+score_writer.listeners.append(gradebooks.apply_score_changes)
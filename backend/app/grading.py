@@ -0,0 +1,118 @@
+import asyncio
+import inspect
+import logging
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from . import crud
+from .cache import MISSING, ResponseCache, response_cache
+from .db import RoutingSession, open_session
+
+logger = logging.getLogger(__name__)
+
+# Server-side grading. Answer keys are cached per lesson in the response
+# cache, and score writes from concurrent submissions are grouped into one
+# upsert transaction.
+
+ANSWER_KEYS = "answer_keys"
+
+class AnswerKeyCache:
+    def __init__(self, cache: ResponseCache = response_cache, ttl: float = 60.0):
+        self.cache = cache
+        self.ttl = ttl
+
+    async def get(self, db: RoutingSession, lesson_id: str) -> Dict[int, str]:
+        key = self.cache.get(ANSWER_KEYS, lesson_id)
+        if key is not MISSING:
+            return key
+        version = self.cache.version(ANSWER_KEYS)
+        key = await db.run_shared(crud.get_answer_key, lesson_id)
+        self.cache.set(ANSWER_KEYS, lesson_id, key, version, self.ttl)
+        return key
+
+    def invalidate(self, lesson_id: str) -> None:
+        self.cache.invalidate(ANSWER_KEYS, lesson_id)
+
+    def clear(self) -> None:
+        self.cache.invalidate_namespace(ANSWER_KEYS)
+
+def grade(answer_key: Dict[int, str], answers: Dict[int, str]) -> Tuple[int, float]:
+    # Unanswered questions count as wrong; answers to unknown questions are ignored
+    correct = sum(
+        1 for question_id, correct_answer in answer_key.items()
+        if answers.get(question_id, "").strip() == correct_answer.strip()
+    )
+    score = correct / len(answer_key) * 100 if answer_key else 0.0
+    return correct, score
+
+class ScoreWriter:
+    def __init__(self, max_batch: int = 300, max_delay: float = 0.01):
+        # max_batch keeps one multi-row INSERT under SQLite's bound-parameter limit
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self._pending: List[Tuple[Tuple[str, int], float, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._flushes = set()
+        # Called, or awaited if they're coroutines, with the committed
+        # (lesson_id, user_id, old, new) changes of each batch
+        self.listeners: List[Callable[[list], Any]] = []
+
+    async def submit(self, lesson_id: str, user_id: int, score: float) -> None:
+        # Resolves once the batch holding this score has committed
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append(((lesson_id, user_id), score, future))
+
+        if len(self._pending) >= self.max_batch:
+            self._start_flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_delay, self._start_flush)
+        await future
+
+    def _start_flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.ensure_future(self._flush(batch))
+            self._flushes.add(task)
+            task.add_done_callback(self._flushes.discard)
+
+    async def _flush(self, batch) -> None:
+        # The latest submission wins when a student resubmits within a batch
+        latest = {key: score for key, score, _ in batch}
+        rows = [(lesson_id, user_id, score) for (lesson_id, user_id), score in latest.items()]
+        try:
+            async with open_session() as db:
+                changes, dropped = await db.run(crud.upsert_scores, rows)
+        except Exception as error:
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_exception(error)
+            return
+
+        dropped = set(dropped)
+        for key, _, future in batch:
+            if key in dropped and not future.done():
+                future.set_exception(ValueError("Lesson or user not found; the score wasn't saved"))
+
+        for listener in self.listeners:
+            # The scores are committed either way, so a failing listener
+            # doesn't fail the submissions
+            try:
+                result = listener(changes)
+                if inspect.isawaitable(result):
+                    await result
+            except Exception:
+                logger.exception("Score listener failed")
+        for _, _, future in batch:
+            if not future.done():
+                future.set_result(None)
+
+    async def drain(self) -> None:
+        self._start_flush()
+        if self._flushes:
+            await asyncio.gather(*self._flushes, return_exceptions=True)
+
+answer_keys = AnswerKeyCache()
+score_writer = ScoreWriter()
@@ -0,0 +1,135 @@
+import codecs
+import csv
+import json
+from typing import AsyncIterator, List
+
+from fastapi import APIRouter, HTTPException, Request
+
+from . import crud
+from .db import open_session
+from .invalidation import questions_changed
+
+# Bulk question import. The body is parsed as it streams in, then written
+# with crud.upsert_questions in a single transaction.
+#
+# CSV columns: title, correct_answer, wrong_answers (separated by "|") and
+# an optional id to update an existing question.
+# NDJSON and JSON bodies use the same keys, with wrong_answers as a list.
+
+MAX_IMPORT_ROWS = 5000
+WRONG_ANSWER_SEPARATOR = "|"
+
+router = APIRouter()
+
+async def _lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    pending = ""
+    async for chunk in chunks:
+        pending += decoder.decode(chunk)
+        *complete, pending = pending.split("\n")
+        for line in complete:
+            yield line + "\n"
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        yield pending
+
+async def _csv_records(chunks: AsyncIterator[bytes]) -> AsyncIterator[List[str]]:
+    # A quoted field may contain newlines, so a record is only complete once
+    # its quotes are balanced
+    record = ""
+    async for line in _lines(chunks):
+        record += line
+        if record.count('"') % 2 == 0:
+            if record.strip():
+                yield next(csv.reader([record]))
+            record = ""
+    if record.strip():
+        yield next(csv.reader([record]))
+
+def _csv_row(header: List[str], values: List[str]) -> dict:
+    raw = dict(zip(header, values))
+    row = {
+        "title": raw.get("title"),
+        "correct_answer": raw.get("correct_answer"),
+        "wrong_answers": [
+            answer for answer in (raw.get("wrong_answers") or "").split(WRONG_ANSWER_SEPARATOR)
+            if answer.strip()
+        ],
+        "id": None,
+    }
+    question_id = (raw.get("id") or "").strip()
+    if question_id:
+        row["id"] = int(question_id) if question_id.isdigit() else question_id
+    return row
+
+# Rows that can't be parsed are reported by validation instead of failing the import
+def _invalid_row(message: str) -> dict:
+    return {"parse_error": message}
+
+def _json_row(value) -> dict:
+    if not isinstance(value, dict):
+        return _invalid_row("expected an object")
+    return value
+
+async def _read_rows(request: Request) -> List[dict]:
+    content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    rows = []
+
+    if content_type == "text/csv":
+        header = None
+        async for values in _csv_records(request.stream()):
+            if header is None:
+                header = [name.strip().lower() for name in values]
+                continue
+            rows.append(_csv_row(header, values))
+            if len(rows) > MAX_IMPORT_ROWS:
+                break
+    elif content_type in ("application/x-ndjson", "application/jsonl"):
+        async for line in _lines(request.stream()):
+            if not line.strip():
+                continue
+            try:
+                rows.append(_json_row(json.loads(line)))
+            except ValueError:
+                rows.append(_invalid_row("invalid JSON"))
+            if len(rows) > MAX_IMPORT_ROWS:
+                break
+    elif content_type == "application/json":
+        try:
+            body = await request.json()
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Body is not valid JSON")
+        if isinstance(body, dict):
+            body = body.get("questions")
+        if not isinstance(body, list):
+            raise HTTPException(status_code=400, detail="Expected a list of questions")
+        rows = [_json_row(value) for value in body]
+    else:
+        raise HTTPException(
+            status_code=415,
+            detail="Use text/csv, application/x-ndjson or application/json",
+        )
+
+    if len(rows) > MAX_IMPORT_ROWS:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_IMPORT_ROWS} questions per import")
+    return rows
+
+@router.post("/lessons/{lesson_id}/questions/import")
+async def import_questions(lesson_id: str, request: Request):
+    rows = await _read_rows(request)
+
+    async with open_session() as db:
+        try:
+            result = await db.run(crud.upsert_questions, lesson_id, rows)
+        except ValueError as error:
+            raise HTTPException(status_code=404, detail=str(error))
+    questions_changed(result.lesson_ids)
+
+    return {
+        "inserted": result.inserted,
+        "updated": result.updated,
+        "rows": [
+            {"index": row.index, "id": row.id, "error": row.error}
+            for row in result.rows
+        ],
+    }
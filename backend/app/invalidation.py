@@ -0,0 +1,22 @@
+from typing import Iterable
+
+from .cache import response_cache
+from .grading import answer_keys
+from .loaders import QUESTIONS_BY_LESSON
+from .quiz import quizzes
+
+# Cache invalidation shared by the GraphQL mutations and the REST endpoints
+# that write the same rows. Anything cached from a lesson's questions is
+# dropped here, so a new cache of them only needs adding in one place.
+
+def questions_changed(lesson_ids: Iterable[str]) -> None:
+    for lesson_id in lesson_ids:
+        answer_keys.invalidate(lesson_id)
+        quizzes.invalidate(lesson_id)
+        response_cache.invalidate(QUESTIONS_BY_LESSON, lesson_id)
+
+def all_questions_changed() -> None:
+    # For deletes that take lessons with them whose ids aren't at hand
+    answer_keys.clear()
+    quizzes.clear()
+    response_cache.invalidate_namespace(QUESTIONS_BY_LESSON)
@@ -0,0 +1,217 @@
+from collections import defaultdict
+from typing import List, Optional
+
+from sqlmodel import Session, func, select
+from strawberry.dataloader import DataLoader
+
+from .cache import ResponseCache, response_cache
+from .db import RoutingSession
+from .models import Class, EnrollmentLink, Lesson, LessonQuestion, LessonScore, Question, User
+
+# Each loader turns the keys collected during one tick of the event loop into a
+# single IN (...) query, so the number of queries per request depends on the
+# depth of the GraphQL selection and not on how many rows it touches.
+
+def _group(rows, keys):
+    grouped = defaultdict(list)
+    for key, value in rows:
+        grouped[key].append(value)
+    return [grouped[key] for key in keys]
+
+def _index(rows, keys):
+    by_key = {row.id: row for row in rows}
+    return [by_key.get(key) for key in keys]
+
+# Batch queries, run through RequestSession so they work with sync and async sessions
+def _users(session: Session, ids: List[int]) -> List[Optional[User]]:
+    rows = session.exec(select(User).where(User.id.in_(ids))).all()
+    return _index(rows, ids)
+
+def _classes(session: Session, ids: List[int]) -> List[Optional[Class]]:
+    rows = session.exec(select(Class).where(Class.id.in_(ids))).all()
+    return _index(rows, ids)
+
+def _lessons(session: Session, ids: List[str]) -> List[Optional[Lesson]]:
+    rows = session.exec(select(Lesson).where(Lesson.id.in_(ids))).all()
+    return _index(rows, ids)
+
+def _classes_by_teacher(session: Session, teacher_ids: List[int]) -> List[List[Class]]:
+    rows = session.exec(
+        select(Class).where(Class.teacher_id.in_(teacher_ids)).order_by(Class.id)
+    ).all()
+    return _group(((cls.teacher_id, cls) for cls in rows), teacher_ids)
+
+def _classes_by_student(session: Session, student_ids: List[int]) -> List[List[Class]]:
+    rows = session.exec(
+        select(EnrollmentLink.student_id, Class)
+        .join(Class, Class.id == EnrollmentLink.class_id)
+        .where(EnrollmentLink.student_id.in_(student_ids))
+        .order_by(Class.id)
+    ).all()
+    return _group(rows, student_ids)
+
+def _students_by_class(session: Session, class_ids: List[int]) -> List[List[User]]:
+    rows = session.exec(
+        select(EnrollmentLink.class_id, User)
+        .join(User, User.id == EnrollmentLink.student_id)
+        .where(EnrollmentLink.class_id.in_(class_ids))
+        .order_by(User.id)
+    ).all()
+    return _group(rows, class_ids)
+
+def _lessons_by_class(session: Session, class_ids: List[int]) -> List[List[Lesson]]:
+    rows = session.exec(
+        select(Lesson).where(Lesson.class_id.in_(class_ids))
+    ).all()
+    return _group(((lesson.class_id, lesson) for lesson in rows), class_ids)
+
+def _questions_by_lesson(session: Session, lesson_ids: List[str]) -> List[List[Question]]:
+    # Answer choices come with the questions (Question.choices loads by selectin)
+    rows = session.exec(
+        select(LessonQuestion.lesson_id, Question)
+        .join(Question, Question.id == LessonQuestion.question_id)
+        .where(LessonQuestion.lesson_id.in_(lesson_ids))
+        .order_by(LessonQuestion.lesson_id, LessonQuestion.position)
+    ).all()
+    return _group(rows, lesson_ids)
+
+def _lessons_by_question(session: Session, question_ids: List[int]) -> List[List[Lesson]]:
+    rows = session.exec(
+        select(LessonQuestion.question_id, Lesson)
+        .join(Lesson, Lesson.id == LessonQuestion.lesson_id)
+        .where(LessonQuestion.question_id.in_(question_ids))
+        .order_by(Lesson.id)
+    ).all()
+    return _group(rows, question_ids)
+
+def _scores_by_lesson(session: Session, lesson_ids: List[str]) -> List[List[LessonScore]]:
+    rows = session.exec(
+        select(LessonScore).where(LessonScore.lesson_id.in_(lesson_ids)).order_by(LessonScore.id)
+    ).all()
+    return _group(((score.lesson_id, score) for score in rows), lesson_ids)
+
+# Keyset pages of a child collection for many parents at once. ROW_NUMBER()
+# restarts per parent, so each parent gets at most `limit` rows from one query.
+def _students_page(session: Session, class_ids, limit, after, name_prefix):
+    conditions = [EnrollmentLink.class_id.in_(class_ids)]
+    if after is not None:
+        conditions.append(EnrollmentLink.student_id > after)
+    if name_prefix:
+        conditions.append(User.name.startswith(name_prefix, autoescape=True))
+    position = func.row_number().over(
+        partition_by=EnrollmentLink.class_id, order_by=EnrollmentLink.student_id
+    ).label("position")
+    ranked = (
+        select(EnrollmentLink.class_id, EnrollmentLink.student_id, position)
+        .join(User, User.id == EnrollmentLink.student_id)
+        .where(*conditions)
+        .subquery()
+    )
+    return session.exec(
+        select(ranked.c.class_id, User)
+        .join(User, User.id == ranked.c.student_id)
+        .where(ranked.c.position <= limit)
+        .order_by(ranked.c.class_id, User.id)
+    ).all()
+
+def _lessons_page(session: Session, class_ids, limit, after):
+    conditions = [Lesson.class_id.in_(class_ids)]
+    if after is not None:
+        conditions.append(Lesson.id > after)
+    position = func.row_number().over(
+        partition_by=Lesson.class_id, order_by=Lesson.id
+    ).label("position")
+    ranked = select(Lesson.id, position).where(*conditions).subquery()
+    rows = session.exec(
+        select(Lesson)
+        .join(ranked, ranked.c.id == Lesson.id)
+        .where(ranked.c.position <= limit)
+        .order_by(Lesson.class_id, Lesson.id)
+    ).all()
+    return [(lesson.class_id, lesson) for lesson in rows]
+
+def _scores_page(session: Session, lesson_ids, limit, after, user_id):
+    conditions = [LessonScore.lesson_id.in_(lesson_ids)]
+    if after is not None:
+        conditions.append(LessonScore.id > after)
+    if user_id is not None:
+        conditions.append(LessonScore.user_id == user_id)
+    position = func.row_number().over(
+        partition_by=LessonScore.lesson_id, order_by=LessonScore.id
+    ).label("position")
+    ranked = select(LessonScore.id, position).where(*conditions).subquery()
+    rows = session.exec(
+        select(LessonScore)
+        .join(ranked, ranked.c.id == LessonScore.id)
+        .where(ranked.c.position <= limit)
+        .order_by(LessonScore.lesson_id, LessonScore.id)
+    ).all()
+    return [(score.lesson_id, score) for score in rows]
+
+def _paged(fetch):
+    # Keys are (parent_id, *page_args); parents asking for the same page
+    # arguments share a query
+    def batch(session: Session, keys):
+        parents_by_args = defaultdict(list)
+        for parent_id, *args in keys:
+            parents_by_args[tuple(args)].append(parent_id)
+
+        results = {}
+        for args, parent_ids in parents_by_args.items():
+            rows = fetch(session, parent_ids, *args)
+            for parent_id, page in zip(parent_ids, _group(rows, parent_ids)):
+                results[(parent_id, *args)] = page
+        return [results[key] for key in keys]
+    return batch
+
+# Loaders whose results are shared across requests through the response
+# cache, by namespace. The mutations that change these rows invalidate them.
+CLASS = "class"
+LESSON = "lesson"
+CLASSES_BY_STUDENT = "classes_by_student"
+LESSONS_BY_CLASS = "lessons_by_class"
+QUESTIONS_BY_LESSON = "questions_by_lesson"
+
+class Loaders:
+    def __init__(self, db: RoutingSession, cache: ResponseCache = response_cache):
+        self.db = db
+        self.cache = cache
+
+        self.user_by_id = self._loader(_users)
+        self.class_by_id = self._loader(_classes, CLASS)
+        self.lesson_by_id = self._loader(_lessons, LESSON)
+
+        self.classes_by_teacher = self._loader(_classes_by_teacher)
+        self.classes_by_student = self._loader(_classes_by_student, CLASSES_BY_STUDENT)
+        self.students_by_class = self._loader(_students_by_class)
+        self.lessons_by_class = self._loader(_lessons_by_class, LESSONS_BY_CLASS)
+        self.questions_by_lesson = self._loader(_questions_by_lesson, QUESTIONS_BY_LESSON)
+        self.lessons_by_question = self._loader(_lessons_by_question)
+        self.scores_by_lesson = self._loader(_scores_by_lesson)
+
+        self.students_page = self._loader(_paged(_students_page))
+        self.lessons_page = self._loader(_paged(_lessons_page))
+        self.scores_page = self._loader(_paged(_scores_page))
+
+    def _loader(self, batch, namespace: Optional[str] = None) -> DataLoader:
+        async def load_fn(keys):
+            return await self.db.run(batch, list(keys))
+
+        async def cached_load_fn(keys):
+            # Only keys missing from the cache reach the database. Cached rows
+            # are detached ORM objects shared between requests: read them,
+            # never modify them or add them to a session.
+            found = self.cache.get_many(namespace, keys)
+            missing = [key for key in keys if key not in found]
+            if missing:
+                version = self.cache.version(namespace)
+                loaded = dict(zip(missing, await self.db.run_shared(batch, missing)))
+                self.cache.set_many(
+                    namespace,
+                    {key: value for key, value in loaded.items() if value is not None},
+                    version,
+                )
+                found.update(loaded)
+            return [found[key] for key in keys]
+
+        return DataLoader(load_fn=cached_load_fn if namespace else load_fn)
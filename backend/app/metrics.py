@@ -0,0 +1,207 @@
+import logging
+import random
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Set, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Mapper
+
+from . import config
+from .config import Settings
+
+# Request instrumentation. The Instrumentation schema extension opens a
+# RequestMetrics for each GraphQL operation; engine and mapper events add the
+# SQL statements and ORM rows of whichever operation is current. Totals are
+# kept in a process-wide registry rendered in the Prometheus text format at
+# /metrics, so each worker process reports its own series.
+
+logger = logging.getLogger(__name__)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+class Counter:
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self.values: Dict[Labels, float] = defaultdict(float)
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        self.values[tuple(sorted(labels.items()))] += amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for labels, value in sorted(self.values.items()):
+            lines.append(f"{self.name}{_labels(labels)} {value:g}")
+        return lines
+
+class Histogram:
+    def __init__(self, name: str, help: str, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = buckets
+        # labels -> (per-bucket counts with a final +Inf bucket, sum)
+        self.values: Dict[Labels, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = tuple(sorted(labels.items()))
+        if key not in self.values:
+            self.values[key] = ([0] * (len(self.buckets) + 1), [0.0])
+        counts, total = self.values[key]
+        counts[bisect_left(self.buckets, value)] += 1
+        total[0] += value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for labels, (counts, total) in sorted(self.values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                lines.append(f"{self.name}_bucket{_labels(labels + (('le', le),))} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(labels)} {total[0]:g}")
+            lines.append(f"{self.name}_count{_labels(labels)} {cumulative}")
+        return lines
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels) + "}"
+
+operations = Counter("bloom_graphql_operations_total", "GraphQL operations by name, type and outcome.")
+operation_seconds = Histogram("bloom_graphql_operation_seconds", "GraphQL operation duration.")
+operation_statements = Histogram(
+    "bloom_graphql_operation_sql_statements", "SQL statements issued per GraphQL operation.", COUNT_BUCKETS
+)
+resolver_seconds = Histogram(
+    "bloom_graphql_resolver_seconds", "Time spent resolving each field, summed per operation."
+)
+resolver_calls = Counter("bloom_graphql_resolver_calls_total", "Field resolver calls.")
+sql_statements = Counter("bloom_sql_statements_total", "SQL statements executed.")
+sql_seconds = Histogram("bloom_sql_statement_seconds", "SQL statement duration.")
+rows_loaded = Counter("bloom_orm_rows_loaded_total", "Rows loaded into ORM objects.")
+
+REGISTRY = [
+    operations, operation_seconds, operation_statements, resolver_seconds, resolver_calls,
+    sql_statements, sql_seconds, rows_loaded,
+]
+
+# Set by configure when an app is created; process-wide like the registry
+_settings: Settings = config.settings
+
+def configure(settings: Settings) -> None:
+    global _settings
+    _settings = settings
+
+OTHER_OPERATION = "other"
+_operation_labels: Set[str] = set()
+
+def operation_label(metrics: "RequestMetrics") -> str:
+    # Bounds the series a client can create by naming its operations
+    if not metrics.persisted:
+        return OTHER_OPERATION
+    if metrics.operation not in _operation_labels:
+        if len(_operation_labels) >= _settings.metrics_max_operations:
+            return OTHER_OPERATION
+        _operation_labels.add(metrics.operation)
+    return metrics.operation
+
+@dataclass
+class RequestMetrics:
+    operation: str
+    # Whether the document came from the persisted query store
+    persisted: bool = False
+    started: float = field(default_factory=time.perf_counter)
+    sql_count: int = 0
+    sql_seconds: float = 0.0
+    rows_loaded: int = 0
+    # "Type.field" -> [calls, seconds]
+    fields: Dict[str, List[float]] = field(default_factory=lambda: defaultdict(lambda: [0, 0.0]))
+
+    def add_field(self, name: str, seconds: float) -> None:
+        entry = self.fields[name]
+        entry[0] += 1
+        entry[1] += seconds
+
+    def summary(self) -> dict:
+        return {
+            "durationMs": round((time.perf_counter() - self.started) * 1000, 3),
+            "sql": {"statements": self.sql_count, "durationMs": round(self.sql_seconds * 1000, 3)},
+            "rowsLoaded": self.rows_loaded,
+            "resolvers": {
+                name: {"calls": calls, "durationMs": round(seconds * 1000, 3)}
+                for name, (calls, seconds) in sorted(
+                    self.fields.items(), key=lambda item: item[1][1], reverse=True
+                )
+            },
+        }
+
+current: ContextVar[Optional[RequestMetrics]] = ContextVar("request_metrics", default=None)
+
+def record_operation(metrics: RequestMetrics, operation_type: str, failed: bool) -> None:
+    seconds = time.perf_counter() - metrics.started
+    operation = operation_label(metrics)
+    operations.inc(operation=operation, type=operation_type, status="error" if failed else "ok")
+    operation_seconds.observe(seconds, operation=operation)
+    operation_statements.observe(metrics.sql_count, operation=operation)
+    for name, (calls, seconds) in metrics.fields.items():
+        resolver_calls.inc(calls, field=name)
+        resolver_seconds.observe(seconds, field=name)
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    seconds = time.perf_counter() - conn.info["query_started"].pop()
+    sql_statements.inc()
+    sql_seconds.observe(seconds)
+
+    metrics = current.get()
+    if metrics is not None:
+        metrics.sql_count += 1
+        metrics.sql_seconds += seconds
+
+    if (
+        _settings.slow_query_ms > 0
+        and seconds * 1000 >= _settings.slow_query_ms
+        and random.random() < _settings.slow_query_sample_rate
+    ):
+        logger.warning(
+            "Slow query (%.1f ms, operation %s): %s",
+            seconds * 1000, metrics.operation if metrics else "-", statement,
+        )
+
+def _handle_error(exception_context):
+    # A failed statement never reaches after_cursor_execute
+    started = exception_context.connection.info.get("query_started") if exception_context.connection else None
+    if started:
+        started.pop()
+
+def _on_load(target, context):
+    rows_loaded.inc()
+    metrics = current.get()
+    if metrics is not None:
+        metrics.rows_loaded += 1
+
+def instrument_engine(engine: Engine) -> None:
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(engine, "handle_error", _handle_error)
+
+event.listen(Mapper, "load", _on_load)
+
+def render() -> str:
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,298 @@
+from typing import Callable, List, Tuple
+
+from sqlalchemy import Column, Integer, MetaData, Table, inspect, select, text
+from sqlalchemy.engine import Connection
+from sqlmodel import SQLModel
+
+from . import models  # registers the tables on SQLModel.metadata
+
+# Versioned schema migrations. A new database is created straight from the
+# models and stamped with the latest version; an existing one runs every
+# migration above its recorded version, in order, in the caller's
+# transaction, so a failed migration leaves the schema and version as they
+# were (db.py begins that transaction explicitly on SQLite). Migrations spell out their SQL instead of reading the models,
+# so they keep meaning the same thing as the models change.
+
+Migration = Tuple[int, str, Callable[[Connection], None]]
+MIGRATIONS: List[Migration] = []
+
+schema_version = Table(
+    "schema_version", MetaData(),
+    Column("version", Integer, nullable=False),
+)
+
+def migration(version: int, name: str):
+    def register(fn: Callable[[Connection], None]):
+        MIGRATIONS.append((version, name, fn))
+        return fn
+    return register
+
+def head() -> int:
+    return max(version for version, _, _ in MIGRATIONS)
+
+def current_version(connection: Connection) -> int:
+    if not inspect(connection).has_table("schema_version"):
+        return 0
+    return connection.execute(select(schema_version.c.version)).scalar() or 0
+
+def _stamp(connection: Connection, version: int) -> None:
+    connection.execute(schema_version.delete())
+    connection.execute(schema_version.insert().values(version=version))
+
+def pending(connection: Connection) -> List[Migration]:
+    version = current_version(connection)
+    return [entry for entry in sorted(MIGRATIONS) if entry[0] > version]
+
+def migrate(connection: Connection) -> List[Migration]:
+    # Returns the migrations that ran
+    if not inspect(connection).has_table("user"):
+        SQLModel.metadata.create_all(connection)
+        schema_version.create(connection, checkfirst=True)
+        _stamp(connection, head())
+        return []
+
+    schema_version.create(connection, checkfirst=True)
+    applied = []
+    for entry in pending(connection):
+        version, _, fn = entry
+        fn(connection)
+        _stamp(connection, version)
+        applied.append(entry)
+    return applied
+
+# Start Migrations
+@migration(1, "unique lesson score key")
+def _unique_score_key(connection: Connection) -> None:
+    # Keeps the newest of any duplicate scores
+    connection.execute(text(
+        "DELETE FROM lessonscore WHERE id NOT IN "
+        "(SELECT MAX(id) FROM lessonscore GROUP BY lesson_id, user_id)"
+    ))
+    connection.execute(text(
+        "CREATE UNIQUE INDEX IF NOT EXISTS ix_lessonscore_lesson_user "
+        "ON lessonscore (lesson_id, user_id)"
+    ))
+
+@migration(2, "cascading foreign keys")
+def _cascading_foreign_keys(connection: Connection) -> None:
+    # The original schema could only be created on SQLite: question.lesson_id
+    # was an INTEGER referencing the VARCHAR lesson.id
+    if connection.dialect.name != "sqlite":
+        return
+
+    # Foreign keys weren't enforced before, so drop rows whose parent is gone
+    for statement in (
+        "DELETE FROM lesson WHERE class_id NOT IN (SELECT id FROM class)",
+        "DELETE FROM question WHERE lesson_id NOT IN (SELECT id FROM lesson)",
+        "DELETE FROM lessonscore WHERE lesson_id NOT IN (SELECT id FROM lesson) "
+        "OR user_id NOT IN (SELECT id FROM user)",
+        "DELETE FROM enrollmentlink WHERE class_id NOT IN (SELECT id FROM class) "
+        "OR student_id NOT IN (SELECT id FROM user)",
+    ):
+        connection.execute(text(statement))
+
+    # SQLite can't alter a column or constraint, so both tables are rebuilt
+    connection.execute(text(
+        "CREATE TABLE question_new ("
+        "id INTEGER NOT NULL, "
+        "title VARCHAR NOT NULL, "
+        "correct_answer VARCHAR NOT NULL, "
+        "wrong_answers JSON, "
+        "lesson_id VARCHAR NOT NULL, "
+        "PRIMARY KEY (id), "
+        "FOREIGN KEY(lesson_id) REFERENCES lesson (id) ON DELETE CASCADE)"
+    ))
+    connection.execute(text(
+        "INSERT INTO question_new (id, title, correct_answer, wrong_answers, lesson_id) "
+        "SELECT id, title, correct_answer, wrong_answers, CAST(lesson_id AS TEXT) FROM question"
+    ))
+    connection.execute(text("DROP TABLE question"))
+    connection.execute(text("ALTER TABLE question_new RENAME TO question"))
+
+    connection.execute(text(
+        "CREATE TABLE enrollmentlink_new ("
+        "class_id INTEGER NOT NULL, "
+        "student_id INTEGER NOT NULL, "
+        "PRIMARY KEY (class_id, student_id), "
+        "FOREIGN KEY(class_id) REFERENCES class (id) ON DELETE CASCADE, "
+        "FOREIGN KEY(student_id) REFERENCES user (id) ON DELETE CASCADE)"
+    ))
+    connection.execute(text(
+        "INSERT INTO enrollmentlink_new (class_id, student_id) "
+        "SELECT class_id, student_id FROM enrollmentlink"
+    ))
+    connection.execute(text("DROP TABLE enrollmentlink"))
+    connection.execute(text("ALTER TABLE enrollmentlink_new RENAME TO enrollmentlink"))
+
+@migration(3, "relationship indexes")
+def _relationship_indexes(connection: Connection) -> None:
+    for statement in (
+        "CREATE INDEX IF NOT EXISTS ix_class_teacher_id ON class (teacher_id)",
+        "CREATE INDEX IF NOT EXISTS ix_enrollmentlink_student_class ON enrollmentlink (student_id, class_id)",
+        "CREATE INDEX IF NOT EXISTS ix_lesson_class_id_id ON lesson (class_id, id)",
+        "CREATE INDEX IF NOT EXISTS ix_question_lesson_id ON question (lesson_id)",
+        "CREATE INDEX IF NOT EXISTS ix_lessonscore_user_lesson ON lessonscore (user_id, lesson_id)",
+    ):
+        connection.execute(text(statement))
+
+@migration(4, "lesson score timestamps")
+def _lesson_score_timestamps(connection: Connection) -> None:
+    # Existing scores get the migration time, so the first incremental export
+    # after it includes all of them
+    if connection.dialect.name == "sqlite":
+        connection.execute(text("ALTER TABLE lessonscore ADD COLUMN updated_at DATETIME"))
+        now = "strftime('%Y-%m-%d %H:%M:%f000', 'now')"
+    else:
+        connection.execute(text("ALTER TABLE lessonscore ADD COLUMN updated_at TIMESTAMP"))
+        now = "timezone('utc', now())"
+    connection.execute(text(f"UPDATE lessonscore SET updated_at = {now}"))
+    connection.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_lessonscore_updated_at ON lessonscore (updated_at)"
+    ))
+
+@migration(5, "user email index")
+def _user_email_index(connection: Connection) -> None:
+    # "user" is a reserved word on Postgres
+    connection.execute(text('CREATE INDEX IF NOT EXISTS ix_user_email ON "user" (email)'))
+
+@migration(6, "question bank")
+def _question_bank(connection: Connection) -> None:
+    # Answer choices move from question.correct_answer/wrong_answers to
+    # answerchoice rows, and question.lesson_id to the lessonquestion link
+    # table. A question's teacher is the teacher of its lesson's class.
+    sqlite_db = connection.dialect.name == "sqlite"
+    if sqlite_db:
+        # Nothing references question yet, so it can be renamed and rebuilt
+        connection.execute(text("ALTER TABLE question RENAME TO question_old"))
+        connection.execute(text(
+            "CREATE TABLE question ("
+            "id INTEGER NOT NULL, "
+            "title VARCHAR NOT NULL, "
+            "teacher_id INTEGER, "
+            "PRIMARY KEY (id), "
+            "FOREIGN KEY(teacher_id) REFERENCES user (id) ON DELETE SET NULL)"
+        ))
+        connection.execute(text(
+            "INSERT INTO question (id, title, teacher_id) "
+            "SELECT q.id, q.title, c.teacher_id FROM question_old q "
+            "JOIN lesson l ON l.id = q.lesson_id JOIN class c ON c.id = l.class_id"
+        ))
+        old = "question_old"
+        integer_key = "INTEGER NOT NULL"
+    else:
+        connection.execute(text(
+            'ALTER TABLE question ADD COLUMN teacher_id INTEGER REFERENCES "user" (id) ON DELETE SET NULL'
+        ))
+        connection.execute(text(
+            "UPDATE question SET teacher_id = class.teacher_id FROM lesson, class "
+            "WHERE lesson.id = question.lesson_id AND class.id = lesson.class_id"
+        ))
+        old = "question"
+        integer_key = "SERIAL NOT NULL"
+    connection.execute(text("CREATE INDEX IF NOT EXISTS ix_question_teacher_id ON question (teacher_id)"))
+
+    connection.execute(text(
+        "CREATE TABLE answerchoice ("
+        f"id {integer_key}, "
+        "question_id INTEGER NOT NULL, "
+        "position INTEGER NOT NULL, "
+        "text VARCHAR NOT NULL, "
+        "is_correct BOOLEAN NOT NULL, "
+        "PRIMARY KEY (id), "
+        "FOREIGN KEY(question_id) REFERENCES question (id) ON DELETE CASCADE)"
+    ))
+    connection.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_answerchoice_question_position "
+        "ON answerchoice (question_id, position)"
+    ))
+    connection.execute(text(
+        "CREATE TABLE lessonquestion ("
+        "lesson_id VARCHAR NOT NULL, "
+        "question_id INTEGER NOT NULL, "
+        "position INTEGER NOT NULL, "
+        "PRIMARY KEY (lesson_id, question_id), "
+        "FOREIGN KEY(lesson_id) REFERENCES lesson (id) ON DELETE CASCADE, "
+        "FOREIGN KEY(question_id) REFERENCES question (id) ON DELETE CASCADE)"
+    ))
+    connection.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_lessonquestion_question_lesson "
+        "ON lessonquestion (question_id, lesson_id)"
+    ))
+
+    # The correct answer comes first, then the wrong answers in their stored order
+    connection.execute(text(
+        "INSERT INTO answerchoice (question_id, position, text, is_correct) "
+        f"SELECT id, 0, correct_answer, TRUE FROM {old}"
+    ))
+    if sqlite_db:
+        wrong_answers = (
+            f"SELECT q.id, CAST(w.key AS INTEGER) + 1, w.value, FALSE "
+            f"FROM {old} q, json_each(q.wrong_answers) w"
+        )
+    else:
+        wrong_answers = (
+            f"SELECT q.id, w.position, w.value, FALSE FROM {old} q, "
+            "json_array_elements_text(CAST(q.wrong_answers AS JSON)) WITH ORDINALITY AS w(value, position)"
+        )
+    connection.execute(text(
+        f"INSERT INTO answerchoice (question_id, position, text, is_correct) {wrong_answers}"
+    ))
+    # Lessons keep their questions in id order, as before
+    connection.execute(text(
+        "INSERT INTO lessonquestion (lesson_id, question_id, position) "
+        "SELECT lesson_id, id, ROW_NUMBER() OVER (PARTITION BY lesson_id ORDER BY id) - 1 "
+        f"FROM {old}"
+    ))
+
+    if not sqlite_db:
+        for column in ("lesson_id", "correct_answer", "wrong_answers"):
+            connection.execute(text(f"ALTER TABLE question DROP COLUMN {column}"))
+        return
+
+    connection.execute(text("DROP TABLE question_old"))
+    for statement in (
+        "CREATE VIRTUAL TABLE IF NOT EXISTS questionsearch USING fts5("
+        "title, answers, tokenize = 'unicode61 remove_diacritics 2')",
+        "CREATE TRIGGER IF NOT EXISTS question_search_insert AFTER INSERT ON question BEGIN "
+        "INSERT INTO questionsearch (rowid, title, answers) VALUES (new.id, new.title, ''); END",
+        "CREATE TRIGGER IF NOT EXISTS question_search_update AFTER UPDATE OF title ON question BEGIN "
+        "UPDATE questionsearch SET title = new.title WHERE rowid = new.id; END",
+        "CREATE TRIGGER IF NOT EXISTS question_search_delete AFTER DELETE ON question BEGIN "
+        "DELETE FROM questionsearch WHERE rowid = old.id; END",
+        "CREATE TRIGGER IF NOT EXISTS answerchoice_search_insert AFTER INSERT ON answerchoice BEGIN "
+        "UPDATE questionsearch SET answers = (SELECT group_concat(text, ' ') FROM answerchoice "
+        "WHERE question_id = new.question_id) WHERE rowid = new.question_id; END",
+        "CREATE TRIGGER IF NOT EXISTS answerchoice_search_update AFTER UPDATE ON answerchoice BEGIN "
+        "UPDATE questionsearch SET answers = (SELECT group_concat(text, ' ') FROM answerchoice "
+        "WHERE question_id = new.question_id) WHERE rowid = new.question_id; END",
+        "CREATE TRIGGER IF NOT EXISTS answerchoice_search_delete AFTER DELETE ON answerchoice BEGIN "
+        "UPDATE questionsearch SET answers = (SELECT group_concat(text, ' ') FROM answerchoice "
+        "WHERE question_id = old.question_id) WHERE rowid = old.question_id; END",
+        "INSERT INTO questionsearch (rowid, title, answers) "
+        "SELECT q.id, q.title, (SELECT group_concat(text, ' ') FROM answerchoice WHERE question_id = q.id) "
+        "FROM question q",
+    ):
+        connection.execute(text(statement))
+
+@migration(7, "question search by teacher")
+def _question_search_by_teacher(connection: Connection) -> None:
+    # Rebuilds the FTS index with the owning teacher as an indexed column
+    if connection.dialect.name != "sqlite":
+        return
+    for statement in (
+        "DROP TRIGGER IF EXISTS question_search_insert",
+        "DROP TRIGGER IF EXISTS question_search_update",
+        "DROP TABLE IF EXISTS questionsearch",
+        "CREATE VIRTUAL TABLE questionsearch USING fts5("
+        "title, answers, teacher, tokenize = 'unicode61 remove_diacritics 2')",
+        "CREATE TRIGGER question_search_insert AFTER INSERT ON question BEGIN "
+        "INSERT INTO questionsearch (rowid, title, answers, teacher) "
+        "VALUES (new.id, new.title, '', coalesce(new.teacher_id, '')); END",
+        "CREATE TRIGGER question_search_update AFTER UPDATE OF title, teacher_id ON question BEGIN "
+        "UPDATE questionsearch SET title = new.title, teacher = coalesce(new.teacher_id, '') "
+        "WHERE rowid = new.id; END",
+        "INSERT INTO questionsearch (rowid, title, answers, teacher) "
+        "SELECT q.id, q.title, (SELECT group_concat(text, ' ') FROM answerchoice WHERE question_id = q.id), "
+        "coalesce(q.teacher_id, '') FROM question q",
+    ):
+        connection.execute(text(statement))
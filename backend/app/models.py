@@ -1,22 +1,33 @@
-from sqlmodel import SQLModel, Field, Relationship, JSON, Column
-from sqlalchemy import Integer, String, ForeignKey
+from sqlmodel import SQLModel, Field, Relationship, Column
+from sqlalchemy import DDL, DateTime, Integer, String, ForeignKey, Index, event
 
+from datetime import datetime, timezone
 from typing import Optional, List
 import string, random
 
+# Naive UTC, the way SQLite stores DateTime columns
+def utcnow() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
 def generate_class_code(length: int = 8) -> str:
     return "".join(random.choices(string.ascii_uppercase + string.digits, k=length))
 
 # Link users to classes
 class EnrollmentLink(SQLModel, table=True):
-    class_id: Optional[int] = Field(default=None, foreign_key="class.id", primary_key=True)
-    student_id: Optional[int] = Field(default=None, foreign_key="user.id", primary_key=True)
+    # The primary key serves class -> students; this index serves student -> classes
+    __table_args__ = (
+        Index("ix_enrollmentlink_student_class", "student_id", "class_id"),
+    )
+
+    class_id: Optional[int] = Field(default=None, foreign_key="class.id", primary_key=True, ondelete="CASCADE")
+    student_id: Optional[int] = Field(default=None, foreign_key="user.id", primary_key=True, ondelete="CASCADE")
 
 class User(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
     google_sub: str = Field(index=True, unique=True)
     name: str
-    email: str
+    # Looked up when teachers enroll students by email
+    email: str = Field(index=True)
     picture: Optional[str] = None
     role: str = "student"
 
@@ -34,14 +45,43 @@ class Class(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
     name: str
     code: str = Field(default_factory=generate_class_code, unique=True)
-    teacher_id: int = Field(foreign_key="user.id")
+    teacher_id: int = Field(foreign_key="user.id", index=True)
 
     # Classes have a teacher, many students enrolled, and many lessons
     teacher: User = Relationship(back_populates="classes_taught")
-    students: List[User] = Relationship(back_populates="classes_enrolled", link_model=EnrollmentLink)
-    lessons: List["Lesson"] = Relationship(back_populates="class_", sa_relationship_kwargs={"cascade": "all, delete-orphan"})
+    # Child rows are removed by ON DELETE CASCADE rather than loaded and deleted one by one
+    students: List[User] = Relationship(
+        back_populates="classes_enrolled",
+        link_model=EnrollmentLink,
+        sa_relationship_kwargs={"passive_deletes": True},
+    )
+    lessons: List["Lesson"] = Relationship(
+        back_populates="class_",
+        sa_relationship_kwargs={"cascade": "all, delete-orphan", "passive_deletes": True}
+    )
+
+# Questions belong to a teacher's bank and can be used in any number of lessons
+class LessonQuestion(SQLModel, table=True):
+    # The primary key serves lesson -> questions; this index serves question -> lessons
+    __table_args__ = (
+        Index("ix_lessonquestion_question_lesson", "question_id", "lesson_id"),
+    )
+
+    lesson_id: str = Field(
+        sa_column=Column(String, ForeignKey("lesson.id", ondelete="CASCADE"), primary_key=True)
+    )
+    question_id: int = Field(
+        sa_column=Column(Integer, ForeignKey("question.id", ondelete="CASCADE"), primary_key=True)
+    )
+    # Order of the question within the lesson
+    position: int = 0
 
 class Lesson(SQLModel, table=True):
+    # Covers lessons_for_class and the keyset-paginated lessons of a class
+    __table_args__ = (
+        Index("ix_lesson_class_id_id", "class_id", "id"),
+    )
+
     id: Optional[str] = Field(default_factory=generate_class_code, primary_key=True)
     title: str
     class_id: int = Field(
@@ -49,27 +89,104 @@ class Lesson(SQLModel, table=True):
     )
 
     class_: "Class" = Relationship(back_populates="lessons")
+    # Removing a lesson only unlinks its questions; they stay in the bank
     questions: list["Question"] = Relationship(
-        back_populates="lesson",
-        sa_relationship_kwargs={"cascade": "all, delete-orphan"}
+        back_populates="lessons",
+        link_model=LessonQuestion,
+        sa_relationship_kwargs={"order_by": "LessonQuestion.position", "passive_deletes": True},
     )
     scores: list["LessonScore"] = Relationship(
         back_populates="lesson",
-        sa_relationship_kwargs={"cascade": "all, delete-orphan"}
+        sa_relationship_kwargs={"cascade": "all, delete-orphan", "passive_deletes": True}
     )
 
 class Question(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
     title: str
-    correct_answer: str
-    wrong_answers: list[str] = Field(sa_column=Column(JSON), default_factory=list)
-    lesson_id: int = Field(
-        sa_column=Column(Integer, ForeignKey("lesson.id", ondelete="CASCADE"), nullable=False)
+    # Whose bank the question is in; search_questions looks there
+    teacher_id: Optional[int] = Field(
+        default=None,
+        sa_column=Column(Integer, ForeignKey("user.id", ondelete="SET NULL"), index=True),
     )
 
-    lesson: Optional["Lesson"] = Relationship(back_populates="questions")
+    lessons: list["Lesson"] = Relationship(
+        back_populates="questions",
+        link_model=LessonQuestion,
+        sa_relationship_kwargs={"passive_deletes": True},
+    )
+    # Always wanted with the question, so loaded with it in one more query per batch
+    choices: list["AnswerChoice"] = Relationship(
+        back_populates="question",
+        sa_relationship_kwargs={
+            "lazy": "selectin",
+            "order_by": "AnswerChoice.position",
+            "cascade": "all, delete-orphan",
+            "passive_deletes": True,
+        },
+    )
+
+    @property
+    def correct_answer(self) -> str:
+        return next((choice.text for choice in self.choices if choice.is_correct), "")
+
+    @property
+    def wrong_answers(self) -> List[str]:
+        return [choice.text for choice in self.choices if not choice.is_correct]
+
+class AnswerChoice(SQLModel, table=True):
+    __table_args__ = (
+        Index("ix_answerchoice_question_position", "question_id", "position"),
+    )
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    question_id: int = Field(
+        sa_column=Column(Integer, ForeignKey("question.id", ondelete="CASCADE"), nullable=False)
+    )
+    position: int
+    text: str
+    is_correct: bool = False
+
+    question: Optional["Question"] = Relationship(back_populates="choices")
+
+# Full-text index over question titles and answer choices (SQLite FTS5), keyed
+# by question id and kept current by triggers, so bulk inserts and cascading
+# deletes update it too. The teacher column holds the owner's id as a token:
+# matching it first keeps a search to that teacher's questions, however large
+# the whole bank is. On other databases search_questions falls back to LIKE.
+QUESTION_SEARCH_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS questionsearch USING fts5("
+    "title, answers, teacher, tokenize = 'unicode61 remove_diacritics 2')",
+    "CREATE TRIGGER IF NOT EXISTS question_search_insert AFTER INSERT ON question BEGIN "
+    "INSERT INTO questionsearch (rowid, title, answers, teacher) "
+    "VALUES (new.id, new.title, '', coalesce(new.teacher_id, '')); END",
+    "CREATE TRIGGER IF NOT EXISTS question_search_update AFTER UPDATE OF title, teacher_id ON question BEGIN "
+    "UPDATE questionsearch SET title = new.title, teacher = coalesce(new.teacher_id, '') "
+    "WHERE rowid = new.id; END",
+    "CREATE TRIGGER IF NOT EXISTS question_search_delete AFTER DELETE ON question BEGIN "
+    "DELETE FROM questionsearch WHERE rowid = old.id; END",
+    "CREATE TRIGGER IF NOT EXISTS answerchoice_search_insert AFTER INSERT ON answerchoice BEGIN "
+    "UPDATE questionsearch SET answers = (SELECT group_concat(text, ' ') FROM answerchoice "
+    "WHERE question_id = new.question_id) WHERE rowid = new.question_id; END",
+    "CREATE TRIGGER IF NOT EXISTS answerchoice_search_update AFTER UPDATE ON answerchoice BEGIN "
+    "UPDATE questionsearch SET answers = (SELECT group_concat(text, ' ') FROM answerchoice "
+    "WHERE question_id = new.question_id) WHERE rowid = new.question_id; END",
+    "CREATE TRIGGER IF NOT EXISTS answerchoice_search_delete AFTER DELETE ON answerchoice BEGIN "
+    "UPDATE questionsearch SET answers = (SELECT group_concat(text, ' ') FROM answerchoice "
+    "WHERE question_id = old.question_id) WHERE rowid = old.question_id; END",
+]
+
+for statement in QUESTION_SEARCH_DDL:
+    event.listen(AnswerChoice.__table__, "after_create", DDL(statement).execute_if(dialect="sqlite"))
 
 class LessonScore(SQLModel, table=True):
+    # One score per student per lesson; score upserts conflict on this key
+    __table_args__ = (
+        Index("ix_lessonscore_lesson_user", "lesson_id", "user_id", unique=True),
+        Index("ix_lessonscore_user_lesson", "user_id", "lesson_id"),
+        # Incremental exports read the scores changed since a timestamp
+        Index("ix_lessonscore_updated_at", "updated_at"),
+    )
+
     id: Optional[int] = Field(default=None, primary_key=True)
     lesson_id: str = Field(
         sa_column=Column(String, ForeignKey("lesson.id", ondelete="CASCADE"))
@@ -78,6 +195,9 @@ class LessonScore(SQLModel, table=True):
         sa_column=Column(Integer, ForeignKey("user.id", ondelete="CASCADE"))
     )
     score: float
+    updated_at: Optional[datetime] = Field(
+        default_factory=utcnow, sa_column=Column(DateTime)
+    )
 
     lesson: Optional["Lesson"] = Relationship(back_populates="scores")
     user: Optional["User"] = Relationship(back_populates="scores")
\ No newline at end of file
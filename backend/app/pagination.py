@@ -0,0 +1,85 @@
+import base64
+import json
+from typing import Any, Callable, Generic, List, Optional, TypeVar
+
+import strawberry
+from graphql import GraphQLError
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+T = TypeVar("T")
+
+@strawberry.type
+class PageInfo:
+    has_next_page: bool
+    end_cursor: Optional[str]
+
+@strawberry.type
+class Edge(Generic[T]):
+    cursor: str
+    node: T
+
+@strawberry.type
+class Connection(Generic[T]):
+    edges: List[Edge[T]]
+    page_info: PageInfo
+
+    @strawberry.field
+    def nodes(self) -> List[T]:
+        return [edge.node for edge in self.edges]
+
+# Cursors are opaque to clients but just wrap the keyset value (a primary
+# key, or a list of values for a compound key)
+def encode_cursor(value) -> str:
+    return base64.urlsafe_b64encode(json.dumps(value).encode()).decode()
+
+def _invalid_cursor() -> GraphQLError:
+    return GraphQLError("Invalid cursor", extensions={"code": "BAD_USER_INPUT"})
+
+def _is(value: Any, kind) -> bool:
+    # JSON true/false would otherwise pass as ints
+    return isinstance(value, kind) and not isinstance(value, bool)
+
+def decode_cursor(cursor: Optional[str], *kinds):
+    # kinds are the types (or tuples of types) of the key's values: one for
+    # a plain key, which is returned as is, several for a compound key,
+    # returned as a tuple. Any other cursor, such as one from a different
+    # connection, is rejected before it reaches a query or a loader key.
+    if cursor is None:
+        return None
+    try:
+        value = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except ValueError:
+        raise _invalid_cursor() from None
+    if len(kinds) == 1:
+        if not _is(value, kinds[0]):
+            raise _invalid_cursor()
+        return value
+    if (
+        not isinstance(value, list)
+        or len(value) != len(kinds)
+        or not all(_is(item, kind) for item, kind in zip(value, kinds))
+    ):
+        raise _invalid_cursor()
+    return tuple(value)
+
+def page_size(first: Optional[int]) -> int:
+    if first is None:
+        return DEFAULT_PAGE_SIZE
+    if first < 0:
+        # Also reached from the cost estimate, before any resolver runs
+        raise GraphQLError("first must not be negative", extensions={"code": "BAD_USER_INPUT"})
+    return min(first, MAX_PAGE_SIZE)
+
+def build_connection(rows: list, size: int, key: Callable, node: Callable) -> Connection:
+    # Queries fetch one row more than the page size to learn whether there is a next page
+    page = rows[:size]
+    edges = [Edge(cursor=encode_cursor(key(row)), node=node(row)) for row in page]
+    return Connection(
+        edges=edges,
+        page_info=PageInfo(
+            has_next_page=len(rows) > size,
+            end_cursor=edges[-1].cursor if edges else None,
+        ),
+    )
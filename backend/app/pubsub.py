@@ -0,0 +1,111 @@
+import asyncio
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Dict, List, Optional, Protocol, Set, Tuple
+
+from . import crud
+from .db import open_session
+from .grading import score_writer
+
+# Live class events for GraphQL subscriptions. Publishers hand events to a
+# broker by channel and every subscriber of that channel gets a copy. The
+# in-process broker only reaches subscribers connected to this worker; a
+# networked broker with the same interface can replace it through
+# events.broker when the API runs as several processes.
+
+class Broker(Protocol):
+    def publish(self, channel: str, message: Any) -> None: ...
+    def subscribe(self, channel: str) -> AsyncIterator[Any]: ...
+
+class SubscriberOverflow(Exception):
+    pass
+
+_OVERFLOW = object()
+
+class InMemoryBroker:
+    def __init__(self, max_queue: int = 1000):
+        self.max_queue = max_queue
+        self._subscribers: Dict[str, Set[asyncio.Queue]] = defaultdict(set)
+        self._overflowed: Set[asyncio.Queue] = set()
+
+    def publish(self, channel: str, message: Any) -> None:
+        for queue in list(self._subscribers.get(channel, ())):
+            if queue in self._overflowed:
+                continue
+            if queue.full():
+                # A subscriber this far behind would show wrong totals from
+                # here on, so it's ended and the client resubscribes
+                self._overflowed.add(queue)
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(_OVERFLOW)
+            else:
+                queue.put_nowait(message)
+
+    async def subscribe(self, channel: str) -> AsyncIterator[Any]:
+        queue: asyncio.Queue = asyncio.Queue(self.max_queue)
+        self._subscribers[channel].add(queue)
+        try:
+            while True:
+                message = await queue.get()
+                if message is _OVERFLOW:
+                    raise SubscriberOverflow("Too many events queued; subscribe again")
+                yield message
+        finally:
+            self._overflowed.discard(queue)
+            subscribers = self._subscribers[channel]
+            subscribers.discard(queue)
+            if not subscribers:
+                del self._subscribers[channel]
+
+    def subscriber_count(self, channel: str) -> int:
+        return len(self._subscribers.get(channel, ()))
+
+@dataclass(frozen=True)
+class ScoreEvent:
+    lesson_id: str
+    class_id: int
+    user_id: int
+    score: float
+    previous_score: Optional[float]
+
+@dataclass(frozen=True)
+class EnrollmentEvent:
+    class_id: int
+    user_id: int
+    joined: bool
+
+def lesson_channel(lesson_id: str) -> str:
+    return f"lesson:{lesson_id}"
+
+def class_channel(class_id: int) -> str:
+    return f"class:{class_id}"
+
+class EventBus:
+    def __init__(self, broker: Broker):
+        self.broker = broker
+        # A lesson never moves to another class, so this never goes stale
+        self._lesson_classes: Dict[str, int] = {}
+
+    async def publish_score_changes(self, changes: List[Tuple[str, int, Optional[float], float]]) -> None:
+        missing = list({lesson_id for lesson_id, _, _, _ in changes} - self._lesson_classes.keys())
+        if missing:
+            async with open_session() as db:
+                self._lesson_classes.update(await db.run(crud.lesson_classes, missing))
+
+        for lesson_id, user_id, old, new in changes:
+            class_id = self._lesson_classes.get(lesson_id)
+            if class_id is None:
+                continue
+            event = ScoreEvent(lesson_id, class_id, user_id, new, old)
+            self.broker.publish(lesson_channel(lesson_id), event)
+            self.broker.publish(class_channel(class_id), event)
+
+    def publish_enrollment(self, class_id: int, user_id: int, joined: bool) -> None:
+        self.broker.publish(class_channel(class_id), EnrollmentEvent(class_id, user_id, joined))
+
+    def subscribe(self, channel: str) -> AsyncIterator[Any]:
+        return self.broker.subscribe(channel)
+
+events = EventBus(InMemoryBroker())
+score_writer.listeners.append(events.publish_score_changes)
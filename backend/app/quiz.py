@@ -0,0 +1,91 @@
+import hashlib
+import json
+import random
+from dataclasses import dataclass
+from typing import Optional
+
+from fastapi import APIRouter, HTTPException, Request, Response
+
+from . import crud
+from .cache import MISSING, ResponseCache, response_cache
+from .db import RoutingSession, open_routing_session
+from .models import Lesson
+
+# Compact quiz snapshots for students: the lesson title and its questions
+# with their answer choices shuffled, without the answer key, serialized
+# once and reused until a question mutation invalidates the lesson. The
+# shuffle is seeded by lesson and question, so every worker builds the same
+# bytes and the same ETag, and HTTP caches can revalidate across them.
+
+@dataclass(frozen=True)
+class QuizSnapshot:
+    lesson_id: str
+    etag: str
+    body: str
+
+def _snapshot(lesson: Lesson) -> QuizSnapshot:
+    questions = []
+    for question in lesson.questions:
+        answers = [choice.text for choice in question.choices]
+        random.Random(f"{lesson.id}:{question.id}").shuffle(answers)
+        questions.append({"id": question.id, "title": question.title, "answers": answers})
+
+    body = json.dumps(
+        {"lessonId": lesson.id, "title": lesson.title, "questions": questions},
+        separators=(",", ":"),
+    )
+    etag = '"%s"' % hashlib.sha256(body.encode("utf-8")).hexdigest()[:32]
+    return QuizSnapshot(lesson.id, etag, body)
+
+QUIZ = "quiz"
+
+class QuizCache:
+    # Snapshots live in the response cache; only lessons that exist are stored
+    def __init__(self, cache: ResponseCache = response_cache, ttl: float = 60.0):
+        self.cache = cache
+        self.ttl = ttl
+
+    async def get(self, db: RoutingSession, lesson_id: str) -> Optional[QuizSnapshot]:
+        snapshot = self.cache.get(QUIZ, lesson_id)
+        if snapshot is not MISSING:
+            return snapshot
+
+        version = self.cache.version(QUIZ)
+        lesson = await db.run_shared(crud.get_lesson_with_questions, lesson_id)
+        if lesson is None:
+            return None
+        snapshot = _snapshot(lesson)
+        self.cache.set(QUIZ, lesson_id, snapshot, version, self.ttl)
+        return snapshot
+
+    def invalidate(self, lesson_id: str) -> None:
+        self.cache.invalidate(QUIZ, lesson_id)
+
+    def clear(self) -> None:
+        self.cache.invalidate_namespace(QUIZ)
+
+quizzes = QuizCache()
+
+router = APIRouter()
+
+def _matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return "*" in tags or etag in tags
+
+@router.get("/lessons/{lesson_id}/quiz")
+async def quiz_snapshot(lesson_id: str, request: Request):
+    async with open_routing_session() as db:
+        snapshot = await quizzes.get(db, lesson_id)
+    if snapshot is None:
+        raise HTTPException(status_code=404, detail=f"Lesson {lesson_id} not found")
+
+    headers = {
+        "ETag": snapshot.etag,
+        # Shared caches may keep it briefly, then revalidate with the ETag
+        "Cache-Control": f"public, max-age={request.app.state.settings.quiz_max_age}, must-revalidate",
+    }
+    if _matches(request.headers.get("if-none-match"), snapshot.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(snapshot.body, media_type="application/json", headers=headers)
@@ -1,10 +1,26 @@
 import strawberry
-from typing import List, Optional
-from sqlmodel import Session, select, delete
-from .db import engine, init_db
+from enum import Enum
+from typing import AsyncGenerator, List, Optional
+from strawberry.schema.config import StrawberryConfig
+from . import crud
+from .cache import response_cache
+from . import config
+from .config import Settings
+from .extensions import (
+    DocumentCache, Instrumentation, PersistedQueries, QueryCost, ReadRouting, with_settings,
+)
+from .grading import answer_keys, grade, score_writer
+from .gradebook import BUCKETS, Gradebook, gradebooks
+from .invalidation import all_questions_changed, questions_changed
+from .loaders import CLASS, CLASSES_BY_STUDENT, LESSON, LESSONS_BY_CLASS
 from .models import *
+from .pagination import Connection, build_connection, decode_cursor, page_size
+from .pubsub import EnrollmentEvent, ScoreEvent, class_channel, events, lesson_channel
+from .quiz import quizzes
 
 # Start Types
+# Relationship fields resolve through the per-request loaders in info.context,
+# so sibling objects share one batched query per relationship.
 @strawberry.type
 class UserType:
     id: int
@@ -13,152 +29,498 @@ class UserType:
     email: str
     picture: Optional[str]
     role: str
-    classes_taught: Optional[List["ClassType"]] = None
-    classes_enrolled: Optional[List["ClassType"]] = None
+
+    @classmethod
+    def from_model(cls, user: User) -> "UserType":
+        return cls(
+            id=user.id,
+            google_sub=user.google_sub,
+            name=user.name,
+            email=user.email,
+            picture=user.picture,
+            role=user.role,
+        )
+
+    @strawberry.field
+    async def classes_taught(self, info: strawberry.Info) -> Optional[List["ClassType"]]:
+        classes = await info.context.loaders.classes_by_teacher.load(self.id)
+        return [ClassType.from_model(cls) for cls in classes]
+
+    @strawberry.field
+    async def classes_enrolled(self, info: strawberry.Info) -> Optional[List["ClassType"]]:
+        classes = await info.context.loaders.classes_by_student.load(self.id)
+        return [ClassType.from_model(cls) for cls in classes]
 
 @strawberry.type
 class ClassType:
     id: int
     name: str
     code: str
-    teacher: UserType
-    students: List["UserType"]
-    lessons: List["LessonType"]
+    teacher_id: strawberry.Private[int]
+
+    @classmethod
+    def from_model(cls, class_obj: Class) -> "ClassType":
+        return cls(
+            id=class_obj.id,
+            name=class_obj.name,
+            code=class_obj.code,
+            teacher_id=class_obj.teacher_id,
+        )
+
+    @strawberry.field
+    async def teacher(self, info: strawberry.Info) -> UserType:
+        teacher = await info.context.loaders.user_by_id.load(self.teacher_id)
+        return UserType.from_model(teacher)
+
+    @strawberry.field
+    async def students(self, info: strawberry.Info) -> List["UserType"]:
+        students = await info.context.loaders.students_by_class.load(self.id)
+        return [UserType.from_model(student) for student in students]
+
+    @strawberry.field
+    async def lessons(self, info: strawberry.Info) -> List["LessonType"]:
+        lessons = await info.context.loaders.lessons_by_class.load(self.id)
+        return [LessonType.from_model(lesson) for lesson in lessons]
+
+    @strawberry.field
+    async def students_connection(
+        self,
+        info: strawberry.Info,
+        first: Optional[int] = None,
+        after: Optional[str] = None,
+        name_prefix: Optional[str] = None,
+    ) -> Connection[UserType]:
+        size = page_size(first)
+        students = await info.context.loaders.students_page.load(
+            (self.id, size + 1, decode_cursor(after, int), name_prefix)
+        )
+        return build_connection(students, size, key=lambda user: user.id, node=UserType.from_model)
+
+    @strawberry.field
+    async def lessons_connection(
+        self,
+        info: strawberry.Info,
+        first: Optional[int] = None,
+        after: Optional[str] = None,
+    ) -> Connection["LessonType"]:
+        size = page_size(first)
+        lessons = await info.context.loaders.lessons_page.load(
+            (self.id, size + 1, decode_cursor(after, str))
+        )
+        return build_connection(lessons, size, key=lambda lesson: lesson.id, node=LessonType.from_model)
 
 @strawberry.type
 class LessonType:
     id: str
     title: str
-    class_: ClassType
-    questions: Optional[List["QuestionType"]] = None
-    scores: Optional[List["LessonScoreType"]] = None
+    class_id: strawberry.Private[int]
+
+    @classmethod
+    def from_model(cls, lesson: Lesson) -> "LessonType":
+        return cls(id=lesson.id, title=lesson.title, class_id=lesson.class_id)
+
+    @strawberry.field
+    async def class_(self, info: strawberry.Info) -> ClassType:
+        class_obj = await info.context.loaders.class_by_id.load(self.class_id)
+        return ClassType.from_model(class_obj)
+
+    @strawberry.field
+    async def questions(self, info: strawberry.Info) -> Optional[List["QuestionType"]]:
+        questions = await info.context.loaders.questions_by_lesson.load(self.id)
+        return [QuestionType.from_model(question, self.id) for question in questions]
+
+    @strawberry.field
+    async def scores(self, info: strawberry.Info) -> Optional[List["LessonScoreType"]]:
+        scores = await info.context.loaders.scores_by_lesson.load(self.id)
+        return [LessonScoreType.from_model(score) for score in scores]
+
+    @strawberry.field
+    async def scores_connection(
+        self,
+        info: strawberry.Info,
+        first: Optional[int] = None,
+        after: Optional[str] = None,
+        user_id: Optional[int] = None,
+    ) -> Connection["LessonScoreType"]:
+        size = page_size(first)
+        scores = await info.context.loaders.scores_page.load(
+            (self.id, size + 1, decode_cursor(after, int), user_id)
+        )
+        return build_connection(scores, size, key=lambda score: score.id, node=LessonScoreType.from_model)
 
 @strawberry.type
 class QuestionType:
     id: int
     title: str
-    correct_answer: str
-    wrong_answers: List[str]
-    lesson: LessonType
+    # The answers are only shown to the teacher who owns the question, and
+    # so teaches every lesson it's in; anyone else gets null
+    answer: strawberry.Private[str]
+    wrong: strawberry.Private[List[str]]
+    teacher_id: strawberry.Private[Optional[int]]
+    # The lesson the question was loaded through, if any; a question can be in several
+    lesson_id: strawberry.Private[Optional[str]]
+
+    @classmethod
+    def from_model(cls, question: Question, lesson_id: Optional[str] = None) -> "QuestionType":
+        return cls(
+            id=question.id,
+            title=question.title,
+            answer=question.correct_answer,
+            wrong=question.wrong_answers,
+            teacher_id=question.teacher_id,
+            lesson_id=lesson_id,
+        )
+
+    def _answers_visible(self, info: strawberry.Info) -> bool:
+        return self.teacher_id is not None and info.context.viewer_id == self.teacher_id
+
+    @strawberry.field
+    def correct_answer(self, info: strawberry.Info) -> Optional[str]:
+        return self.answer if self._answers_visible(info) else None
+
+    @strawberry.field
+    def wrong_answers(self, info: strawberry.Info) -> Optional[List[str]]:
+        return self.wrong if self._answers_visible(info) else None
+
+    @strawberry.field
+    async def lesson(self, info: strawberry.Info) -> Optional[LessonType]:
+        if self.lesson_id is None:
+            return None
+        lesson = await info.context.loaders.lesson_by_id.load(self.lesson_id)
+        return LessonType.from_model(lesson)
+
+    @strawberry.field
+    async def lessons(self, info: strawberry.Info) -> List[LessonType]:
+        lessons = await info.context.loaders.lessons_by_question.load(self.id)
+        return [LessonType.from_model(lesson) for lesson in lessons]
 
 @strawberry.type
 class LessonScoreType:
-    lesson_id: int
+    lesson_id: str
     user_id: int
     score: float
 
+    @classmethod
+    def from_model(cls, score: LessonScore) -> "LessonScoreType":
+        return cls(lesson_id=score.lesson_id, user_id=score.user_id, score=score.score)
+
+@strawberry.type
+class QuestionRowResultType:
+    index: int
+    id: Optional[int]
+    error: Optional[str]
+
+@strawberry.type
+class UpsertQuestionsResultType:
+    inserted: int
+    updated: int
+    rows: List[QuestionRowResultType]
+
+    @classmethod
+    def from_result(cls, result: crud.QuestionUpsertResult) -> "UpsertQuestionsResultType":
+        return cls(
+            inserted=result.inserted,
+            updated=result.updated,
+            rows=[
+                QuestionRowResultType(index=row.index, id=row.id, error=row.error)
+                for row in result.rows
+            ],
+        )
+
+@strawberry.type
+class EnrollmentResultType:
+    enrolled: List[UserType]
+    already_enrolled: List[UserType]
+    not_found: List[str]
+
+    @classmethod
+    def from_result(cls, result: crud.EnrollmentResult) -> "EnrollmentResultType":
+        return cls(
+            enrolled=[UserType.from_model(user) for user in result.enrolled],
+            already_enrolled=[UserType.from_model(user) for user in result.already_enrolled],
+            not_found=result.not_found,
+        )
+
+@strawberry.type
+class QuizPayloadType:
+    lesson_id: str
+    etag: str
+    # Serialized quiz JSON; null when the etag the client sent is still current
+    payload: Optional[str]
+    not_modified: bool
+
+@strawberry.type
+class GradedSubmissionType:
+    lesson_id: str
+    user_id: int
+    score: float
+    correct: int
+    total: int
+
+@strawberry.type
+class ScoreBucketType:
+    lower: float
+    upper: float
+    count: int
+
+def _distribution(buckets: List[int]) -> List[ScoreBucketType]:
+    width = 100 / BUCKETS
+    return [
+        ScoreBucketType(lower=index * width, upper=(index + 1) * width, count=count)
+        for index, count in enumerate(buckets)
+    ]
+
+@strawberry.type
+class LessonGradesType:
+    lesson_id: str
+    completed: int
+    average: Optional[float]
+    distribution: List[ScoreBucketType]
+
+    @strawberry.field
+    async def lesson(self, info: strawberry.Info) -> LessonType:
+        lesson = await info.context.loaders.lesson_by_id.load(self.lesson_id)
+        return LessonType.from_model(lesson)
+
+@strawberry.type
+class StudentGradesType:
+    user_id: int
+    completed: int
+    average: Optional[float]
+
+    @strawberry.field
+    async def student(self, info: strawberry.Info) -> UserType:
+        student = await info.context.loaders.user_by_id.load(self.user_id)
+        return UserType.from_model(student)
+
+@strawberry.type
+class GradebookType:
+    class_id: int
+    lesson_count: int
+    student_count: int
+    average: Optional[float]
+    distribution: List[ScoreBucketType]
+    lessons: List[LessonGradesType]
+    students: List[StudentGradesType]
+
+    @classmethod
+    def from_gradebook(cls, gradebook: Gradebook) -> "GradebookType":
+        completed = sum(lesson.count for lesson in gradebook.lessons.values())
+        total = sum(lesson.total for lesson in gradebook.lessons.values())
+        return cls(
+            class_id=gradebook.class_id,
+            lesson_count=len(gradebook.lessons),
+            student_count=len(gradebook.students),
+            average=total / completed if completed else None,
+            distribution=_distribution(gradebook.distribution),
+            lessons=[
+                LessonGradesType(
+                    lesson_id=lesson_id,
+                    completed=stats.count,
+                    average=stats.average,
+                    distribution=_distribution(stats.buckets),
+                )
+                for lesson_id, stats in gradebook.lessons.items()
+            ],
+            students=[
+                StudentGradesType(user_id=user_id, completed=stats.count, average=stats.average)
+                for user_id, stats in sorted(gradebook.students.items())
+            ],
+        )
+
+@strawberry.type
+class ScoreEventType:
+    lesson_id: str
+    class_id: int
+    user_id: int
+    score: float
+    previous_score: Optional[float]
+
+    @classmethod
+    def from_event(cls, event: ScoreEvent) -> "ScoreEventType":
+        return cls(
+            lesson_id=event.lesson_id,
+            class_id=event.class_id,
+            user_id=event.user_id,
+            score=event.score,
+            previous_score=event.previous_score,
+        )
+
+    @strawberry.field
+    async def student(self, info: strawberry.Info) -> Optional[UserType]:
+        student = await info.context.loaders.user_by_id.load(self.user_id)
+        return UserType.from_model(student) if student else None
+
+@strawberry.enum
+class ActivityKind(Enum):
+    SCORE = "score"
+    JOINED = "joined"
+    LEFT = "left"
+
+@strawberry.type
+class ClassActivityType:
+    kind: ActivityKind
+    class_id: int
+    user_id: int
+    # Set for SCORE events
+    score: Optional[ScoreEventType] = None
+
+    @classmethod
+    def from_event(cls, event) -> "ClassActivityType":
+        if isinstance(event, EnrollmentEvent):
+            kind = ActivityKind.JOINED if event.joined else ActivityKind.LEFT
+            return cls(kind=kind, class_id=event.class_id, user_id=event.user_id)
+        return cls(
+            kind=ActivityKind.SCORE,
+            class_id=event.class_id,
+            user_id=event.user_id,
+            score=ScoreEventType.from_event(event),
+        )
+
+    @strawberry.field
+    async def student(self, info: strawberry.Info) -> Optional[UserType]:
+        student = await info.context.loaders.user_by_id.load(self.user_id)
+        return UserType.from_model(student) if student else None
+
+# Start Inputs
+@strawberry.input
+class QuestionInput:
+    title: str
+    correct_answer: str
+    wrong_answers: List[str]
+    # Set to update an existing question in the lesson instead of adding one
+    id: Optional[int] = None
+
+@strawberry.input
+class AnswerInput:
+    question_id: int
+    answer: str
+
 # Start Queries
+# Database work lives in crud.py and runs through info.context.db, which
+# picks the sync or async session path (DB_ASYNC).
 @strawberry.type
 class Query:
     @strawberry.field
-    def user_by_google_sub(self, google_sub: str) -> Optional[UserType]:
-        with Session(engine) as session:
-            user = session.exec(select(User).where(User.google_sub == google_sub)).first()
-            return UserType(**user.model_dump()) if user else None
-    
+    async def user_by_google_sub(self, info: strawberry.Info, google_sub: str) -> Optional[UserType]:
+        user = await info.context.db.run(crud.get_user_by_google_sub, google_sub)
+        return UserType.from_model(user) if user else None
+
     @strawberry.field
-    def users(self) -> List[UserType]:
-        with Session(engine) as session:
-            return [UserType(**user.model_dump()) for user in session.exec(select(User))]
-        
+    async def users(
+        self,
+        info: strawberry.Info,
+        first: Optional[int] = None,
+        after: Optional[str] = None,
+        role: Optional[str] = None,
+        name_prefix: Optional[str] = None,
+    ) -> Connection[UserType]:
+        size = page_size(first)
+        users = await info.context.db.run(
+            crud.page_users, size + 1, decode_cursor(after, int), role, name_prefix
+        )
+        return build_connection(users, size, key=lambda user: user.id, node=UserType.from_model)
+
     @strawberry.field
-    def classes_for_user(self, user_id: int) -> List["ClassType"]:
-        with Session(engine) as session:
-            user = session.get(User, user_id)
-            if not user:
-                raise ValueError("User not found")
-
-            # If teacher, return classes they teach
-            if user.role == "teacher":
-                classes = user.classes_taught
-            # If student, return classes they’re enrolled in
-            else:
-                classes = user.classes_enrolled
-
-            return [
-                ClassType(
-                    id=cls.id,
-                    name=cls.name,
-                    code=cls.code,
-                    teacher=cls.teacher,
-                    students=cls.students,
-                    lessons=cls.lessons
-                )
-                for cls in classes
-            ]
-    
+    async def classes_for_user(self, info: strawberry.Info, user_id: int) -> List["ClassType"]:
+        loaders = info.context.loaders
+        user = await loaders.user_by_id.load(user_id)
+        if not user:
+            raise ValueError("User not found")
+
+        # If teacher, return classes they teach
+        if user.role == "teacher":
+            classes = await loaders.classes_by_teacher.load(user.id)
+        # If student, return classes they’re enrolled in
+        else:
+            classes = await loaders.classes_by_student.load(user.id)
+
+        return [ClassType.from_model(cls) for cls in classes]
+
     @strawberry.field
-    def classes(self) -> List[ClassType]:
-        with Session(engine) as session:
-            classes = session.exec(select(Class)).all()
-            return [
-                ClassType(
-                    id=cls.id,
-                    name=cls.name,
-                    code=cls.code,
-                    teacher=cls.teacher,
-                    students=cls.students,
-                    lessons=cls.lessons
-                )
-                for cls in classes
-            ]
-    
+    async def classes(
+        self,
+        info: strawberry.Info,
+        first: Optional[int] = None,
+        after: Optional[str] = None,
+        teacher_id: Optional[int] = None,
+        name_prefix: Optional[str] = None,
+    ) -> Connection[ClassType]:
+        size = page_size(first)
+        classes = await info.context.db.run(
+            crud.page_classes, size + 1, decode_cursor(after, int), teacher_id, name_prefix
+        )
+        return build_connection(classes, size, key=lambda cls: cls.id, node=ClassType.from_model)
+
     @strawberry.field
-    def class_by_code(self, code: str) -> Optional[ClassType]:
-        with Session(engine) as session:
-            cls = session.exec(select(Class).where(Class.code == code)).first()
-            return (
-                ClassType(
-                    id=cls.id,
-                    name=cls.name,
-                    code=cls.code,
-                    teacher=cls.teacher,
-                    students=cls.students,
-                    lessons=[
-                        Lesson(
-                            id=lesson.id,
-                            title=lesson.title,
-                            class_id=lesson.class_id,
-                            scores=lesson.scores
-
-                        ) for lesson in cls.lessons
-                    ]
-                )
-                if cls
-                else None
-            )
-    
+    async def class_by_code(self, info: strawberry.Info, code: str) -> Optional[ClassType]:
+        cls = await info.context.db.run(crud.get_class_by_code, code)
+        return ClassType.from_model(cls) if cls else None
+
     @strawberry.field
-    def lessons_for_class(self, class_id: int) -> List[LessonType]:
-        with Session(engine) as session:
-            lessons = session.exec(select(Lesson).where(Lesson.class_id == class_id)).all()
-            return [LessonType(
-                id=lesson.id,
-                title=lesson.title,
-                class_=lesson.class_,
-                questions=lesson.questions,
-            ) for lesson in lessons]
-        
+    async def lessons_for_class(self, info: strawberry.Info, class_id: int) -> List[LessonType]:
+        lessons = await info.context.loaders.lessons_by_class.load(class_id)
+        return [LessonType.from_model(lesson) for lesson in lessons]
+
+    @strawberry.field
+    async def lesson_by_id(self, info: strawberry.Info, lesson_id: str) -> LessonType:
+        lesson = await info.context.loaders.lesson_by_id.load(lesson_id)
+        if not lesson:
+            raise ValueError("Lesson not found")
+
+        return LessonType.from_model(lesson)
+
+    # The student view of a lesson, without the class or answer key
+    @strawberry.field
+    async def quiz_payload(
+        self, info: strawberry.Info, lesson_id: str, etag: Optional[str] = None
+    ) -> QuizPayloadType:
+        snapshot = await quizzes.get(info.context.db, lesson_id)
+        if snapshot is None:
+            raise ValueError("Lesson not found")
+
+        not_modified = etag == snapshot.etag
+        return QuizPayloadType(
+            lesson_id=snapshot.lesson_id,
+            etag=snapshot.etag,
+            payload=None if not_modified else snapshot.body,
+            not_modified=not_modified,
+        )
+
+    @strawberry.field
+    async def gradebook(self, info: strawberry.Info, class_id: int) -> GradebookType:
+        if not await info.context.loaders.class_by_id.load(class_id):
+            raise ValueError("Class not found")
+        gradebook = await gradebooks.get(info.context.db, class_id)
+        return GradebookType.from_gradebook(gradebook)
+
+    # A teacher's question bank, best matches first
     @strawberry.field
-    def lesson_by_id(self, lesson_id: str) -> LessonType:
-        with Session(engine) as session:
-            lesson = session.get(Lesson, lesson_id)
-            if not lesson:
-                raise ValueError("Lesson not found")
-
-            return LessonType(
-                id = lesson.id,
-                title = lesson.title,
-                class_= lesson.class_,
-                questions= lesson.questions
-            )
-        
+    async def search_questions(
+        self,
+        info: strawberry.Info,
+        teacher_id: int,
+        text: str,
+        first: Optional[int] = None,
+        after: Optional[str] = None,
+    ) -> Connection[QuestionType]:
+        size = page_size(first)
+        rows = await info.context.db.run(
+            crud.search_questions, teacher_id, text, size + 1, decode_cursor(after, (int, float), int)
+        )
+        return build_connection(
+            rows, size,
+            key=lambda row: [row[0], row[1].id],
+            node=lambda row: QuestionType.from_model(row[1]),
+        )
+
 # Start Mutations
 @strawberry.type
 class Mutation:
     @strawberry.mutation
-    def create_or_update_user(
+    async def create_or_update_user(
         self,
+        info: strawberry.Info,
         google_sub: str,
         name: str,
         email: str,
@@ -166,297 +528,226 @@ class Mutation:
         picture: Optional[str] = None,
         classCode: Optional[str] = None
     ) -> UserType:
-        with Session(engine) as session:
-            user = session.exec(select(User).where(User.google_sub == google_sub)).first()
-
-            if user:
-                user.name = name
-                user.email = email
-                user.picture = picture
-            else:
-                user = User(
-                    google_sub=google_sub,
-                    name=name,
-                    email=email,
-                    picture=picture,
-                    role=role,
-                )
-                session.add(user)
+        user = await info.context.db.run(
+            crud.create_or_update_user, google_sub, name, email, role, picture
+        )
+        return UserType.from_model(user)
 
-            session.commit()
-            session.refresh(user)
-            return UserType(**user.model_dump())
+    @strawberry.mutation
+    async def create_class(self, info: strawberry.Info, name: str, teacher_id: int) -> ClassType:
+        new_class = await info.context.db.run(crud.create_class, name, teacher_id)
+        return ClassType.from_model(new_class)
 
     @strawberry.mutation
-    def create_class(self, name: str, teacher_id: int) -> ClassType:
-        with Session(engine) as session:
-            teacher = session.get(User, teacher_id)
-            if not teacher:
-                raise ValueError("Teacher not found.")
-            if teacher.role != "teacher":
-                raise ValueError("Only teachers can create classes.")
-
-            new_class = Class(
-                name=name,
-                code=generate_class_code(),
-                teacher_id=teacher.id,
-            )
-            session.add(new_class)
-            session.commit()
-            session.refresh(new_class)
-
-            return ClassType(
-                id=new_class.id,
-                name=new_class.name,
-                code=new_class.code,
-                teacher=UserType(
-                    id=teacher.id,
-                    google_sub=teacher.google_sub,
-                    name=teacher.name,
-                    email=teacher.email,
-                    picture=teacher.picture,
-                    role=teacher.role,
-                ),
-                students=new_class.students,
-                lessons=new_class.lessons,
-            )
-        
+    async def join_class(self, info: strawberry.Info, user_id: int, class_code: str) -> ClassType:
+        cls, joined = await info.context.db.run(crud.join_class, user_id, class_code)
+        if joined:
+            response_cache.invalidate(CLASSES_BY_STUDENT, user_id)
+            gradebooks.invalidate(cls.id)
+            events.publish_enrollment(cls.id, user_id, joined=True)
+        return ClassType.from_model(cls)
+
     @strawberry.mutation
-    def join_class(self, user_id: int, class_code: str) -> ClassType:
-        with Session(engine) as session:
-            user = session.get(User, user_id)
-            if not user:
-                raise ValueError("User not found.")
-            if user.role != "student":
-                raise ValueError("Only students can join classes.")
-
-            cls = session.exec(select(Class).where(Class.code == class_code)).first()
-            if not cls:
-                raise ValueError("Class not found.")
-
-            # Add student to class if not already joined
-            if user not in cls.students:
-                cls.students.append(user)
-                session.commit()
-                session.refresh(cls)
-
-            return ClassType(
-                id=cls.id,
-                name=cls.name,
-                code=cls.code,
-                teacher=cls.teacher,
-                students=cls.students,
-                lessons=cls.lessons,
-            )
-        
+    async def enroll_students(
+        self,
+        info: strawberry.Info,
+        class_id: int,
+        user_ids: Optional[List[int]] = None,
+        emails: Optional[List[str]] = None,
+    ) -> EnrollmentResultType:
+        result = await info.context.db.run(
+            crud.enroll_students, class_id, user_ids or [], emails or []
+        )
+        if result.enrolled:
+            gradebooks.invalidate(class_id)
+        for student in result.enrolled:
+            response_cache.invalidate(CLASSES_BY_STUDENT, student.id)
+            events.publish_enrollment(class_id, student.id, joined=True)
+        return EnrollmentResultType.from_result(result)
+
     @strawberry.mutation
-    def create_lesson(self, class_id: int, title: str) -> LessonType:
-        with Session(engine) as session:
-            class_obj = session.get(Class, class_id)
-            if not class_obj:
-                raise ValueError("Class not found.")
-
-            new_lesson = Lesson(title=title, class_id=class_obj.id)
-            session.add(new_lesson)
-            session.commit()
-            session.refresh(new_lesson)
-
-            return LessonType(
-                id=new_lesson.id,
-                title=new_lesson.title,
-                class_=ClassType(
-                    id=class_obj.id,
-                    name=class_obj.name,
-                    code=class_obj.code,
-                    teacher=class_obj.teacher,
-                    students = class_obj.students,
-                    lessons = class_obj.lessons
-                ),
-                questions=[]
-            )
+    async def create_lesson(self, info: strawberry.Info, class_id: int, title: str) -> LessonType:
+        new_lesson = await info.context.db.run(crud.create_lesson, class_id, title)
+        response_cache.invalidate(LESSONS_BY_CLASS, class_id)
+        gradebooks.invalidate(class_id)
+        return LessonType.from_model(new_lesson)
+
     @strawberry.mutation
-    def delete_lesson(self, class_id: int, lesson_id: str) -> bool:
-        with Session(engine) as session:
-            class_obj = session.get(Class, class_id)
-            if not class_obj:
-                return False
-
-            lesson_to_delete = session.get(Lesson, lesson_id)
-            if not lesson_to_delete or lesson_to_delete.class_id != class_id:
-                return False
-
-            # Delete lesson directly (do not remove from relationship)
-            session.delete(lesson_to_delete)
-            session.commit()
-            return True
-    
+    async def delete_lesson(self, info: strawberry.Info, class_id: int, lesson_id: str) -> bool:
+        removed = await info.context.db.run(crud.delete_lesson, class_id, lesson_id)
+        if removed is None:
+            return False
+        questions_changed([lesson_id])
+        response_cache.invalidate(LESSON, lesson_id)
+        response_cache.invalidate(LESSONS_BY_CLASS, class_id)
+        gradebooks.remove_lesson(class_id, lesson_id, removed)
+        return True
+
     @strawberry.mutation
-    def leave_class(self, class_id: int, student_id: int) -> bool:
-        with Session(engine) as session:
-            cls = session.get(Class, class_id)
-            if not cls:
-                raise ValueError("Class not found")
-
-            student = session.get(User, student_id)
-            if not student:
-                raise ValueError("Student not found")
-
-            if student in cls.students:
-                session.exec(
-                    delete(LessonScore).where(
-                        LessonScore.user_id == student_id,
-                        LessonScore.lesson_id.in_(
-                            [lesson.id for lesson in cls.lessons]
-                        )
-                    )
-                )
-                cls.students.remove(student)
-                session.add(cls)
-                session.commit()
-                return True
-            else:
-                return False
-    
+    async def leave_class(self, info: strawberry.Info, class_id: int, student_id: int) -> bool:
+        removed = await info.context.db.run(crud.leave_class, class_id, student_id)
+        if removed is None:
+            return False
+        response_cache.invalidate(CLASSES_BY_STUDENT, student_id)
+        gradebooks.remove_student(class_id, student_id, removed)
+        events.publish_enrollment(class_id, student_id, joined=False)
+        return True
+
     @strawberry.mutation
-    def delete_class(self, class_id: int) -> bool:
-        with Session(engine) as session:
-            cls = session.get(Class, class_id)
-            if not cls:
-                raise ValueError("Class not found")
-            
-            teacher_id = cls.teacher_id
-
-            session.delete(cls)
-            session.commit()
-            return True
-        
+    async def delete_class(self, info: strawberry.Info, class_id: int) -> bool:
+        deleted = await info.context.db.run(crud.delete_class, class_id)
+        response_cache.invalidate(CLASS, class_id)
+        response_cache.invalidate(LESSONS_BY_CLASS, class_id)
+        # The class's lessons and enrollments go with it; their ids aren't at hand
+        for namespace in (LESSON, CLASSES_BY_STUDENT):
+            response_cache.invalidate_namespace(namespace)
+        all_questions_changed()
+        gradebooks.invalidate(class_id)
+        return deleted
+
     @strawberry.mutation
-    def add_question_to_lesson(
+    async def add_question_to_lesson(
         self,
+        info: strawberry.Info,
         lesson_id: str,
         title: str,
         correct_answer: str,
         wrong_answers: List[str]
     ) -> Optional[QuestionType]:
-        with Session(engine) as session:
-            # Verify that the lesson exists
-            lesson = session.get(Lesson, lesson_id)
-            if not lesson:
-                raise ValueError(f"Lesson with ID {lesson_id} not found")
-
-            # Create the question
-            question = Question(
-                title=title,
-                lesson_id=lesson_id,
-                correct_answer=correct_answer,
-                wrong_answers=wrong_answers
-            )
-            session.add(question)
-            session.commit()
-            session.refresh(question)
-
-            session.commit()
-
-            # Reload with relationships
-            session.refresh(question)
-
-            return QuestionType(
-                id=question.id,
-                title=question.title,
-                correct_answer=question.correct_answer,
-                wrong_answers=question.wrong_answers,
-                lesson=question.lesson
-            )
+        question = await info.context.db.run(
+            crud.add_question_to_lesson, lesson_id, title, correct_answer, wrong_answers
+        )
+        questions_changed([lesson_id])
+        return QuestionType.from_model(question, lesson_id)
+
+    # Reuses questions from the teacher's bank; ones already in the lesson are skipped
+    @strawberry.mutation
+    async def add_questions_to_lesson(
+        self, info: strawberry.Info, lesson_id: str, question_ids: List[int]
+    ) -> List[QuestionType]:
+        questions = await info.context.db.run(crud.add_questions_to_lesson, lesson_id, question_ids)
+        questions_changed([lesson_id])
+        return [QuestionType.from_model(question, lesson_id) for question in questions]
+
+    @strawberry.mutation
+    async def remove_question_from_lesson(
+        self, info: strawberry.Info, lesson_id: str, question_id: int
+    ) -> bool:
+        removed = await info.context.db.run(crud.remove_question_from_lesson, lesson_id, question_id)
+        if removed:
+            questions_changed([lesson_id])
+        return removed
 
     @strawberry.mutation
-    def submit_lesson_score(
+    async def upsert_questions(
         self,
+        info: strawberry.Info,
+        lesson_id: str,
+        questions: List[QuestionInput],
+    ) -> UpsertQuestionsResultType:
+        rows = [
+            {
+                "id": question.id,
+                "title": question.title,
+                "correct_answer": question.correct_answer,
+                "wrong_answers": question.wrong_answers,
+            }
+            for question in questions
+        ]
+        result = await info.context.db.run(crud.upsert_questions, lesson_id, rows)
+        questions_changed(result.lesson_ids)
+        return UpsertQuestionsResultType.from_result(result)
+
+    @strawberry.mutation
+    async def submit_answers(
+        self,
+        info: strawberry.Info,
         lesson_id: str,
         user_id: int,
-        score: float  # score as percentage (0–100)
-    ) -> Optional["LessonScoreType"]:
-        with Session(engine) as session:
-            # Verify lesson exists
-            lesson = session.get(Lesson, lesson_id)
-            if not lesson:
-                raise ValueError(f"Lesson {lesson_id} not found")
-            
-            # Verify user exists
-            user = session.get(User, user_id)
-            if not user:
-                raise ValueError(f"User {user_id} not found")
-
-            # Check if there is already a score
-            existing = session.exec(
-                select(LessonScore)
-                .where(LessonScore.lesson_id == lesson_id)
-                .where(LessonScore.user_id == user_id)
-            ).first()
-
-            if existing:
-                existing.score = score
-                session.add(existing)
-                session.commit()
-                session.refresh(existing)
-                return existing
-
-            # Otherwise create new score
-            lesson_score = LessonScore(
-                lesson_id=lesson_id,
-                user_id=user_id,
-                score=score
-            )
-            session.add(lesson_score)
-            session.commit()
-            session.refresh(lesson_score)
-
-            return LessonScoreType(
-                lesson_id=lesson_score.id,
-                user_id=lesson_score.user_id,
-                score=lesson_score.score
-            )
-        
+        answers: List[AnswerInput],
+    ) -> GradedSubmissionType:
+        loaders = info.context.loaders
+        if not await loaders.lesson_by_id.load(lesson_id):
+            raise ValueError(f"Lesson {lesson_id} not found")
+        if not await loaders.user_by_id.load(user_id):
+            raise ValueError(f"User {user_id} not found")
+
+        answer_key = await answer_keys.get(info.context.db, lesson_id)
+        correct, score = grade(
+            answer_key, {answer.question_id: answer.answer for answer in answers}
+        )
+        await score_writer.submit(lesson_id, user_id, score)
+
+        return GradedSubmissionType(
+            lesson_id=lesson_id,
+            user_id=user_id,
+            score=score,
+            correct=correct,
+            total=len(answer_key),
+        )
+
     @strawberry.mutation
-    def delete_question(self, question_id: int) -> bool:
-        with Session(engine) as session:
-            question = session.get(Question, question_id)
-            if not question:
-                return False
-            session.delete(question)
-            session.commit()
-            return True
-        
+    async def delete_question(self, info: strawberry.Info, question_id: int) -> bool:
+        lesson_ids = await info.context.db.run(crud.delete_question, question_id)
+        if lesson_ids is None:
+            return False
+        questions_changed(lesson_ids)
+        return True
+
     @strawberry.mutation
-    def update_question(
+    async def update_question(
         self,
+        info: strawberry.Info,
         question_id: int,
         title: str,
         correct_answer: str,
         wrong_answers: List[str],
     ) -> Optional[QuestionType]:
-        with Session(engine) as session:
-            question = session.get(Question, question_id)
-            if not question:
-                return None
-
-            question.title = title
-            question.correct_answer = correct_answer
-            question.wrong_answers = wrong_answers
-
-            session.add(question)
-            session.commit()
-            session.refresh(question)
-
-            return QuestionType(
-                id=question.id,
-                title=question.title,
-                correct_answer=question.correct_answer,
-                wrong_answers=question.wrong_answers,
-                lesson=None
-            )
-        
-    
-        
-schema = strawberry.Schema(query=Query, mutation=Mutation)
-
-init_db()
\ No newline at end of file
+        updated = await info.context.db.run(
+            crud.update_question, question_id, title, correct_answer, wrong_answers
+        )
+        if not updated:
+            return None
+        question, lesson_ids = updated
+        questions_changed(lesson_ids)
+        return QuestionType.from_model(question)
+
+# Start Subscriptions
+# Events are pushed as score batches commit, so a dashboard gets the change
+# instead of refetching the class
+@strawberry.type
+class Subscription:
+    @strawberry.subscription
+    async def lesson_progress(
+        self, info: strawberry.Info, lesson_id: str
+    ) -> AsyncGenerator[ScoreEventType, None]:
+        if not await info.context.loaders.lesson_by_id.load(lesson_id):
+            raise ValueError("Lesson not found")
+        async for event in events.subscribe(lesson_channel(lesson_id)):
+            yield ScoreEventType.from_event(event)
+
+    @strawberry.subscription
+    async def class_activity(
+        self, info: strawberry.Info, class_id: int
+    ) -> AsyncGenerator[ClassActivityType, None]:
+        if not await info.context.loaders.class_by_id.load(class_id):
+            raise ValueError("Class not found")
+        async for event in events.subscribe(class_channel(class_id)):
+            yield ClassActivityType.from_event(event)
+
+def build_schema(settings: Settings) -> strawberry.Schema:
+    extensions = [PersistedQueries, DocumentCache, QueryCost, ReadRouting]
+    if settings.metrics_enabled:
+        extensions.append(Instrumentation)
+    return strawberry.Schema(
+        query=Query,
+        mutation=Mutation,
+        subscription=Subscription,
+        extensions=[with_settings(extension, settings) for extension in extensions],
+        config=StrawberryConfig(
+            batching_config={"max_operations": settings.graphql_max_batch}
+            if settings.graphql_max_batch > 0 else None,
+        ),
+    )
+
+schema = build_schema(config.settings)
@@ -0,0 +1,142 @@
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+from dataclasses import replace
+
+from .data import SCALES
+from .workloads import WORKLOADS
+
+# Benchmarks the GraphQL API in process: seeds a fresh SQLite database,
+# replays the frontend's workloads through the ASGI app and reports latency,
+# throughput and SQL queries per request. With a baseline it exits non-zero
+# when an operation needs more queries or gets slower than the tolerance
+# allows. Latencies depend on the machine, so record the baseline
+# (--update-baseline) where the comparison runs. Only runs with the same
+# scale, database, seed, iterations, warmup and concurrency are compared:
+# caches warm up over a different share of a shorter run.
+#
+#   cd backend && python -m bench --scale small
+#   python -m bench --update-baseline
+
+BASELINE = os.path.join(os.path.dirname(__file__), "baseline.json")
+# Recorded with the results; a baseline is only compared with a run that matches on all of them
+RUN_PARAMETERS = ("scale", "database", "seed", "iterations", "warmup", "concurrency")
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(prog="python -m bench")
+    parser.add_argument("--scale", choices=sorted(SCALES), default="small")
+    parser.add_argument("--database", choices=("memory", "file"), default="memory",
+                        help="in-memory SQLite or a file in a temporary directory")
+    parser.add_argument("--workload", action="append", choices=sorted(WORKLOADS),
+                        help="run only this workload (repeatable)")
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=1,
+                        help="concurrent clients for the throughput figure")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--baseline", default=BASELINE)
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument("--latency-tolerance", type=float, default=1.0,
+                        help="allowed p50/p99 growth over the baseline, as a fraction")
+    parser.add_argument("--latency-slack-ms", type=float, default=5.0,
+                        help="absolute p50/p99 growth allowed on top of the tolerance")
+    parser.add_argument("--query-tolerance", type=float, default=0.0,
+                        help="allowed queries-per-request growth over the baseline, as a fraction")
+    parser.add_argument("--output", help="also write the results as JSON to this path")
+    return parser.parse_args(argv)
+
+async def run(args) -> dict:
+    import httpx
+    from app import db
+    from app.app import create_app
+    from app.config import Settings
+    from sqlalchemy.ext.asyncio import AsyncEngine
+    from .data import generate
+    from .runner import QueryCounter, Runner
+
+    directory = None
+    if args.database == "file":
+        directory = tempfile.TemporaryDirectory()
+        database_url = f"sqlite:///{os.path.join(directory.name, 'bench.db')}"
+    else:
+        database_url = "sqlite://"
+    settings = replace(
+        Settings.from_env(), database_url=database_url, db_echo=False, db_auto_migrate=True
+    )
+    if settings.db_async and args.database == "memory":
+        raise SystemExit("DB_ASYNC needs --database file: an in-memory database isn't shared between engines")
+
+    app = create_app(settings)
+    try:
+        async with app.router.lifespan_context(app):
+            database = db.get_database()
+            # With DB_ASYNC the sync engine still reaches the same database file
+            data = generate(database.engine, SCALES[args.scale], args.seed)
+            counter = QueryCounter(*(
+                engine.sync_engine if isinstance(engine, AsyncEngine) else engine
+                for engine in (
+                    database.async_engine or database.engine,
+                    database.async_read_engine or database.read_engine,
+                )
+                if engine is not None
+            ))
+            results = {
+                **{name: getattr(args, name) for name in RUN_PARAMETERS},
+                "rows": data.counts,
+                "workloads": {},
+            }
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+                runner = Runner(client, counter, data, args.seed)
+                for name in args.workload or list(WORKLOADS):
+                    results["workloads"][name] = await runner.run(
+                        WORKLOADS[name], args.iterations, args.warmup, args.concurrency
+                    )
+        return results
+    finally:
+        if directory is not None:
+            directory.cleanup()
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    from .runner import compare, report
+
+    results = asyncio.run(run(args))
+    print(report(results))
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2)
+
+    if args.update_baseline:
+        with open(args.baseline, "w") as file:
+            json.dump(results, file, indent=2)
+            file.write("\n")
+        print(f"Baseline written to {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print("No baseline to compare against")
+        return 0
+    with open(args.baseline) as file:
+        baseline = json.load(file)
+    differences = [
+        f"{name} {baseline.get(name)} (this run {results[name]})"
+        for name in RUN_PARAMETERS
+        if baseline.get(name) != results[name]
+    ]
+    if differences:
+        print(f"Baseline was recorded with {', '.join(differences)}; not comparing")
+        return 0
+
+    failures = compare(
+        results, baseline, args.latency_tolerance, args.query_tolerance, args.latency_slack_ms
+    )
+    for failure in failures:
+        print(f"REGRESSION {failure}")
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,177 @@
+import random
+import string
+from dataclasses import dataclass, field
+from typing import Dict, List, Tuple
+
+from sqlalchemy import insert
+from sqlalchemy.engine import Engine
+
+from app.models import (
+    AnswerChoice, Class, EnrollmentLink, Lesson, LessonQuestion, LessonScore, Question, User, utcnow,
+)
+
+# Synthetic schools for the benchmarks. Rows are generated from a seeded RNG
+# and written with executemany inserts, so the same scale and seed always
+# give the same database.
+
+@dataclass(frozen=True)
+class Scale:
+    teachers: int
+    classes_per_teacher: int
+    students: int
+    classes_per_student: int
+    lessons_per_class: int
+    questions_per_lesson: int
+    # Share of (student, lesson) pairs that already have a score
+    completion: float
+    # Students in no class yet, for the join workload
+    applicants: int
+
+SCALES = {
+    "small": Scale(5, 2, 200, 2, 5, 10, 0.5, 500),
+    "medium": Scale(20, 3, 2000, 3, 10, 15, 0.6, 2000),
+    "large": Scale(100, 4, 20000, 3, 20, 20, 0.7, 5000),
+}
+
+# Lessons in an extra class for the delete_lesson workload, each with the
+# same number of scores at every scale, so its timings show whether deleting
+# one lesson depends on the size of the tables around it
+SPARE_LESSONS = 500
+SPARE_LESSON_SCORES = 40
+
+@dataclass(frozen=True)
+class QuestionRow:
+    id: int
+    correct_answer: str
+    wrong_answers: List[str]
+
+@dataclass
+class Dataset:
+    teachers: List[int] = field(default_factory=list)
+    students: List[Tuple[int, str]] = field(default_factory=list)
+    applicants: List[int] = field(default_factory=list)
+    # class id -> code
+    classes: Dict[int, str] = field(default_factory=dict)
+    enrollments: Dict[int, List[int]] = field(default_factory=dict)
+    lessons: Dict[int, List[str]] = field(default_factory=dict)
+    questions: Dict[str, List[QuestionRow]] = field(default_factory=dict)
+    # (class id, lesson id) of the lessons the delete_lesson workload removes
+    spare_lessons: List[Tuple[int, str]] = field(default_factory=list)
+    counts: Dict[str, int] = field(default_factory=dict)
+
+def _codes(rng: random.Random, count: int) -> List[str]:
+    codes = set()
+    while len(codes) < count:
+        codes.add("".join(rng.choices(string.ascii_uppercase + string.digits, k=8)))
+    return sorted(codes)
+
+def generate(engine: Engine, scale: Scale, seed: int = 0) -> Dataset:
+    rng = random.Random(seed)
+    data = Dataset()
+    users, classes, links, lessons, questions, scores = [], [], [], [], [], []
+    choices, lesson_questions = [], []
+
+    def add_user(role: str) -> int:
+        user_id = len(users) + 1
+        google_sub = f"bench-{role}-{user_id}"
+        users.append({
+            "id": user_id, "google_sub": google_sub, "name": f"{role.title()} {user_id}",
+            "email": f"{role}{user_id}@bench.test", "picture": None, "role": role,
+        })
+        return user_id
+
+    def add_question(question: QuestionRow, lesson_id: str, teacher_id: int) -> None:
+        questions.append({"id": question.id, "title": f"Question {question.id}", "teacher_id": teacher_id})
+        for position, text in enumerate([question.correct_answer, *question.wrong_answers]):
+            choices.append({
+                "question_id": question.id, "position": position, "text": text, "is_correct": position == 0,
+            })
+        lesson_questions.append({
+            "lesson_id": lesson_id, "question_id": question.id,
+            "position": len(data.questions.get(lesson_id, ())),
+        })
+
+    data.teachers = [add_user("teacher") for _ in range(scale.teachers)]
+    class_count = scale.teachers * scale.classes_per_teacher
+    class_codes = _codes(rng, class_count)
+    for index in range(class_count):
+        class_id = index + 1
+        classes.append({
+            "id": class_id, "name": f"Class {class_id}", "code": class_codes[index],
+            "teacher_id": data.teachers[index % scale.teachers],
+        })
+        data.classes[class_id] = class_codes[index]
+
+    lesson_ids = _codes(rng, class_count * scale.lessons_per_class)
+    for class_id in data.classes:
+        data.lessons[class_id] = []
+        for _ in range(scale.lessons_per_class):
+            lesson_id = lesson_ids[len(lessons)]
+            lessons.append({"id": lesson_id, "title": f"Lesson {len(lessons) + 1}", "class_id": class_id})
+            data.lessons[class_id].append(lesson_id)
+            data.questions[lesson_id] = []
+            for _ in range(scale.questions_per_lesson):
+                question = QuestionRow(
+                    id=len(questions) + 1,
+                    correct_answer=f"Answer {len(questions) + 1}",
+                    wrong_answers=[f"Wrong {len(questions) + 1}.{n}" for n in range(3)],
+                )
+                add_question(question, lesson_id, data.teachers[(class_id - 1) % scale.teachers])
+                data.questions[lesson_id].append(question)
+
+    now = utcnow()
+    class_ids = list(data.classes)
+    for _ in range(scale.students):
+        student_id = add_user("student")
+        data.students.append((student_id, users[-1]["google_sub"]))
+        joined = rng.sample(class_ids, min(scale.classes_per_student, len(class_ids)))
+        data.enrollments[student_id] = joined
+        for class_id in joined:
+            links.append({"class_id": class_id, "student_id": student_id})
+            for lesson_id in data.lessons[class_id]:
+                if rng.random() < scale.completion:
+                    scores.append({
+                        "lesson_id": lesson_id, "user_id": student_id,
+                        "score": float(rng.randint(0, 100)), "updated_at": now,
+                    })
+    data.applicants = [add_user("student") for _ in range(scale.applicants)]
+
+    # Drawn from their own RNG so the rest of the dataset doesn't depend on them.
+    # Lowercase ids can't collide with the generated codes.
+    spare_rng = random.Random(f"{seed}:spare")
+    spare_class_id = class_count + 1
+    classes.append({
+        "id": spare_class_id, "name": "Spare lessons", "code": "spare001",
+        "teacher_id": data.teachers[0],
+    })
+    student_ids = [student_id for student_id, _ in data.students]
+    for index in range(SPARE_LESSONS):
+        lesson_id = f"spare{index:03d}"
+        lessons.append({"id": lesson_id, "title": f"Spare lesson {index}", "class_id": spare_class_id})
+        data.spare_lessons.append((spare_class_id, lesson_id))
+        data.questions[lesson_id] = []
+        for _ in range(scale.questions_per_lesson):
+            question_id = len(questions) + 1
+            question = QuestionRow(
+                id=question_id,
+                correct_answer=f"Answer {question_id}",
+                wrong_answers=[f"Wrong {question_id}.{n}" for n in range(3)],
+            )
+            add_question(question, lesson_id, data.teachers[0])
+            data.questions[lesson_id].append(question)
+        for student_id in spare_rng.sample(student_ids, min(SPARE_LESSON_SCORES, len(student_ids))):
+            scores.append({
+                "lesson_id": lesson_id, "user_id": student_id,
+                "score": float(spare_rng.randint(0, 100)), "updated_at": now,
+            })
+
+    with engine.begin() as connection:
+        for model, rows in (
+            (User, users), (Class, classes), (EnrollmentLink, links),
+            (Lesson, lessons), (Question, questions), (AnswerChoice, choices),
+            (LessonQuestion, lesson_questions), (LessonScore, scores),
+        ):
+            if rows:
+                connection.execute(insert(model.__table__), rows)
+            data.counts[model.__tablename__] = len(rows)
+    return data
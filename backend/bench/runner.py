@@ -0,0 +1,196 @@
+import asyncio
+import gc
+import random
+import time
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from app.cache import response_cache
+from app.grading import score_writer
+
+from .data import Dataset
+from .workloads import DOCUMENTS, Request, Workload
+
+@dataclass
+class OperationStats:
+    latencies: List[float] = field(default_factory=list)
+    queries: int = 0
+
+    def summary(self) -> Dict[str, float]:
+        latencies = sorted(self.latencies)
+        return {
+            "count": len(latencies),
+            "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+            "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+            "queries": round(self.queries / len(latencies), 2),
+        }
+
+def percentile(values: List[float], pct: float) -> float:
+    # Nearest rank on sorted values
+    index = max(0, min(len(values) - 1, round(pct / 100 * len(values) + 0.5) - 1))
+    return values[index]
+
+class QueryCounter:
+    def __init__(self, *engines: Engine):
+        self.count = 0
+        for engine in engines:
+            event.listen(engine, "before_cursor_execute", self._count)
+
+    def _count(self, *args) -> None:
+        self.count += 1
+
+class BenchmarkError(Exception):
+    pass
+
+class Runner:
+    def __init__(self, client: httpx.AsyncClient, counter: QueryCounter, data: Dataset, seed: int = 0):
+        self.client = client
+        self.counter = counter
+        self.data = data
+        self.seed = seed
+        self.rng = random.Random(seed)
+        # Keeps counting across phases so join_class never reuses an applicant early
+        self.iteration = 0
+
+    async def send(self, operation: str, variables: dict) -> None:
+        response = await self.client.post(
+            "/graphql",
+            json={"query": DOCUMENTS[operation], "operationName": operation, "variables": variables},
+        )
+        body = response.json()
+        if response.status_code != 200 or body.get("errors"):
+            raise BenchmarkError(f"{operation} failed: {body.get('errors') or response.status_code}")
+
+    async def send_batch(self, requests: List[Request]) -> None:
+        response = await self.client.post(
+            "/graphql",
+            json=[
+                {"query": DOCUMENTS[operation], "operationName": operation, "variables": variables}
+                for operation, variables in requests
+            ],
+        )
+        if response.status_code != 200:
+            raise BenchmarkError(f"batch failed: {response.status_code}")
+        for (operation, _), body in zip(requests, response.json()):
+            if body.get("errors"):
+                raise BenchmarkError(f"{operation} failed: {body['errors']}")
+
+    def _next(self, workload: Workload) -> List[Tuple[str, List[Request]]]:
+        # (label, requests) per HTTP request; a batched workload sends each
+        # iteration's requests as one
+        requests = workload.requests(self.data, self.rng, self.iteration)
+        self.iteration += 1
+        if workload.batched:
+            return [(f"batch[{len(requests)}]", requests)]
+        return [(operation, [(operation, variables)]) for operation, variables in requests]
+
+    async def _send(self, requests: List[Request]) -> None:
+        if len(requests) == 1:
+            await self.send(*requests[0])
+        else:
+            await self.send_batch(requests)
+
+    async def run(self, workload: Workload, iterations: int, warmup: int, concurrency: int) -> dict:
+        # Each workload starts cold and draws the same requests whichever
+        # others run with it
+        await score_writer.drain()
+        response_cache.clear()
+        self.rng = random.Random(f"{self.seed}:{workload.name}")
+        self.iteration = 0
+        for _ in range(warmup):
+            for _, requests in self._next(workload):
+                await self._send(requests)
+
+        # Latency and query counts come from sequential requests, so every
+        # query belongs to the request being timed. Collector pauses would
+        # otherwise land on whichever request happens to trigger them.
+        stats: Dict[str, OperationStats] = defaultdict(OperationStats)
+        sent = 0
+        gc.collect()
+        gc.disable()
+        try:
+            started = time.perf_counter()
+            for _ in range(iterations):
+                for operation, requests in self._next(workload):
+                    queries = self.counter.count
+                    request_started = time.perf_counter()
+                    await self._send(requests)
+                    stats[operation].latencies.append(time.perf_counter() - request_started)
+                    stats[operation].queries += self.counter.count - queries
+                    sent += 1
+            throughput = sent / (time.perf_counter() - started)
+        finally:
+            gc.enable()
+
+        if concurrency > 1:
+            throughput = await self._throughput(workload, iterations, concurrency)
+
+        return {
+            "throughput": round(throughput, 1),
+            "operations": {operation: stats[operation].summary() for operation in sorted(stats)},
+        }
+
+    async def _throughput(self, workload: Workload, iterations: int, concurrency: int) -> float:
+        batches = [self._next(workload) for _ in range(iterations)]
+        queue: asyncio.Queue = asyncio.Queue()
+        for calls in batches:
+            queue.put_nowait(calls)
+
+        async def worker():
+            while not queue.empty():
+                for _, requests in queue.get_nowait():
+                    await self._send(requests)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        return sum(len(calls) for calls in batches) / (time.perf_counter() - started)
+
+def compare(
+    results: dict,
+    baseline: dict,
+    latency_tolerance: float,
+    query_tolerance: float,
+    latency_slack_ms: float = 0.0,
+) -> List[str]:
+    # Returns the regressions; workloads or operations missing from the
+    # baseline aren't checked. Query counts are deterministic for a given
+    # scale and seed, latencies are not, hence the separate slack.
+    failures = []
+    for name, workload in results["workloads"].items():
+        expected_workload: Optional[dict] = baseline["workloads"].get(name)
+        if expected_workload is None:
+            continue
+        for operation, measured in workload["operations"].items():
+            expected = expected_workload["operations"].get(operation)
+            if expected is None:
+                continue
+            limit = expected["queries"] * (1 + query_tolerance)
+            if measured["queries"] > limit + 1e-9:
+                failures.append(
+                    f"{name}/{operation}: {measured['queries']} queries per request, baseline {expected['queries']}"
+                )
+            for metric in ("p50_ms", "p99_ms"):
+                limit = expected[metric] * (1 + latency_tolerance) + latency_slack_ms
+                if measured[metric] > limit:
+                    failures.append(
+                        f"{name}/{operation}: {metric} {measured[metric]} over {limit:.3f} "
+                        f"(baseline {expected[metric]})"
+                    )
+    return failures
+
+def report(results: dict) -> str:
+    lines = [
+        f"{'workload':<18}{'operation':<20}{'n':>6}{'p50 ms':>10}{'p99 ms':>10}{'queries':>9}{'req/s':>9}"
+    ]
+    for name, workload in results["workloads"].items():
+        for operation, measured in workload["operations"].items():
+            lines.append(
+                f"{name:<18}{operation:<20}{measured['count']:>6}{measured['p50_ms']:>10.2f}"
+                f"{measured['p99_ms']:>10.2f}{measured['queries']:>9.2f}{workload['throughput']:>9.1f}"
+            )
+    return "\n".join(lines)
@@ -0,0 +1,183 @@
+import random
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Tuple
+
+from .data import Dataset
+
+# The operations the frontend sends, copied from its gql documents, grouped
+# into the page loads and actions they make up.
+
+DOCUMENTS = {
+    "GetUserByGoogleSub": """
+        query GetUserByGoogleSub($googleSub: String!) {
+          userByGoogleSub(googleSub: $googleSub) { id name email role }
+        }
+    """,
+    "GetClassesForUser": """
+        query GetClassesForUser($userId: Int!) {
+          classesForUser(userId: $userId) { id name code }
+        }
+    """,
+    "JoinClass": """
+        mutation JoinClass($userId: Int!, $classCode: String!) {
+          joinClass(userId: $userId, classCode: $classCode) { id name code }
+        }
+    """,
+    "LeaveClass": """
+        mutation LeaveClass($classId: Int!, $studentId: Int!) {
+          leaveClass(classId: $classId, studentId: $studentId)
+        }
+    """,
+    "DeleteLesson": """
+        mutation DeleteLesson($classId: Int!, $lessonId: String!) {
+          deleteLesson(classId: $classId, lessonId: $lessonId)
+        }
+    """,
+    "GetLessonById": """
+        query GetLessonById($lessonId: String!) {
+          lessonById(lessonId: $lessonId) {
+            id
+            title
+            questions { id title correctAnswer wrongAnswers }
+          }
+        }
+    """,
+    "SearchQuestions": """
+        query SearchQuestions($teacherId: Int!, $text: String!) {
+          searchQuestions(teacherId: $teacherId, text: $text, first: 20) {
+            edges { node { id title correctAnswer } }
+            pageInfo { hasNextPage endCursor }
+          }
+        }
+    """,
+    "GetQuizPayload": """
+        query GetQuizPayload($lessonId: String!) {
+          quizPayload(lessonId: $lessonId) { etag payload }
+        }
+    """,
+    "SubmitAnswers": """
+        mutation SubmitAnswers($lessonId: String!, $userId: Int!, $answers: [AnswerInput!]!) {
+          submitAnswers(lessonId: $lessonId, userId: $userId, answers: $answers) {
+            score
+            correct
+            total
+          }
+        }
+    """,
+    "GetClassByCode": """
+        query GetClassByCode($code: String!) {
+          classByCode(code: $code) {
+            id
+            name
+            code
+            teacher { name id email }
+            students { name id email }
+            lessons { id title scores { userId score } }
+          }
+        }
+    """,
+    "Gradebook": """
+        query Gradebook($classId: Int!) {
+          gradebook(classId: $classId) {
+            lessonCount
+            studentCount
+            average
+            distribution { lower upper count }
+            lessons { lessonId completed average lesson { title } }
+            students { userId completed average student { name } }
+          }
+        }
+    """,
+}
+
+# (operation name, variables)
+Request = Tuple[str, dict]
+
+@dataclass(frozen=True)
+class Workload:
+    name: str
+    # Builds the requests of one iteration
+    requests: Callable[[Dataset, random.Random, int], List[Request]]
+    # Sends an iteration's requests as one batched POST, the way the
+    # frontend's BatchHttpLink sends a page's queries
+    batched: bool = False
+
+def _student(data: Dataset, rng: random.Random) -> Tuple[int, str]:
+    return rng.choice(data.students)
+
+def _dashboard(data: Dataset, rng: random.Random, iteration: int) -> List[Request]:
+    student_id, google_sub = _student(data, rng)
+    return [
+        ("GetUserByGoogleSub", {"googleSub": google_sub}),
+        ("GetClassesForUser", {"userId": student_id}),
+    ]
+
+def _join_class(data: Dataset, rng: random.Random, iteration: int) -> List[Request]:
+    # Once every applicant has joined, joins repeat and change nothing
+    student_id = data.applicants[iteration % len(data.applicants)]
+    return [("JoinClass", {"userId": student_id, "classCode": rng.choice(list(data.classes.values()))})]
+
+def _leave_class(data: Dataset, rng: random.Random, iteration: int) -> List[Request]:
+    # Rejoining keeps the rosters the same size; the student's scores in the
+    # class are gone after the first pass
+    student_id, _ = data.students[iteration % len(data.students)]
+    class_id = data.enrollments[student_id][0]
+    return [
+        ("LeaveClass", {"classId": class_id, "studentId": student_id}),
+        ("JoinClass", {"userId": student_id, "classCode": data.classes[class_id]}),
+    ]
+
+def _delete_lesson(data: Dataset, rng: random.Random, iteration: int) -> List[Request]:
+    if iteration >= len(data.spare_lessons):
+        raise ValueError(f"delete_lesson runs out of lessons after {len(data.spare_lessons)} iterations")
+    class_id, lesson_id = data.spare_lessons[iteration]
+    return [("DeleteLesson", {"classId": class_id, "lessonId": lesson_id})]
+
+def _lesson(data: Dataset, rng: random.Random) -> Tuple[int, str]:
+    student_id, _ = _student(data, rng)
+    class_id = rng.choice(data.enrollments[student_id])
+    return student_id, rng.choice(data.lessons[class_id])
+
+def _take_quiz(data: Dataset, rng: random.Random, iteration: int) -> List[Request]:
+    _, lesson_id = _lesson(data, rng)
+    return [("GetQuizPayload", {"lessonId": lesson_id})]
+
+def _submit_score(data: Dataset, rng: random.Random, iteration: int) -> List[Request]:
+    student_id, lesson_id = _lesson(data, rng)
+    answers = [
+        {
+            "questionId": question.id,
+            "answer": question.correct_answer if rng.random() < 0.7 else question.wrong_answers[0],
+        }
+        for question in data.questions[lesson_id]
+    ]
+    return [("SubmitAnswers", {"lessonId": lesson_id, "userId": student_id, "answers": answers})]
+
+def _search_questions(data: Dataset, rng: random.Random, iteration: int) -> List[Request]:
+    # Classes are dealt to teachers in turn, so the teacher owns the class's questions
+    class_id = rng.choice(list(data.lessons))
+    teacher_id = data.teachers[(class_id - 1) % len(data.teachers)]
+    question = rng.choice(data.questions[rng.choice(data.lessons[class_id])])
+    return [("SearchQuestions", {"teacherId": teacher_id, "text": question.correct_answer})]
+
+def _gradebook(data: Dataset, rng: random.Random, iteration: int) -> List[Request]:
+    class_id = rng.choice(list(data.classes))
+    return [
+        ("GetClassByCode", {"code": data.classes[class_id]}),
+        ("Gradebook", {"classId": class_id}),
+    ]
+
+WORKLOADS: Dict[str, Workload] = {
+    workload.name: workload
+    for workload in (
+        Workload("dashboard", _dashboard),
+        Workload("dashboard_batched", _dashboard, batched=True),
+        Workload("join_class", _join_class),
+        Workload("leave_class", _leave_class),
+        Workload("delete_lesson", _delete_lesson),
+        Workload("take_quiz", _take_quiz),
+        Workload("submit_score", _submit_score),
+        Workload("gradebook", _gradebook),
+        Workload("search_questions", _search_questions),
+    )
+}
@@ -0,0 +1,74 @@
+import dataclasses
+from dataclasses import dataclass
+from typing import List, Optional
+
+import httpx
+import pytest
+from sqlmodel import Session
+
+from app import crud, db
+from app.app import create_app
+from app.config import Settings
+from app.context import VIEWER_HEADER
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+@pytest.fixture
+def file_settings(tmp_path) -> Settings:
+    # A database file, so separate connections see the same tables
+    return Settings(database_url=f"sqlite:///{tmp_path / 'bloom.db'}", db_read_routing=False)
+
+@pytest.fixture
+def database(file_settings, monkeypatch):
+    # Configured as the process database, migrated to head
+    monkeypatch.setattr(db, "_database", None)
+    database = db.configure(file_settings)
+    database.migrate_sync()
+    yield database
+    database.engine.dispose()
+
+@dataclass
+class School:
+    teacher_id: int
+    student_id: int
+    class_id: int
+    class_code: str
+    lesson_id: str
+    question_ids: List[int]
+
+@pytest.fixture
+def school(database) -> School:
+    # A teacher's class with one enrolled student and a two-question lesson
+    with Session(database.engine) as session:
+        teacher = crud.create_or_update_user(session, "g-teacher", "Teacher", "t@example.com", "teacher")
+        student = crud.create_or_update_user(session, "g-student", "Student", "s@example.com", "student")
+        cls = crud.create_class(session, "Biology", teacher.id)
+        crud.join_class(session, student.id, cls.code)
+        lesson = crud.create_lesson(session, cls.id, "Cells")
+        questions = [
+            crud.add_question_to_lesson(session, lesson.id, "Powerhouse of the cell", "Mitochondria", ["Nucleus"]),
+            crud.add_question_to_lesson(session, lesson.id, "Plants make food by", "Photosynthesis", ["Osmosis"]),
+        ]
+        return School(teacher.id, student.id, cls.id, cls.code, lesson.id, [question.id for question in questions])
+
+@pytest.fixture
+async def client(database):
+    # The app serves the fixture's database; caches start empty
+    app = create_app(dataclasses.replace(database.settings, db_auto_migrate=True))
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            yield client
+
+@pytest.fixture
+def graphql(client):
+    async def execute(query: str, as_user: Optional[int] = None, **variables) -> dict:
+        # Returns the data, failing the test on errors
+        headers = {VIEWER_HEADER: str(as_user)} if as_user is not None else {}
+        response = await client.post("/graphql", json={"query": query, "variables": variables}, headers=headers)
+        body = response.json()
+        assert not body.get("errors"), body["errors"]
+        return body["data"]
+    return execute
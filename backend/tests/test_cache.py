@@ -0,0 +1,55 @@
+from app.cache import MISSING, MemoryBackend, ResponseCache
+
+def test_entries_are_evicted_least_recently_used_first():
+    cache = ResponseCache(MemoryBackend(max_entries=2))
+    version = cache.version("lesson")
+    cache.set_many("lesson", {"A": 1, "B": 2}, version)
+    assert cache.get("lesson", "A") == 1
+    cache.set("lesson", "C", 3, version)
+    assert cache.get_many("lesson", ["A", "B", "C"]) == {"A": 1, "C": 3}
+
+def test_entries_expire_after_their_ttl(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr("app.cache.time.monotonic", lambda: now[0])
+    cache = ResponseCache(MemoryBackend(ttl=300))
+    cache.set("lesson", "A", 1, cache.version("lesson"))
+    cache.set("quiz", "A", 2, cache.version("quiz"), ttl=60)
+
+    now[0] += 61
+    assert cache.get("lesson", "A") == 1
+    assert cache.get("quiz", "A") is MISSING
+    now[0] += 240
+    assert cache.get("lesson", "A") is MISSING
+
+def test_load_that_raced_with_an_invalidation_is_not_stored():
+    cache = ResponseCache()
+    version = cache.version("lesson")
+    cache.invalidate("lesson", "A")
+    cache.set("lesson", "A", "stale", version)
+    assert cache.get("lesson", "A") is MISSING
+
+    cache.set("lesson", "A", "fresh", cache.version("lesson"))
+    assert cache.get("lesson", "A") == "fresh"
+
+def test_invalidation_is_scoped_to_its_namespace():
+    cache = ResponseCache()
+    cache.set_many("lesson", {"A": 1, "B": 2}, cache.version("lesson"))
+    cache.set("quiz", "A", 3, cache.version("quiz"))
+    cache.invalidate("lesson", "A")
+    assert cache.get_many("lesson", ["A", "B"]) == {"B": 2}
+    cache.invalidate_namespace("lesson")
+    assert cache.get_many("lesson", ["A", "B"]) == {}
+    assert cache.get("quiz", "A") == 3
+
+def test_disabled_cache_stores_nothing():
+    cache = ResponseCache(enabled=False)
+    cache.set("lesson", "A", 1, cache.version("lesson"))
+    assert cache.get("lesson", "A") is MISSING
+    assert len(cache.backend) == 0
+
+def test_stats_count_hits_and_misses_but_not_peeks():
+    cache = ResponseCache()
+    cache.set("lesson", "A", 1, cache.version("lesson"))
+    cache.get_many("lesson", ["A", "B"])
+    cache.peek("lesson", "A")
+    assert cache.stats() == {"entries": 1, "namespaces": {"lesson": {"hits": 1, "misses": 1}}}
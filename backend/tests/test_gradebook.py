@@ -0,0 +1,70 @@
+import pytest
+
+from app import gradebook as gradebook_module
+from app.cache import ResponseCache
+from app.gradebook import Gradebook, GradebookCache, LessonStats
+
+pytestmark = pytest.mark.anyio
+
+GRADEBOOK = """
+query ($classId: Int!) {
+  gradebook(classId: $classId) {
+    average
+    lessons { lessonId completed average }
+    students { userId completed average }
+  }
+}
+"""
+
+SUBMIT_ANSWERS = """
+mutation ($lessonId: String!, $userId: Int!, $answers: [AnswerInput!]!) {
+  submitAnswers(lessonId: $lessonId, userId: $userId, answers: $answers) { score correct total }
+}
+"""
+
+LEAVE_CLASS = """
+mutation ($classId: Int!, $studentId: Int!) { leaveClass(classId: $classId, studentId: $studentId) }
+"""
+
+async def test_gradebook_follows_scores_without_rebuilding(graphql, school, monkeypatch):
+    empty = await graphql(GRADEBOOK, classId=school.class_id)
+    assert empty["gradebook"]["average"] is None
+
+    builds = []
+    build = gradebook_module._build
+    monkeypatch.setattr(gradebook_module, "_build", lambda *args: builds.append(args) or build(*args))
+
+    answers = [{"questionId": school.question_ids[0], "answer": "Mitochondria"}]
+    submitted = await graphql(SUBMIT_ANSWERS, lessonId=school.lesson_id, userId=school.student_id, answers=answers)
+    assert submitted["submitAnswers"] == {"score": 50.0, "correct": 1, "total": 2}
+
+    gradebook = (await graphql(GRADEBOOK, classId=school.class_id))["gradebook"]
+    assert gradebook["average"] == 50.0
+    assert gradebook["lessons"] == [{"lessonId": school.lesson_id, "completed": 1, "average": 50.0}]
+    assert gradebook["students"] == [{"userId": school.student_id, "completed": 1, "average": 50.0}]
+
+    await graphql(LEAVE_CLASS, classId=school.class_id, studentId=school.student_id)
+    gradebook = (await graphql(GRADEBOOK, classId=school.class_id))["gradebook"]
+    assert gradebook["average"] is None
+    assert gradebook["students"] == []
+    assert builds == []
+
+class RacingDb:
+    # Builds a gradebook while a score change for its lesson is applied
+    def __init__(self, cache: GradebookCache):
+        self.cache = cache
+        self.builds = 0
+
+    async def run_shared(self, fn, class_id):
+        self.builds += 1
+        if self.builds == 1:
+            self.cache.apply_score_changes([("L1", 1, None, 80.0)])
+        return Gradebook(class_id=class_id, lessons={"L1": LessonStats()}, students={})
+
+async def test_gradebook_built_during_a_score_change_is_not_stored():
+    cache = GradebookCache(ResponseCache())
+    db = RacingDb(cache)
+    await cache.get(db, 1)
+    await cache.get(db, 1)
+    await cache.get(db, 1)
+    assert db.builds == 2
@@ -0,0 +1,112 @@
+import asyncio
+
+import anyio
+import pytest
+from sqlmodel import Session, select
+
+from app import crud
+from app.cache import ResponseCache
+from app.grading import AnswerKeyCache, ScoreWriter, grade
+from app.models import LessonScore
+
+pytestmark = pytest.mark.anyio
+
+def scores(database):
+    with Session(database.engine) as session:
+        return {
+            (score.lesson_id, score.user_id): score.score
+            for score in session.exec(select(LessonScore)).all()
+        }
+
+def test_grade_counts_unanswered_as_wrong():
+    key = {1: "Mitochondria", 2: "Photosynthesis", 3: "Osmosis", 4: "Nucleus"}
+    assert grade(key, {1: " Mitochondria ", 2: "Osmosis", 99: "Ignored"}) == (1, 25.0)
+    assert grade({}, {1: "Anything"}) == (0, 0.0)
+
+class RacingDb:
+    # Reads an answer key while a question mutation invalidates the lesson
+    def __init__(self, cache: AnswerKeyCache):
+        self.cache = cache
+        self.reads = 0
+
+    async def run_shared(self, fn, lesson_id):
+        self.reads += 1
+        key = {1: f"answer {self.reads}"}
+        if self.reads == 1:
+            self.cache.invalidate(lesson_id)
+        return key
+
+async def test_answer_key_read_racing_an_invalidation_is_not_cached():
+    cache = AnswerKeyCache(ResponseCache())
+    db = RacingDb(cache)
+    assert await cache.get(db, "L1") == {1: "answer 1"}
+    assert await cache.get(db, "L1") == {1: "answer 2"}
+    assert await cache.get(db, "L1") == {1: "answer 2"}
+    assert db.reads == 2
+
+async def test_concurrent_scores_are_written_as_one_batch(school, database):
+    writer = ScoreWriter(max_delay=0.05)
+    batches = []
+    writer.listeners.append(batches.append)
+
+    async with anyio.create_task_group() as group:
+        for score in (40.0, 90.0):
+            group.start_soon(writer.submit, school.lesson_id, school.student_id, score)
+            await anyio.sleep(0)
+
+    # The latest submission wins within a batch
+    assert batches == [[(school.lesson_id, school.student_id, None, 90.0)]]
+    assert scores(database) == {(school.lesson_id, school.student_id): 90.0}
+
+    await writer.submit(school.lesson_id, school.student_id, 70.0)
+    assert batches[-1] == [(school.lesson_id, school.student_id, 90.0, 70.0)]
+
+async def test_full_batch_is_written_without_waiting(school, database):
+    writer = ScoreWriter(max_batch=2, max_delay=60)
+    with anyio.fail_after(5):
+        await asyncio.gather(
+            writer.submit(school.lesson_id, school.student_id, 50.0),
+            writer.submit(school.lesson_id, school.teacher_id, 60.0),
+        )
+    assert len(scores(database)) == 2
+
+async def test_score_for_a_missing_lesson_fails_only_itself(school, database):
+    writer = ScoreWriter()
+    saved, dropped = await asyncio.gather(
+        writer.submit(school.lesson_id, school.student_id, 80.0),
+        writer.submit("MISSING", school.student_id, 80.0),
+        return_exceptions=True,
+    )
+    assert saved is None
+    assert isinstance(dropped, ValueError)
+    assert scores(database) == {(school.lesson_id, school.student_id): 80.0}
+
+async def test_failed_write_fails_every_submission_in_the_batch(school, monkeypatch):
+    def fail(session, rows):
+        raise RuntimeError("database unavailable")
+
+    monkeypatch.setattr(crud, "upsert_scores", fail)
+    writer = ScoreWriter()
+    results = await asyncio.gather(
+        writer.submit(school.lesson_id, school.student_id, 80.0),
+        writer.submit(school.lesson_id, school.teacher_id, 60.0),
+        return_exceptions=True,
+    )
+    assert [str(result) for result in results] == ["database unavailable"] * 2
+
+async def test_failing_listener_does_not_fail_submissions(school, database):
+    def fail(changes):
+        raise RuntimeError("listener failed")
+
+    writer = ScoreWriter()
+    writer.listeners.append(fail)
+    await writer.submit(school.lesson_id, school.student_id, 80.0)
+    assert scores(database) == {(school.lesson_id, school.student_id): 80.0}
+
+async def test_drain_writes_pending_scores(school, database):
+    writer = ScoreWriter(max_delay=60)
+    submission = asyncio.ensure_future(writer.submit(school.lesson_id, school.student_id, 30.0))
+    await asyncio.sleep(0)
+    await writer.drain()
+    await submission
+    assert scores(database) == {(school.lesson_id, school.student_id): 30.0}
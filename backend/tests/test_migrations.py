@@ -0,0 +1,128 @@
+import dataclasses
+import json
+import sqlite3
+
+import pytest
+from sqlalchemy import text
+
+from app import migrations
+from app.db import Database
+
+# The schema as it was before migrations existed (version 0)
+V0_SCHEMA = """
+CREATE TABLE user (
+    id INTEGER NOT NULL, google_sub VARCHAR NOT NULL, name VARCHAR NOT NULL,
+    email VARCHAR NOT NULL, picture VARCHAR, role VARCHAR NOT NULL,
+    PRIMARY KEY (id)
+);
+CREATE UNIQUE INDEX ix_user_google_sub ON user (google_sub);
+CREATE TABLE class (
+    id INTEGER NOT NULL, name VARCHAR NOT NULL, code VARCHAR NOT NULL, teacher_id INTEGER NOT NULL,
+    PRIMARY KEY (id), UNIQUE (code), FOREIGN KEY(teacher_id) REFERENCES user (id)
+);
+CREATE TABLE enrollmentlink (
+    class_id INTEGER NOT NULL, student_id INTEGER NOT NULL,
+    PRIMARY KEY (class_id, student_id),
+    FOREIGN KEY(class_id) REFERENCES class (id), FOREIGN KEY(student_id) REFERENCES user (id)
+);
+CREATE TABLE lesson (
+    id VARCHAR NOT NULL, title VARCHAR NOT NULL, class_id INTEGER NOT NULL,
+    PRIMARY KEY (id), FOREIGN KEY(class_id) REFERENCES class (id) ON DELETE CASCADE
+);
+CREATE TABLE question (
+    id INTEGER NOT NULL, title VARCHAR NOT NULL, correct_answer VARCHAR NOT NULL,
+    wrong_answers JSON, lesson_id INTEGER NOT NULL,
+    PRIMARY KEY (id), FOREIGN KEY(lesson_id) REFERENCES lesson (id) ON DELETE CASCADE
+);
+CREATE TABLE lessonscore (
+    id INTEGER NOT NULL, lesson_id VARCHAR, user_id INTEGER, score FLOAT NOT NULL,
+    PRIMARY KEY (id),
+    FOREIGN KEY(lesson_id) REFERENCES lesson (id) ON DELETE CASCADE,
+    FOREIGN KEY(user_id) REFERENCES user (id) ON DELETE CASCADE
+);
+INSERT INTO user VALUES (1, 'g1', 'Teacher', 't@example.com', NULL, 'teacher');
+INSERT INTO user VALUES (2, 'g2', 'Student', 's@example.com', NULL, 'student');
+INSERT INTO class VALUES (1, 'Biology', 'BIO00001', 1);
+INSERT INTO enrollmentlink VALUES (1, 2);
+INSERT INTO lesson VALUES ('L1', 'Cells', 1);
+INSERT INTO lessonscore VALUES (1, 'L1', 2, 50.0);
+INSERT INTO lessonscore VALUES (2, 'L1', 2, 75.0);
+"""
+
+def create_v0(path) -> None:
+    connection = sqlite3.connect(path)
+    connection.executescript(V0_SCHEMA)
+    connection.execute(
+        "INSERT INTO question VALUES (1, 'Powerhouse of the cell', 'Mitochondria', ?, 'L1')",
+        (json.dumps(["Nucleus", "Ribosome"]),),
+    )
+    connection.commit()
+    connection.close()
+
+def tables(path) -> set:
+    connection = sqlite3.connect(path)
+    names = {name for name, in connection.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    connection.close()
+    return names
+
+def version(database: Database) -> int:
+    with database.engine.connect() as connection:
+        return migrations.current_version(connection)
+
+def up_to(version: int):
+    return [entry for entry in migrations.MIGRATIONS if entry[0] <= version]
+
+def test_new_database_is_created_at_head(file_settings):
+    database = Database(file_settings)
+    assert database.migrate_sync() == []
+    assert version(database) == migrations.head()
+
+def test_upgrade_from_v0_keeps_data(file_settings):
+    create_v0(file_settings.database_url.removeprefix("sqlite:///"))
+    database = Database(file_settings)
+
+    applied = database.migrate_sync()
+    assert [entry[0] for entry in applied] == list(range(1, migrations.head() + 1))
+    assert version(database) == migrations.head()
+
+    with database.engine.connect() as connection:
+        # Duplicate scores collapse to the newest
+        assert connection.execute(text("SELECT id, score FROM lessonscore")).all() == [(2, 75.0)]
+        assert connection.execute(text("SELECT id, teacher_id FROM question")).all() == [(1, 1)]
+        assert connection.execute(text(
+            "SELECT text, is_correct FROM answerchoice ORDER BY position"
+        )).all() == [("Mitochondria", 1), ("Nucleus", 0), ("Ribosome", 0)]
+        assert connection.execute(text("SELECT lesson_id, question_id FROM lessonquestion")).all() == [("L1", 1)]
+        assert connection.execute(text(
+            "SELECT rowid FROM questionsearch WHERE questionsearch MATCH 'mitochondria'"
+        )).all() == [(1,)]
+    assert database.migrate_sync() == []
+
+@pytest.mark.parametrize("db_async", [False, True])
+@pytest.mark.anyio
+async def test_failed_migration_leaves_schema_and_version(file_settings, monkeypatch, db_async):
+    path = file_settings.database_url.removeprefix("sqlite:///")
+    create_v0(path)
+    monkeypatch.setattr(migrations, "MIGRATIONS", up_to(5))
+    Database(file_settings).migrate_sync()
+    before = tables(path)
+
+    def broken(connection):
+        connection.execute(text("ALTER TABLE question RENAME TO question_old"))
+        connection.execute(text("CREATE TABLE answerchoice (id INTEGER PRIMARY KEY)"))
+        raise RuntimeError("migration failed")
+
+    monkeypatch.setattr(migrations, "MIGRATIONS", up_to(5) + [(6, "broken", broken)])
+    database = Database(dataclasses.replace(file_settings, db_async=db_async))
+    with pytest.raises(RuntimeError):
+        await database.migrate()
+    await database.dispose()
+
+    assert tables(path) == before
+    database = Database(file_settings)
+    assert version(database) == 5
+
+    # Nothing is left behind to trip up the next attempt
+    monkeypatch.undo()
+    assert [entry[0] for entry in database.migrate_sync()] == list(range(6, migrations.head() + 1))
+    assert version(database) == migrations.head()
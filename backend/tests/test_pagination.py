@@ -0,0 +1,76 @@
+import pytest
+from graphql import GraphQLError
+
+from app.pagination import decode_cursor, encode_cursor
+
+USERS = """
+query ($first: Int, $after: String) {
+  users(first: $first, after: $after) {
+    edges { node { id } }
+    pageInfo { hasNextPage endCursor }
+  }
+}
+"""
+
+SEARCH = """
+query ($teacherId: Int!, $after: String) {
+  searchQuestions(teacherId: $teacherId, text: "m", first: 1, after: $after) {
+    edges { node { id } }
+    pageInfo { hasNextPage endCursor }
+  }
+}
+"""
+
+def test_cursors_round_trip():
+    assert decode_cursor(encode_cursor(7), int) == 7
+    assert decode_cursor(encode_cursor("L1"), str) == "L1"
+    assert decode_cursor(encode_cursor([-1.5, 3]), (int, float), int) == (-1.5, 3)
+    assert decode_cursor(None, int) is None
+
+@pytest.mark.parametrize("cursor", [
+    "not base64!",
+    encode_cursor("7"),
+    encode_cursor(True),
+    encode_cursor([7]),
+    encode_cursor({"id": 7}),
+])
+def test_plain_cursor_must_hold_its_key_type(cursor):
+    with pytest.raises(GraphQLError) as error:
+        decode_cursor(cursor, int)
+    assert error.value.extensions == {"code": "BAD_USER_INPUT"}
+
+@pytest.mark.parametrize("value", [[1.5], [1.5, 2, 3], ["1.5", 2], [1.5, 2.5], 7])
+def test_compound_cursor_must_match_every_key_type(value):
+    with pytest.raises(GraphQLError):
+        decode_cursor(encode_cursor(value), (int, float), int)
+
+@pytest.mark.anyio
+async def test_pages_follow_the_end_cursor(graphql, school):
+    first = (await graphql(USERS, first=1))["users"]
+    assert [edge["node"]["id"] for edge in first["edges"]] == [school.teacher_id]
+    assert first["pageInfo"]["hasNextPage"]
+
+    rest = (await graphql(USERS, first=5, after=first["pageInfo"]["endCursor"]))["users"]
+    assert [edge["node"]["id"] for edge in rest["edges"]] == [school.student_id]
+    assert rest["pageInfo"] == {"hasNextPage": False, "endCursor": encode_cursor(school.student_id)}
+
+@pytest.mark.anyio
+async def test_compound_cursor_pages_search_results(graphql, school):
+    first = (await graphql(SEARCH, teacherId=school.teacher_id))["searchQuestions"]
+    assert first["pageInfo"]["hasNextPage"]
+    rest = (await graphql(SEARCH, teacherId=school.teacher_id, after=first["pageInfo"]["endCursor"]))["searchQuestions"]
+    assert not rest["pageInfo"]["hasNextPage"]
+    assert {edge["node"]["id"] for edge in first["edges"] + rest["edges"]} == set(school.question_ids)
+
+@pytest.mark.anyio
+@pytest.mark.parametrize("query, variables", [
+    # A cursor from another connection, and a negative page size
+    (USERS, {"after": encode_cursor([-1.5, 3])}),
+    (SEARCH, {"after": encode_cursor(7)}),
+    (USERS, {"first": -1}),
+])
+async def test_bad_page_arguments_are_user_errors(client, school, query, variables):
+    variables.setdefault("teacherId", school.teacher_id)
+    response = await client.post("/graphql", json={"query": query, "variables": variables})
+    errors = response.json()["errors"]
+    assert [error["extensions"]["code"] for error in errors] == ["BAD_USER_INPUT"]
@@ -0,0 +1,86 @@
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+LESSON = """
+query ($lessonId: String!) {
+  lessonById(lessonId: $lessonId) { questions { id title correctAnswer wrongAnswers } }
+}
+"""
+
+async def test_answers_are_only_shown_to_the_questions_teacher(graphql, school):
+    teacher = await graphql(LESSON, as_user=school.teacher_id, lessonId=school.lesson_id)
+    assert teacher["lessonById"]["questions"][0] == {
+        "id": school.question_ids[0],
+        "title": "Powerhouse of the cell",
+        "correctAnswer": "Mitochondria",
+        "wrongAnswers": ["Nucleus"],
+    }
+
+    for viewer in (school.student_id, None):
+        student = await graphql(LESSON, as_user=viewer, lessonId=school.lesson_id)
+        assert [
+            (question["correctAnswer"], question["wrongAnswers"])
+            for question in student["lessonById"]["questions"]
+        ] == [(None, None), (None, None)]
+
+async def test_scores_cant_be_submitted_without_grading(client):
+    response = await client.post("/graphql", json={
+        "query": 'mutation { submitLessonScore(lessonId: "L1", userId: 1, score: 100) { score } }',
+    })
+    assert "submitLessonScore" in response.json()["errors"][0]["message"]
+
+SUBMIT_ANSWERS = """
+mutation ($lessonId: String!, $userId: Int!, $answers: [AnswerInput!]!) {
+  submitAnswers(lessonId: $lessonId, userId: $userId, answers: $answers) { correct total }
+}
+"""
+
+UPDATE_QUESTION = """
+mutation ($questionId: Int!, $correctAnswer: String!) {
+  updateQuestion(questionId: $questionId, title: "Powerhouse of the cell", correctAnswer: $correctAnswer,
+                 wrongAnswers: ["Nucleus"]) { id }
+}
+"""
+
+async def cached_views(client, graphql, school):
+    # Lesson questions, quiz snapshot and answer key, as they're served now
+    # (each read also fills its cache)
+    lesson = await graphql(LESSON, as_user=school.teacher_id, lessonId=school.lesson_id)
+    quiz = (await client.get(f"/lessons/{school.lesson_id}/quiz")).json()
+    answers = [{"questionId": question_id, "answer": "Mitochondria"} for question_id in school.question_ids]
+    graded = await graphql(SUBMIT_ANSWERS, lessonId=school.lesson_id, userId=school.student_id, answers=answers)
+    return (
+        [question["correctAnswer"] for question in lesson["lessonById"]["questions"]],
+        [question["title"] for question in quiz["questions"]],
+        graded["submitAnswers"],
+    )
+
+async def test_question_mutation_refreshes_cached_questions(client, graphql, school):
+    before = await cached_views(client, graphql, school)
+    assert before == (
+        ["Mitochondria", "Photosynthesis"],
+        ["Powerhouse of the cell", "Plants make food by"],
+        {"correct": 1, "total": 2},
+    )
+
+    await graphql(UPDATE_QUESTION, questionId=school.question_ids[0], correctAnswer="Ribosome")
+    assert await cached_views(client, graphql, school) == (
+        ["Ribosome", "Photosynthesis"],
+        ["Powerhouse of the cell", "Plants make food by"],
+        {"correct": 0, "total": 2},
+    )
+
+async def test_import_refreshes_cached_questions(client, graphql, school):
+    await cached_views(client, graphql, school)
+    response = await client.post(
+        f"/lessons/{school.lesson_id}/questions/import",
+        json=[{"title": "Cell walls are made of", "correct_answer": "Mitochondria", "wrong_answers": ["Salt"]}],
+    )
+    assert response.json()["inserted"] == 1
+
+    assert await cached_views(client, graphql, school) == (
+        ["Mitochondria", "Photosynthesis", "Mitochondria"],
+        ["Powerhouse of the cell", "Plants make food by", "Cell walls are made of"],
+        {"correct": 1, "total": 3},
+    )
@@ -0,0 +1,47 @@
+import json
+
+import pytest
+
+from app.cache import MISSING, response_cache
+from app.quiz import QUIZ
+
+pytestmark = pytest.mark.anyio
+
+UPDATE_QUESTION = """
+mutation ($questionId: Int!) {
+  updateQuestion(questionId: $questionId, title: "Energy of the cell", correctAnswer: "Mitochondria",
+                 wrongAnswers: ["Nucleus"]) { id }
+}
+"""
+
+async def test_quiz_snapshot_hides_the_answer_key(client, school):
+    response = await client.get(f"/lessons/{school.lesson_id}/quiz")
+    assert response.status_code == 200
+    quiz = response.json()
+    assert [question["id"] for question in quiz["questions"]] == school.question_ids
+    assert sorted(quiz["questions"][0]["answers"]) == ["Mitochondria", "Nucleus"]
+    assert "correctAnswer" not in json.dumps(quiz)
+
+    revalidated = await client.get(
+        f"/lessons/{school.lesson_id}/quiz", headers={"If-None-Match": response.headers["ETag"]}
+    )
+    assert revalidated.status_code == 304
+
+async def test_unknown_lessons_are_not_cached(client, school):
+    for lesson_id in range(50):
+        response = await client.get(f"/lessons/{lesson_id}/quiz")
+        assert response.status_code == 404
+    assert len(response_cache.backend) == 0
+
+    await client.get(f"/lessons/{school.lesson_id}/quiz")
+    assert response_cache.get(QUIZ, school.lesson_id) is not MISSING
+
+async def test_question_mutation_refreshes_the_snapshot(client, graphql, school):
+    before = await client.get(f"/lessons/{school.lesson_id}/quiz")
+    await graphql(UPDATE_QUESTION, questionId=school.question_ids[0])
+
+    after = await client.get(
+        f"/lessons/{school.lesson_id}/quiz", headers={"If-None-Match": before.headers["ETag"]}
+    )
+    assert after.status_code == 200
+    assert after.json()["questions"][0]["title"] == "Energy of the cell"
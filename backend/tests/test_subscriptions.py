@@ -0,0 +1,103 @@
+import asyncio
+from contextlib import asynccontextmanager
+
+import anyio
+import pytest
+
+from app.context import Context
+from app.db import open_routing_session
+from app.pubsub import class_channel, events, lesson_channel
+from app.schema import schema
+
+pytestmark = pytest.mark.anyio
+
+CLASS_ACTIVITY = """
+subscription ($classId: Int!) {
+  classActivity(classId: $classId) { kind userId score { score previousScore } }
+}
+"""
+
+LESSON_PROGRESS = """
+subscription ($lessonId: String!) {
+  lessonProgress(lessonId: $lessonId) { lessonId userId score previousScore }
+}
+"""
+
+CREATE_STUDENT = """
+mutation {
+  createOrUpdateUser(googleSub: "g-new", name: "New", email: "new@example.com", role: "student") { id }
+}
+"""
+
+JOIN_CLASS = """
+mutation ($userId: Int!, $code: String!) { joinClass(userId: $userId, classCode: $code) { id } }
+"""
+
+LEAVE_CLASS = """
+mutation ($classId: Int!, $studentId: Int!) { leaveClass(classId: $classId, studentId: $studentId) }
+"""
+
+SUBMIT_ANSWERS = """
+mutation ($lessonId: String!, $userId: Int!, $answers: [AnswerInput!]!) {
+  submitAnswers(lessonId: $lessonId, userId: $userId, answers: $answers) { score }
+}
+"""
+
+@asynccontextmanager
+async def subscription(query: str, channel: str, **variables):
+    # Yields a function returning the next event's data, once the
+    # subscription is listening on the channel. Like the server, one task
+    # iterates the subscription from start to end.
+    received: asyncio.Queue = asyncio.Queue()
+
+    async def consume():
+        async with open_routing_session() as db:
+            results = await schema.subscribe(query, variable_values=variables, context_value=Context(db))
+            async for result in results:
+                await received.put(result)
+
+    consumer = asyncio.ensure_future(consume())
+    with anyio.fail_after(5):
+        while events.broker.subscriber_count(channel) == 0:
+            await asyncio.sleep(0.01)
+
+    async def next_event() -> dict:
+        with anyio.fail_after(5):
+            result = await received.get()
+        assert not result.errors, result.errors
+        return next(iter(result.data.values()))
+
+    try:
+        yield next_event
+    finally:
+        consumer.cancel()
+        with anyio.CancelScope(shield=True):
+            await asyncio.gather(consumer, return_exceptions=True)
+
+async def test_class_activity_reports_each_enrollment_once(graphql, school):
+    student_id = (await graphql(CREATE_STUDENT))["createOrUpdateUser"]["id"]
+    async with subscription(CLASS_ACTIVITY, class_channel(school.class_id), classId=school.class_id) as next_event:
+        await graphql(JOIN_CLASS, userId=student_id, code=school.class_code)
+        await graphql(JOIN_CLASS, userId=student_id, code=school.class_code)
+        await graphql(LEAVE_CLASS, classId=school.class_id, studentId=student_id)
+
+        assert await next_event() == {"kind": "JOINED", "userId": student_id, "score": None}
+        # The second join changed nothing, so the next event is the leave
+        assert await next_event() == {"kind": "LEFT", "userId": student_id, "score": None}
+
+async def test_score_changes_reach_lesson_and_class_subscribers(graphql, school):
+    answers = [{"questionId": question_id, "answer": "Mitochondria"} for question_id in school.question_ids]
+    async with subscription(LESSON_PROGRESS, lesson_channel(school.lesson_id), lessonId=school.lesson_id) as lesson_event, \
+            subscription(CLASS_ACTIVITY, class_channel(school.class_id), classId=school.class_id) as class_event:
+        await graphql(SUBMIT_ANSWERS, lessonId=school.lesson_id, userId=school.student_id, answers=answers)
+        await graphql(SUBMIT_ANSWERS, lessonId=school.lesson_id, userId=school.student_id, answers=answers[:0])
+
+        assert await lesson_event() == {
+            "lessonId": school.lesson_id, "userId": school.student_id, "score": 50.0, "previousScore": None,
+        }
+        assert await lesson_event() == {
+            "lessonId": school.lesson_id, "userId": school.student_id, "score": 0.0, "previousScore": 50.0,
+        }
+        assert await class_event() == {
+            "kind": "SCORE", "userId": school.student_id, "score": {"score": 50.0, "previousScore": None},
+        }
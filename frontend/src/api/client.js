@@ -1,10 +1,57 @@
-import { ApolloClient, InMemoryCache, HttpLink } from '@apollo/client';
+import { ApolloClient, ApolloLink, HttpLink, InMemoryCache } from '@apollo/client';
+import { BatchHttpLink } from '@apollo/client/link/batch-http';
+import { PersistedQueryLink } from '@apollo/client/link/persisted-queries';
+import { getMainDefinition } from '@apollo/client/utilities';
 
 const GRAPHQL_URL = 'https://bloom-3f9y.onrender.com/graphql';
 
+// Send query hashes instead of full documents; the server asks for the
+// full text the first time it sees a hash.
+async function sha256(query) {
+  const digest = await crypto.subtle.digest('SHA-256', new TextEncoder().encode(query));
+  return Array.from(new Uint8Array(digest), (byte) => byte.toString(16).padStart(2, '0')).join('');
+}
+
+const persistedQueries = new PersistedQueryLink({ sha256 });
+
+// Tells the server who is signed in; answer keys are only returned to the
+// teacher who wrote the questions
+const viewer = new ApolloLink((operation, forward) => {
+  const user = JSON.parse(localStorage.getItem('user') || 'null');
+  if (user?.id != null) {
+    operation.setContext(({ headers }) => ({
+      headers: { ...headers, 'X-Bloom-User': String(user.id) },
+    }));
+  }
+  return forward(operation);
+});
+
+// Operations started within a few milliseconds of each other, such as a
+// page's queries, go out as one batched POST and share a database session on
+// the server. Cookies carry read-your-writes stickiness: after a mutation the
+// server reads from the primary database for this client.
+const batchLink = new BatchHttpLink({
+  uri: GRAPHQL_URL,
+  credentials: 'include',
+  batchMax: 10,
+  batchInterval: 10,
+});
+
+// Subscriptions stream over multipart HTTP, which batching doesn't support
+function isSubscription({ query }) {
+  const definition = getMainDefinition(query);
+  return definition.kind === 'OperationDefinition' && definition.operation === 'subscription';
+}
+
+const link = ApolloLink.split(
+  isSubscription,
+  new HttpLink({ uri: GRAPHQL_URL, credentials: 'include' }),
+  batchLink,
+);
+
 const client = new ApolloClient({
-  link: new HttpLink({ uri: GRAPHQL_URL }),
+  link: ApolloLink.from([viewer, persistedQueries, link]),
   cache: new InMemoryCache(),
 });
 
-export default client;
\ No newline at end of file
+export default client;
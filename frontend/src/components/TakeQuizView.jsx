@@ -2,10 +2,13 @@ import { useState, useEffect } from "react";
 import { gql } from "@apollo/client";
 import { useMutation } from "@apollo/client/react";
 
-const SUBMIT_SCORE = gql`
-  mutation SubmitLessonScore($lessonId: String!, $userId: Int!, $score: Float!) {
-    submitLessonScore(lessonId: $lessonId, userId: $userId, score: $score) {
+// Answers are graded on the server against the lesson's answer key
+const SUBMIT_ANSWERS = gql`
+  mutation SubmitAnswers($lessonId: String!, $userId: Int!, $answers: [AnswerInput!]!) {
+    submitAnswers(lessonId: $lessonId, userId: $userId, answers: $answers) {
       score
+      correct
+      total
     }
   }
 `;
@@ -16,7 +19,8 @@ export default function TakeQuizView({ questions, user, lessonId, onExit }) {
   const [shuffledAnswers, setShuffledAnswers] = useState([]);
   const [score, setScore] = useState(0);
   const [finished, setFinished] = useState(false);
-  const [submitScore] = useMutation(SUBMIT_SCORE);
+  const [answers, setAnswers] = useState([]);
+  const [submitAnswers] = useMutation(SUBMIT_ANSWERS);
 
   const currentQuestion = questions[currentQuestionIndex];
 
@@ -24,11 +28,15 @@ export default function TakeQuizView({ questions, user, lessonId, onExit }) {
     return <p>No questions yet!</p>
   }
 
-  // Shuffle answers once per question
+  // Shuffle answers once per question; quiz payloads arrive already shuffled
   useEffect(() => {
     if (!currentQuestion) return;
-    const allAnswers = [...currentQuestion.wrongAnswers, currentQuestion.correctAnswer];
-    setShuffledAnswers(allAnswers.sort(() => Math.random() - 0.5));
+    if (currentQuestion.answers) {
+      setShuffledAnswers(currentQuestion.answers);
+    } else {
+      const allAnswers = [...currentQuestion.wrongAnswers, currentQuestion.correctAnswer];
+      setShuffledAnswers(allAnswers.sort(() => Math.random() - 0.5));
+    }
     setSelectedAnswer("");
   }, [currentQuestionIndex, currentQuestion]);
 
@@ -38,21 +46,26 @@ export default function TakeQuizView({ questions, user, lessonId, onExit }) {
       setScore((prev) => prev + 1);
     }
 
+    const allAnswers = [...answers, { questionId: currentQuestion.id, answer: selectedAnswer }];
+    setAnswers(allAnswers);
+
     if (currentQuestionIndex + 1 < questions.length) {
       setCurrentQuestionIndex((prev) => prev + 1);
+    } else if (user?.role === "student") {
+      // Students don't get the answer key, so the score comes back from grading
+      submitAnswers({
+        variables: { lessonId, userId: user.id, answers: allAnswers },
+      })
+        .then(({ data }) => setScore(data.submitAnswers.correct))
+        .catch((err) => console.error("Failed to submit answers:", err))
+        .finally(() => setFinished(true));
     } else {
       // Quiz finished
       setFinished(true);
-      if (user.role === "student") {
-        const percentScore = ((score + (selectedAnswer === currentQuestion.correctAnswer ? 1 : 0)) / questions.length) * 100;
-        submitScore({
-          variables: { lessonId, userId: user.id, score: percentScore },
-        }).catch((err) => console.error("Failed to submit score:", err));
-      }
     }
   };
 
-  if (finished && score) {
+  if (finished) {
     const percentScore = (score / questions.length) * 100;
     return (
       <div className="p-6 max-w-md w-full bg-white rounded-xl shadow flex flex-col items-center">
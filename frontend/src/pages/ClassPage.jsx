@@ -1,7 +1,7 @@
 import { useEffect, useState } from "react";
 import { useParams, useNavigate } from "react-router-dom";
 import { gql } from "@apollo/client";
-import { useQuery, useMutation } from "@apollo/client/react";
+import { useQuery, useMutation, useSubscription } from "@apollo/client/react";
 import Navbar from "../components/Navbar";
 import ClassHeader from "../components/ClassHeader";
 import LessonsList from "../components/LessonsList";
@@ -37,6 +37,25 @@ const GET_CLASS_BY_CODE = gql`
   }
 `;
 
+// Live score and enrollment changes, so the teacher view doesn't refetch the class
+const CLASS_ACTIVITY = gql`
+  subscription ClassActivity($classId: Int!) {
+    classActivity(classId: $classId) {
+      kind
+      userId
+      student {
+        name
+        id
+        email
+      }
+      score {
+        lessonId
+        score
+      }
+    }
+  }
+`;
+
 const CREATE_LESSON = gql`
   mutation CreateLesson($classId: Int!, $title: String!) {
     createLesson(classId: $classId, title: $title) {
@@ -91,6 +110,35 @@ export default function ClassPage() {
   const [deleteClassMutation] = useMutation(DELETE_CLASS);
   const [leaveClassMutation] = useMutation(LEAVE_CLASS);
 
+  const watchedClassId =
+    user && data?.classByCode?.teacher.id === user.id ? data.classByCode.id : null;
+
+  useSubscription(CLASS_ACTIVITY, {
+    variables: { classId: watchedClassId },
+    skip: watchedClassId === null,
+    onData: ({ data: { data: event } }) => {
+      const activity = event?.classActivity;
+      if (!activity) return;
+
+      if (activity.kind === "SCORE") {
+        const { lessonId, score } = activity.score;
+        setLessons((prev) =>
+          prev.map((lesson) => {
+            if (lesson.id !== lessonId) return lesson;
+            const scores = (lesson.scores || []).filter((s) => s.userId !== activity.userId);
+            return { ...lesson, scores: [...scores, { userId: activity.userId, score }] };
+          })
+        );
+      } else if (activity.kind === "JOINED" && activity.student) {
+        setStudents((prev) =>
+          prev.some((s) => s.id === activity.userId) ? prev : [...prev, activity.student]
+        );
+      } else if (activity.kind === "LEFT") {
+        setStudents((prev) => prev.filter((s) => s.id !== activity.userId));
+      }
+    },
+  });
+
 
   useEffect(() => {
     const storedUser = localStorage.getItem("user");
@@ -191,7 +239,7 @@ export default function ClassPage() {
               lessons={lessons}
               isTeacher={isTeacher}
               onDeleteLesson={handleDeleteLesson}
-              numStudents={classData.students.length}
+              numStudents={students.length}
               user_id={user?.id}
           />
         )}
@@ -22,15 +22,25 @@ const GET_LESSON_BY_ID = gql`
   }
 `;
 
-const DELETE_QUESTION = gql`
-  mutation DeleteQuestion($questionId: Int!) {
-    deleteQuestion(questionId: $questionId)
+// Students only need the questions and shuffled choices, not the answer key
+const GET_QUIZ_PAYLOAD = gql`
+  query GetQuizPayload($lessonId: String!) {
+    quizPayload(lessonId: $lessonId) {
+      etag
+      payload
+    }
+  }
+`;
+
+const REMOVE_QUESTION = gql`
+  mutation RemoveQuestionFromLesson($lessonId: String!, $questionId: Int!) {
+    removeQuestionFromLesson(lessonId: $lessonId, questionId: $questionId)
   }
 `;
 
 export default function LessonPage() {
   const { code, lessonId } = useParams();
-  const [deleteQuestion] = useMutation(DELETE_QUESTION);
+  const [removeQuestion] = useMutation(REMOVE_QUESTION);
   const navigate = useNavigate();
   const [user, setUser] = useState(null);
   const [showCreateForm, setShowCreateForm] = useState(false);
@@ -38,14 +48,20 @@ export default function LessonPage() {
   const [editingQuestion, setEditingQuestion] = useState(null);
   const [showEditForm, setShowEditForm] = useState(false);
 
+  const isTeacher = user?.role === "teacher";
   const { data, loading, error, refetch } = useQuery(GET_LESSON_BY_ID, {
     variables: { lessonId: lessonId},
     fetchPolicy: "network-only",
+    skip: !user || !isTeacher,
+  });
+  const { data: quizData, loading: quizLoading, error: quizError } = useQuery(GET_QUIZ_PAYLOAD, {
+    variables: { lessonId },
+    skip: !user || isTeacher,
   });
 
   const handleDeleteQuestion = async (questionId) => {
     try {
-      await deleteQuestion({ variables: { questionId } });
+      await removeQuestion({ variables: { lessonId, questionId } });
       await refetch(); // refresh questions after delete
     } catch (err) {
       console.error("Error deleting question:", err);
@@ -58,14 +74,13 @@ export default function LessonPage() {
     else setUser(JSON.parse(storedUser));
   }, [navigate]);
 
-  if (loading || !user) return <div>Loading...</div>;
-  if (error){
-    console.log(error)
+  if (loading || quizLoading || !user) return <div>Loading...</div>;
+  if (error || quizError){
+    console.log(error || quizError)
     return <div>Error loading lesson.</div>;
   }
 
-  const lesson = data.lessonById;
-  const isTeacher = user.role === "teacher";
+  const lesson = isTeacher ? data.lessonById : JSON.parse(quizData.quizPayload.payload);
 
   return (
     <div className="min-h-screen bg-beige flex flex-col items-center">
@@ -130,7 +145,7 @@ export default function LessonPage() {
           </>
         )}
 
-        {!isTeacher && <TakeQuizView questions={lesson.questions} user={user} lessonId={lesson.id} onExit={() => navigate(`/class/${code}`)} />}
+        {!isTeacher && <TakeQuizView questions={lesson.questions} user={user} lessonId={lesson.lessonId} onExit={() => navigate(`/class/${code}`)} />}
       </div>
 
       {showCreateForm && (